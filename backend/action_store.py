@@ -0,0 +1,361 @@
+"""
+Columnar storage for the per-frame action data of an analysis.
+
+An actions file holds one row per pose frame in a small fixed header
+followed by two columns: float32 timestamps, then one byte of bit-packed
+action flags per frame. Rows are streamed to disk while the video is
+analyzed, and the columns are read back with np.memmap so only the pages
+touched are loaded. The JSON list of dicts that older clients expect is
+rendered from it on demand. Timelines use the much smaller run-length
+encoded segment list built alongside it.
+
+The raw landmarks of the same rows are kept in a float16 (N, 33, 4) .npy
+file, so detectors can be re-run without decoding the video again.
+"""
+
+import json
+import struct
+import numpy as np
+
+# File names inside an analysis folder
+ACTIONS_FILE = "actions.bin"
+LEGACY_ACTIONS_FILE = "actions.json"
+LANDMARKS_FILE = "landmarks.npy"
+
+MAGIC = b"CQACTS"
+VERSION = 1
+
+# magic, version, number of rows, number of flag bits per row
+HEADER = struct.Struct("<6sHII")
+
+# Flag names in bit order
+ACTION_FLAGS = ("has_pose", "is_jumping", "is_shooting", "is_dribbling")
+
+_TIMESTAMP = struct.Struct("<f")
+
+# Landmarks per pose and values per landmark (x, y, z, visibility)
+LANDMARK_SHAPE = (33, 4)
+LANDMARK_DTYPE = np.dtype("<f2")
+
+# Fixed .npy header size, so the header can be rewritten in place once the row count is known
+NPY_HEADER_SIZE = 128
+
+# Bytes copied at a time when the files of a chunked analysis are joined
+COPY_BLOCK_SIZE = 1 << 20
+
+
+def pack_flags(frame_actions):
+    """Bit-pack the action flags of a frame_actions dict into one byte"""
+    value = 0
+    for bit, name in enumerate(ACTION_FLAGS):
+        if frame_actions[name]:
+            value |= 1 << bit
+    return value
+
+
+class ActionWriter:
+    """
+    Streams frame actions to an actions file
+
+    Timestamps are written as rows arrive; the one-byte flags are kept until
+    close(), which appends them as the second column and fills in the row
+    count in the header.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._flags = bytearray()
+        self._file = open(path, "wb")
+        self._file.write(HEADER.pack(MAGIC, VERSION, 0, len(ACTION_FLAGS)))
+
+    def __len__(self):
+        return len(self._flags)
+
+    def append(self, frame_actions):
+        """Add a frame_actions dict as the next row"""
+        self._file.write(_TIMESTAMP.pack(frame_actions["timestamp"]))
+        self._flags.append(pack_flags(frame_actions))
+
+    def close(self):
+        """Write the flags column and the final header"""
+        if self._file.closed:
+            return
+        try:
+            self._file.write(self._flags)
+            self._file.seek(0)
+            self._file.write(HEADER.pack(MAGIC, VERSION, len(self._flags), len(ACTION_FLAGS)))
+        finally:
+            self._file.close()
+
+
+class ActionColumns:
+    """Read-only, memory-mapped columns of an actions file"""
+
+    def __init__(self, timestamps, flags):
+        self.timestamps = timestamps
+        self.flags = flags
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def mask(self, name):
+        """Boolean array of one action flag for every row"""
+        return (self.flags & (1 << ACTION_FLAGS.index(name))) != 0
+
+
+def _read_header(path):
+    with open(path, "rb") as f:
+        header = f.read(HEADER.size)
+    if len(header) < HEADER.size:
+        raise ValueError(f"Truncated actions file: {path}")
+
+    magic, version, count, num_flags = HEADER.unpack(header)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"Not a version {VERSION} actions file: {path}")
+    if num_flags != len(ACTION_FLAGS):
+        raise ValueError(f"Unexpected number of action flags in {path}: {num_flags}")
+    return count
+
+
+def load_actions(path):
+    """Memory-map the columns of an actions file"""
+    count = _read_header(path)
+    if count == 0:
+        # np.memmap cannot map an empty region
+        return ActionColumns(np.empty(0, dtype="<f4"), np.empty(0, dtype=np.uint8))
+
+    timestamps = np.memmap(path, dtype="<f4", mode="r", offset=HEADER.size, shape=(count,))
+    flags = np.memmap(path, dtype=np.uint8, mode="r", offset=HEADER.size + 4 * count, shape=(count,))
+    return ActionColumns(timestamps, flags)
+
+
+def _copy_range(out, path, offset, size):
+    """Copy size bytes of a file, starting at offset, to out a block at a time"""
+    with open(path, "rb") as f:
+        f.seek(offset)
+        while size > 0:
+            block = f.read(min(size, COPY_BLOCK_SIZE))
+            if not block:
+                raise ValueError(f"{path} is truncated")
+            out.write(block)
+            size -= len(block)
+
+
+def concat_actions(output_path, part_paths):
+    """Write the rows of several actions files, in order, to one file"""
+    parts = [(path, load_actions(path)) for path in part_paths]
+    count = sum(len(part) for _, part in parts)
+
+    with open(output_path, "wb") as out:
+        out.write(HEADER.pack(MAGIC, VERSION, count, len(ACTION_FLAGS)))
+        for path, part in parts:
+            _copy_range(out, path, part.timestamps.offset, part.timestamps.nbytes)
+        for path, part in parts:
+            _copy_range(out, path, part.flags.offset, part.flags.nbytes)
+
+
+def pack_flag_masks(masks):
+    """Bit-pack a dict of boolean arrays, keyed by flag name, into one byte per row"""
+    flags = None
+    for bit, name in enumerate(ACTION_FLAGS):
+        packed = np.asarray(masks[name], dtype=np.uint8) << bit
+        flags = packed if flags is None else flags | packed
+    return flags
+
+
+def save_actions(path, timestamps, flags):
+    """Write complete timestamp and packed flag columns to an actions file"""
+    timestamps = np.asarray(timestamps, dtype="<f4")
+    flags = np.asarray(flags, dtype=np.uint8)
+
+    with open(path, "wb") as out:
+        out.write(HEADER.pack(MAGIC, VERSION, len(timestamps), len(ACTION_FLAGS)))
+        out.write(timestamps.tobytes())
+        out.write(flags.tobytes())
+
+
+def iter_actions_json(path, batch_size=4096):
+    """
+    Render an actions file as the legacy JSON list of frame_actions dicts
+
+    Yields the document in pieces so large files can be streamed to a client.
+    """
+    columns = load_actions(path)
+
+    yield "["
+    for start in range(0, len(columns), batch_size):
+        stop = min(start + batch_size, len(columns))
+        # float32 -> float64 adds noise digits; round to the precision actually stored
+        timestamps = columns.timestamps[start:stop].astype(np.float64).round(6).tolist()
+        bits = columns.flags[start:stop]
+        flags = [((bits >> bit) & 1).astype(bool).tolist() for bit in range(len(ACTION_FLAGS))]
+
+        rows = []
+        for i, timestamp in enumerate(timestamps):
+            frame_actions = {"timestamp": timestamp}
+            for name, values in zip(ACTION_FLAGS, flags):
+                frame_actions[name] = values[i]
+            rows.append(json.dumps(frame_actions))
+
+        yield (", " if start else "") + ", ".join(rows)
+    yield "]"
+
+
+# Actions that get segments, with the frame_actions flag each one follows
+SEGMENT_ACTIONS = (("jumping", "is_jumping"), ("shooting", "is_shooting"), ("dribbling", "is_dribbling"))
+
+
+class ActionSegmentBuilder:
+    """
+    Run-length encodes frame actions into [start_ts, end_ts, action] segments
+
+    A segment covers consecutive analyzed frames with the action detected and
+    ends one frame_duration after its last frame. A new detection less than
+    max_gap seconds after a segment ends extends it instead of starting a new
+    one, which keeps single-frame flicker from splitting the timeline.
+    """
+
+    def __init__(self, frame_duration, max_gap=0.0):
+        self.frame_duration = frame_duration
+        self.max_gap = max_gap
+        self.segments = []
+        self._open = {}
+
+    def push(self, frame_actions):
+        """Add the next analyzed frame"""
+        timestamp = frame_actions["timestamp"]
+        for action, flag in SEGMENT_ACTIONS:
+            if not frame_actions[flag]:
+                continue
+
+            segment = self._open.get(action)
+            if segment is not None and _continues(segment, timestamp, self.max_gap, self.frame_duration):
+                segment[1] = timestamp + self.frame_duration
+            else:
+                if segment is not None:
+                    self.segments.append(segment)
+                self._open[action] = [timestamp, timestamp + self.frame_duration, action]
+
+    def close(self):
+        """Finish open segments; returns all segments ordered by start time"""
+        self.segments.extend(self._open.values())
+        self._open = {}
+        self.segments.sort(key=lambda segment: (segment[0], segment[2]))
+        return [[round(start, 3), round(end, 3), action] for start, end, action in self.segments]
+
+
+def _continues(segment, timestamp, max_gap, frame_duration):
+    # Half a frame of slack absorbs rounding in timestamps computed from frame numbers
+    return timestamp - segment[1] < max_gap + frame_duration / 2
+
+
+def segments_from_columns(timestamps, masks, frame_duration, max_gap=0.0):
+    """
+    Build the segments ActionSegmentBuilder would produce from whole columns
+
+    masks maps frame_actions flag names to boolean arrays aligned with
+    timestamps.
+    """
+    timestamps = np.asarray(timestamps, dtype=np.float64)
+    segments = []
+    for action, flag in SEGMENT_ACTIONS:
+        detected = timestamps[np.asarray(masks[flag], dtype=bool)]
+        if not len(detected):
+            continue
+
+        # A new segment starts wherever a detection does not continue the previous one
+        gaps = detected[1:] - (detected[:-1] + frame_duration)
+        starts = np.concatenate(([0], np.flatnonzero(gaps >= max_gap + frame_duration / 2) + 1))
+        ends = np.concatenate((starts[1:], [len(detected)])) - 1
+        segments.extend(
+            [start, end + frame_duration, action]
+            for start, end in zip(detected[starts].tolist(), detected[ends].tolist())
+        )
+
+    segments.sort(key=lambda segment: (segment[0], segment[2]))
+    return [[round(start, 3), round(end, 3), action] for start, end, action in segments]
+
+
+def merge_segments(segment_lists, frame_duration, max_gap=0.0):
+    """Join the segments of consecutive frame ranges where they touch"""
+    merged = []
+    for action, _ in SEGMENT_ACTIONS:
+        current = None
+        segments = sorted(
+            (segment for segments in segment_lists for segment in segments if segment[2] == action),
+            key=lambda segment: segment[0]
+        )
+        for start, end, _ in segments:
+            if current is not None and _continues(current, start, max_gap, frame_duration):
+                current[1] = max(current[1], end)
+            else:
+                if current is not None:
+                    merged.append(current)
+                current = [start, end, action]
+        if current is not None:
+            merged.append(current)
+
+    merged.sort(key=lambda segment: (segment[0], segment[2]))
+    return merged
+
+
+def _npy_header(count):
+    shape = (count,) + LANDMARK_SHAPE
+    header = "{'descr': '%s', 'fortran_order': False, 'shape': %r, }" % (LANDMARK_DTYPE.str, shape)
+    # Format 1.0: magic, version, header length, then the header padded with spaces and ending in a newline
+    header = header.ljust(NPY_HEADER_SIZE - 10 - 1) + "\n"
+    return b"\x93NUMPY\x01\x00" + struct.pack("<H", len(header)) + header.encode("latin1")
+
+
+class LandmarkWriter:
+    """
+    Streams per-frame landmarks to a float16 (N, 33, 4) .npy file
+
+    Rows are written as they arrive, so the full array is never held in
+    memory; close() fills in the row count. The file loads with
+    np.load(path, mmap_mode='r').
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._count = 0
+        self._file = open(path, "wb")
+        self._file.write(_npy_header(0))
+
+    def __len__(self):
+        return self._count
+
+    def append(self, landmarks):
+        """Add a (33, 4) landmark array as the next row"""
+        self._file.write(np.asarray(landmarks, dtype=LANDMARK_DTYPE).reshape(LANDMARK_SHAPE).tobytes())
+        self._count += 1
+
+    def close(self):
+        """Write the final header"""
+        if self._file.closed:
+            return
+        try:
+            self._file.seek(0)
+            self._file.write(_npy_header(self._count))
+        finally:
+            self._file.close()
+
+
+def load_landmarks(path):
+    """Memory-map a landmarks file as an (N, 33, 4) float16 array"""
+    return np.load(path, mmap_mode="r")
+
+
+def concat_landmarks(output_path, part_paths):
+    """
+    Write the rows of several landmarks files, in order, to one file
+
+    Each part's data section is copied from behind its header a block at a
+    time, so neither the parts nor the result are ever held in memory.
+    """
+    parts = [(path, load_landmarks(path)) for path in part_paths]
+
+    with open(output_path, "wb") as out:
+        out.write(_npy_header(sum(len(part) for _, part in parts)))
+        for path, part in parts:
+            _copy_range(out, path, part.offset, part.nbytes)
@@ -1,15 +1,23 @@
-from flask import Flask, request, jsonify, send_from_directory, url_for
+from flask import Flask, request, jsonify, send_from_directory, url_for, Response, stream_with_context
 from flask_cors import CORS
 import cv2
 import os
 import tempfile
 import uuid
+import hashlib
 import time
-from datetime import datetime
-from werkzeug.utils import secure_filename
+from datetime import datetime, timedelta
+from werkzeug.utils import secure_filename, safe_join
 from config import Config
-from tasks import analyze_video_task, make_celery
+from celery import chord, group
+from tasks import (analyze_video_task, reclassify_task, aggregate_batch_task, batch_failed_task, collect_batch_task,
+                   batch_item_counts, make_celery, resolve_analysis_options, video_duration)
+from scheduler import PRIORITIES, analysis_queue
 from database import Database
+from action_store import iter_actions_json
+from upload_store import UploadError, append_chunk, create_upload, expire_uploads, finalize_upload, get_upload
+from live_session import LiveSessionError, close_session, create_session, get_session, iter_frames
+from response_cache import TTLCache, etag_for, immutable, json_response, not_modified
 import json
 
 # Initialize Flask app
@@ -44,9 +52,140 @@ celery = make_celery(app)
 from database import Database
 Database.init_db()
 
+# Serialized results and stats with their ETags, so reloads skip the database
+result_cache = TTLCache(Config.RESULT_CACHE_SIZE, Config.RESULT_CACHE_TTL)
+stats_cache = TTLCache(Config.RESULT_CACHE_SIZE, Config.STATS_CACHE_TTL)
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in app.config['ALLOWED_EXTENSIONS']
 
+def save_upload(stream, path):
+    """Stream an upload to disk in fixed-size chunks and return its SHA-256 hex digest"""
+    digest = hashlib.sha256()
+    with open(path, 'wb') as f:
+        while True:
+            chunk = stream.read(app.config['UPLOAD_CHUNK_SIZE'])
+            if not chunk:
+                break
+            digest.update(chunk)
+            f.write(chunk)
+    return digest.hexdigest()
+
+def parse_analysis_options(params):
+    """Read the optional analysis settings of a request; returns (options, error message)"""
+    options = {}
+    if params.get('target_fps'):
+        try:
+            target_fps = float(params.get('target_fps'))
+        except (TypeError, ValueError):
+            target_fps = None
+        if not target_fps or target_fps <= 0:
+            return None, "target_fps must be a positive number"
+        options['target_fps'] = target_fps
+    if params.get('preset'):
+        preset = params.get('preset')
+        if preset not in app.config['ANALYSIS_PRESETS']:
+            return None, f"Unknown preset. Available presets: {', '.join(app.config['ANALYSIS_PRESETS'])}"
+        options['preset'] = preset
+    return options, None
+
+def parse_schedule(params, default_priority=None):
+    """Read who an analysis is for and how urgent it is; returns (schedule, error message)"""
+    priority = params.get('priority') or default_priority or app.config['DEFAULT_ANALYSIS_PRIORITY']
+    if priority not in PRIORITIES:
+        return None, f"Unknown priority. Available priorities: {', '.join(PRIORITIES)}"
+    
+    return {
+        "user_id": params.get('user_id') or request.headers.get('X-User-Id'),
+        "priority": priority
+    }, None
+
+def prepare_analysis(video_path, filename, video_hash, options, schedule):
+    """
+    Claim the analysis of a saved upload in the video cache
+
+    Returns (item, signature). A video whose content the same user already
+    analyzed, or is analyzing, with the same options is not analyzed again:
+    the upload is dropped, signature is None and item points at the existing
+    task and result. Otherwise signature is the analysis task to queue,
+    routed to the short or long queue by the video's duration.
+    """
+    task_id = str(uuid.uuid4())
+    try:
+        entry, claimed = Database.claim_video_analysis(video_hash, json.dumps(options, sort_keys=True), task_id,
+                                                      schedule["user_id"])
+    except Exception as e:
+        app.logger.warning(f"Video cache unavailable, analyzing without it: {str(e)}")
+        entry, claimed = None, False
+    
+    if entry is not None and not claimed:
+        os.remove(video_path)
+        if entry['status'] == 'done':
+            return {
+                "task_id": entry['task_id'],
+                "status": "completed",
+                "cached": True,
+                "result_id": str(entry['result_id']),
+                "result": entry.get('summary')
+            }, None
+        
+        return {
+            "task_id": entry['task_id'],
+            "status": "processing",
+            "cached": True
+        }, None
+    
+    if entry is not None:
+        options = dict(options, cache_entry_id=str(entry['_id']))
+    
+    try:
+        # Scheduling fields stay out of the cache key above
+        queue = analysis_queue(video_duration(video_path))
+        options = dict(options, queue=queue, enqueued_at=time.time(), **schedule)
+        
+        signature = analyze_video_task.signature((video_path, filename, options), task_id=task_id,
+                                                 queue=queue, priority=PRIORITIES[schedule["priority"]])
+    except Exception:
+        abandon_analysis(video_path, options.get('cache_entry_id'))
+        raise
+    return {"task_id": task_id, "status": "processing"}, signature
+
+def abandon_analysis(video_path, cache_entry_id=None):
+    """
+    Undo prepare_analysis for an analysis that was never queued
+
+    Releases its video cache claim, which would otherwise answer later
+    uploads of the video with a task that does not exist until the claim
+    times out, and deletes the upload.
+    """
+    if cache_entry_id:
+        try:
+            Database.release_video_analysis(cache_entry_id)
+        except Exception as e:
+            app.logger.warning(f"Could not release video cache entry {cache_entry_id}: {str(e)}")
+    if os.path.exists(video_path):
+        os.remove(video_path)
+
+def start_analysis(video_path, filename, video_hash, options, schedule):
+    """Queue the analysis of a saved upload and build the /analyze response"""
+    item, signature = prepare_analysis(video_path, filename, video_hash, options, schedule)
+    if signature is None:
+        message = "Video was already analyzed" if item["status"] == "completed" else "Video is already being processed"
+        return jsonify({"message": message, **item})
+    
+    # Start Celery task for video analysis
+    try:
+        task = signature.apply_async()
+    except Exception:
+        abandon_analysis(video_path, signature.args[2].get('cache_entry_id'))
+        raise
+    
+    return jsonify({
+        "message": "Video uploaded and being processed",
+        "task_id": task.id,
+        "status": "processing"
+    })
+
 @app.route("/")
 def home():
     """Serve a styled homepage for the API"""
@@ -356,6 +495,14 @@ def analyze_video():
         if video_file.content_length > app.config['MAX_CONTENT_LENGTH']:
             return jsonify({"error": f"File too large. Maximum size is {app.config['MAX_CONTENT_LENGTH'] // (1024 * 1024)}MB"}), 400
 
+        # Optional analysis settings
+        options, error = parse_analysis_options(request.form)
+        if error:
+            return jsonify({"error": error}), 400
+        schedule, error = parse_schedule(request.form)
+        if error:
+            return jsonify({"error": error}), 400
+
         # Secure and save the file temporarily
         filename = secure_filename(video_file.filename)
         unique_filename = f"{str(uuid.uuid4())}_{filename}"
@@ -364,61 +511,551 @@ def analyze_video():
         # Ensure directory exists
         os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
         
-        # Save the file
-        video_file.save(video_path)
+        # Save the file, hashing it on the way to detect repeated uploads
+        video_hash = save_upload(video_file.stream, video_path)
+        
+        return start_analysis(video_path, filename, video_hash, options, schedule)
+    
+    except Exception as e:
+        app.logger.error(f"Error uploading video: {str(e)}")
+        return jsonify({"error": f"Server error: {str(e)}"}), 500
+
+@app.route("/analyze/batch", methods=["POST"])
+def analyze_batch():
+    """
+    Analyze many videos as one batch
+    
+    Videos are uploaded as several "videos" files, referenced as completed
+    chunked uploads with "upload_ids", or both. Every video is analyzed with
+    the same options; combined counts are stored on the batch once the last
+    one finishes.
+    """
+    try:
+        params = request.get_json(silent=True) or request.form
+        video_files = [f for f in request.files.getlist('videos') + request.files.getlist('video') if f.filename]
+        upload_ids = params.getlist('upload_ids') if hasattr(params, 'getlist') else params.get('upload_ids') or []
+        if isinstance(upload_ids, str):
+            upload_ids = [upload_ids]
+        
+        if not video_files and not upload_ids:
+            return jsonify({"error": "No videos provided"}), 400
+        if len(video_files) + len(upload_ids) > app.config['MAX_BATCH_SIZE']:
+            return jsonify({"error": f"Too many videos. Maximum batch size is {app.config['MAX_BATCH_SIZE']}"}), 400
+        
+        for video_file in video_files:
+            if not allowed_file(video_file.filename):
+                return jsonify({"error": f"Invalid file type: {video_file.filename}. Allowed formats: mp4, mov, avi"}), 400
+        
+        # Check every referenced upload before any of them is consumed
+        for upload_id in upload_ids:
+            try:
+                upload = get_upload(upload_id)
+            except UploadError as e:
+                return jsonify({"error": f"{str(e)}: {upload_id}"}), e.status
+            if upload["offset"] != upload["size"]:
+                return jsonify({"error": f"Upload is incomplete: {upload_id}", "offset": upload["offset"]}), 409
         
-        # Start Celery task for video analysis
-        task = analyze_video_task.delay(video_path, filename)
+        options, error = parse_analysis_options(params)
+        if error:
+            return jsonify({"error": error}), 400
+        # One user's batch should not hold up other users' single clips
+        schedule, error = parse_schedule(params, app.config['DEFAULT_BATCH_PRIORITY'])
+        if error:
+            return jsonify({"error": error}), 400
+        
+        os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+        videos = []
+        for video_file in video_files:
+            filename = secure_filename(video_file.filename)
+            video_path = os.path.join(app.config['UPLOAD_FOLDER'], f"{str(uuid.uuid4())}_{filename}")
+            videos.append((video_path, filename, save_upload(video_file.stream, video_path)))
+        for upload_id in upload_ids:
+            try:
+                video_path, filename, video_hash, _ = finalize_upload(upload_id)
+            except UploadError as e:
+                # Finalized by a concurrent request since it was checked
+                for video_path, _, _ in videos:
+                    os.remove(video_path)
+                return jsonify({"error": f"{str(e)}: {upload_id}"}), e.status
+            videos.append((video_path, filename, video_hash))
+        
+        batch_id = None
+        signatures = []
+        try:
+            batch_id = str(Database.create_analysis_batch(options, schedule["user_id"]))
+            
+            items = []
+            for video_path, filename, video_hash in videos:
+                item, signature = prepare_analysis(video_path, filename, video_hash, options, schedule)
+                result = item.pop("result", None)
+                item.update(filename=filename, cached=item.get("cached", False))
+                if item["status"] == "completed":
+                    item.update(status="done", counts=batch_item_counts(result))
+                items.append(item)
+                if signature is not None:
+                    signatures.append(signature)
+            
+            Database.update_analysis_batch(batch_id, {'items': items})
+            
+            if signatures:
+                # The callback gets the summaries in header order; it matches them to items by task id
+                callback = aggregate_batch_task.s(batch_id, [signature.id for signature in signatures])
+                callback.on_error(batch_failed_task.s(batch_id))
+                chord(group(signatures), callback).apply_async()
+            else:
+                # Every video was analyzed or queued before
+                collect_batch_task.delay(batch_id)
+        except Exception:
+            # None of the batch was queued: release the videos claimed so far and drop every upload
+            for signature in signatures:
+                abandon_analysis(signature.args[0], signature.args[2].get('cache_entry_id'))
+            for video_path, _, _ in videos:
+                abandon_analysis(video_path)
+            if batch_id:
+                try:
+                    Database.update_analysis_batch(batch_id, {'status': 'failed'})
+                except Exception as e:
+                    app.logger.warning(f"Could not mark batch {batch_id} as failed: {str(e)}")
+            raise
         
         return jsonify({
-            "message": "Video uploaded and being processed",
-            "task_id": task.id,
-            "status": "processing"
+            "message": "Videos uploaded and being processed",
+            "batch_id": batch_id,
+            "status": "processing",
+            "items": [{key: item[key] for key in ("filename", "task_id", "status", "cached")} for item in items]
         })
     
     except Exception as e:
-        app.logger.error(f"Error uploading video: {str(e)}")
+        app.logger.error(f"Error uploading batch: {str(e)}")
         return jsonify({"error": f"Server error: {str(e)}"}), 500
 
-@app.route("/status/<task_id>", methods=["GET"])
-def get_task_status(task_id):
-    """Check the status of an analysis task"""
+@app.route("/analyze/batch/<batch_id>", methods=["GET"])
+def get_batch(batch_id):
+    """Get the status of a batch, its videos and, once finished, their combined counts"""
+    batch = Database.get_analysis_batch(batch_id)
+    if not batch:
+        return jsonify({"error": "Batch not found"}), 404
+    
+    batch['_id'] = str(batch['_id'])
+    for item in batch['items']:
+        if item['status'] == 'processing':
+            status = task_status(item['task_id'])
+            item['task_status'] = status['status']
+            if 'progress' in status:
+                item['progress'] = status['progress']
+    return jsonify(batch)
+
+@app.route("/uploads", methods=["POST"])
+def create_chunked_upload():
+    """Start a chunked, resumable upload of a large video"""
+    try:
+        params = request.get_json(silent=True) or request.form
+        filename = secure_filename(params.get('filename') or '')
+        if not filename:
+            return jsonify({"error": "No filename provided"}), 400
+        
+        if not allowed_file(filename):
+            return jsonify({"error": "Invalid file type. Allowed formats: mp4, mov, avi"}), 400
+        
+        try:
+            size = int(params.get('size'))
+        except (TypeError, ValueError):
+            return jsonify({"error": "size must be the file size in bytes"}), 400
+        if size <= 0:
+            return jsonify({"error": "size must be the file size in bytes"}), 400
+        if size > app.config['MAX_UPLOAD_SIZE']:
+            return jsonify({"error": f"File too large. Maximum size is {app.config['MAX_UPLOAD_SIZE'] // (1024 * 1024)}MB"}), 400
+        
+        options, error = parse_analysis_options(params)
+        if error:
+            return jsonify({"error": error}), 400
+        
+        # Abandoned uploads are cleaned up as new ones start
+        expire_uploads()
+        upload = create_upload(filename, size, options)
+        
+        return jsonify({
+            "upload_id": upload["upload_id"],
+            "offset": upload["offset"],
+            "size": upload["size"],
+            "max_chunk_size": app.config['MAX_CONTENT_LENGTH']
+        })
+    
+    except Exception as e:
+        app.logger.error(f"Error starting upload: {str(e)}")
+        return jsonify({"error": f"Server error: {str(e)}"}), 500
+
+@app.route("/uploads/<upload_id>", methods=["GET"])
+def get_chunked_upload(upload_id):
+    """Get the number of bytes received so far, to resume an upload"""
+    try:
+        upload = get_upload(upload_id)
+    except UploadError as e:
+        return jsonify({"error": str(e)}), e.status
+    
+    return jsonify({
+        "upload_id": upload_id,
+        "offset": upload["offset"],
+        "size": upload["size"],
+        "complete": upload["offset"] == upload["size"]
+    })
+
+@app.route("/uploads/<upload_id>", methods=["PUT", "PATCH"])
+def append_chunked_upload(upload_id):
+    """
+    Append the raw request body to an upload at the offset query parameter
+
+    The body is streamed to disk, never buffered in memory. A 409 response
+    carries the offset to resume from.
+    """
+    offset = request.args.get('offset', type=int)
+    if offset is None:
+        return jsonify({"error": "offset must be the number of bytes already uploaded"}), 400
+    
+    try:
+        offset = append_chunk(upload_id, offset, request.stream, request.content_length)
+        upload = get_upload(upload_id)
+    except UploadError as e:
+        response = {"error": str(e)}
+        if e.offset is not None:
+            response["offset"] = e.offset
+        return jsonify(response), e.status
+    
+    return jsonify({
+        "upload_id": upload_id,
+        "offset": offset,
+        "size": upload["size"],
+        "complete": offset == upload["size"]
+    })
+
+@app.route("/uploads/<upload_id>/finalize", methods=["POST"])
+def finalize_chunked_upload(upload_id):
+    """Finish an upload and queue its analysis"""
+    schedule, error = parse_schedule(request.get_json(silent=True) or request.form)
+    if error:
+        return jsonify({"error": error}), 400
+    
+    try:
+        video_path, filename, video_hash, options = finalize_upload(upload_id)
+    except UploadError as e:
+        response = {"error": str(e)}
+        if e.offset is not None:
+            response["offset"] = e.offset
+        return jsonify(response), e.status
+    
+    try:
+        return start_analysis(video_path, filename, video_hash, options, schedule)
+    except Exception as e:
+        app.logger.error(f"Error starting analysis: {str(e)}")
+        return jsonify({"error": f"Server error: {str(e)}"}), 500
+
+@app.route("/live/sessions", methods=["POST"])
+def create_live_session():
+    """Start analyzing frames streamed live from a practice session"""
+    params = request.get_json(silent=True) or request.form
+    options, error = parse_analysis_options(params)
+    if error:
+        return jsonify({"error": error}), 400
+    options = resolve_analysis_options(options)
+    
+    if params.get('queue_size'):
+        try:
+            options['queue_size'] = int(params.get('queue_size'))
+        except (TypeError, ValueError):
+            options['queue_size'] = 0
+        if options['queue_size'] < 1:
+            return jsonify({"error": "queue_size must be a positive integer"}), 400
+    
+    try:
+        session = create_session(options)
+    except LiveSessionError as e:
+        return jsonify({"error": str(e)}), e.status
+    
+    return jsonify({
+        "session_id": session.session_id,
+        "queue_size": session.queue_size,
+        "max_frame_size": app.config['LIVE_MAX_FRAME_SIZE'],
+        "frame_header": "4-byte big-endian size, 8-byte big-endian float capture time"
+    })
+
+@app.route("/live/sessions/<session_id>", methods=["GET"])
+def get_live_session(session_id):
+    """Get frame counters and end-to-end latency percentiles of a live session"""
+    try:
+        return jsonify(get_session(session_id).stats())
+    except LiveSessionError as e:
+        return jsonify({"error": str(e)}), e.status
+
+@app.route("/live/sessions/<session_id>", methods=["DELETE"])
+def close_live_session(session_id):
+    """Stop a live session and get its final stats"""
+    try:
+        return jsonify(close_session(session_id))
+    except LiveSessionError as e:
+        return jsonify({"error": str(e)}), e.status
+
+@app.route("/live/sessions/<session_id>/frames", methods=["POST"])
+def submit_live_frames(session_id):
+    """
+    Queue frames of a live session for analysis
+    
+    An image body is one frame, with its capture time in the
+    X-Frame-Timestamp header. An application/octet-stream body holds any
+    number of frames, each behind a frame header, and may be sent with
+    chunked transfer encoding for as long as the session runs; every frame is
+    queued as soon as it arrives. Such a request occupies one of the web
+    process' threads until its body ends. The response lists the action
+    events since the after query parameter.
+    """
+    try:
+        session = get_session(session_id)
+    except LiveSessionError as e:
+        return jsonify({"error": str(e)}), e.status
+    
+    accepted = 0
+    dropped = session.dropped
+    try:
+        if request.mimetype.startswith('image/'):
+            if (request.content_length or 0) > app.config['LIVE_MAX_FRAME_SIZE']:
+                return jsonify({"error": "Frame too large"}), 413
+            timestamp = request.headers.get('X-Frame-Timestamp', type=float)
+            accepted += session.submit(request.get_data(), timestamp)
+        else:
+            # A streamed body is bounded per frame, not by the upload size limit
+            request.max_content_length = None
+            for data, timestamp in iter_frames(request.stream):
+                if not session.submit(data, timestamp):
+                    break
+                accepted += 1
+    except LiveSessionError as e:
+        return jsonify({"error": str(e), "accepted": accepted}), e.status
+    
+    events, next_event = session.events_after(request.args.get('after', 0, type=int))
+    return jsonify({
+        "accepted": accepted,
+        "dropped": session.dropped - dropped,
+        "events": events,
+        "next": next_event
+    })
+
+@app.route("/live/sessions/<session_id>/events", methods=["GET"])
+def get_live_events(session_id):
+    """Long-poll the action events of a live session from the after query parameter"""
+    try:
+        session = get_session(session_id)
+    except LiveSessionError as e:
+        return jsonify({"error": str(e)}), e.status
+    
+    wait = min(max(request.args.get('wait', 0, type=float), 0), 30)
+    events, next_event = session.events_after(request.args.get('after', 0, type=int), wait)
+    return jsonify({
+        "events": events,
+        "next": next_event,
+        "closed": session.closed
+    })
+
+def task_status(task_id):
+    """Build the /status response of an analysis task"""
     task = analyze_video_task.AsyncResult(task_id)
     response = {
         "task_id": task_id,
         "status": task.state
     }
     
-    if task.state == 'SUCCESS':
+    if task.state == 'PENDING':
+        # Results of deduplicated uploads outlive the task result in the broker
+        try:
+            entry = Database.get_video_analysis_by_task(task_id)
+        except Exception as e:
+            app.logger.warning(f"Video cache unavailable: {str(e)}")
+            entry = None
+        if entry:
+            response["status"] = 'SUCCESS'
+            response["result"] = entry.get('summary')
+    elif task.state == 'PROGRESS':
+        response["progress"] = combine_progress(task.info)
+    elif task.state == 'SUCCESS':
         response["result"] = task.result
     elif task.state == 'FAILURE':
         response["error"] = str(task.result)
     
-    return jsonify(response)
+    return response
+
+def combine_progress(progress):
+    """Sum the progress of the frame ranges of a chunked analysis into one report"""
+    chunk_task_ids = progress.get('chunk_task_ids')
+    if not chunk_task_ids:
+        return progress
+    
+    frames_done = 0
+    fps = 0
+    for chunk_task_id in chunk_task_ids:
+        chunk = analyze_video_task.AsyncResult(chunk_task_id)
+        if chunk.state == 'PROGRESS':
+            frames_done += chunk.info.get('frames_done', 0)
+            fps += chunk.info.get('fps', 0)
+        elif chunk.state == 'SUCCESS':
+            frames_done += chunk.result["counts"]["frame_count"]
+    
+    total_frames = progress["total_frames"]
+    remaining = max(0, total_frames - frames_done)
+    return {
+        "frames_done": frames_done,
+        "total_frames": total_frames,
+        "percent": round(min(100.0, frames_done / total_frames * 100), 1) if total_frames > 0 else 0,
+        "fps": round(fps, 1),
+        "eta_seconds": round(remaining / fps, 1) if fps > 0 else None
+    }
+
+@app.route("/status/<task_id>", methods=["GET"])
+def get_task_status(task_id):
+    """Check the status of an analysis task"""
+    return jsonify(task_status(task_id))
+
+@app.route("/status/<task_id>/stream", methods=["GET"])
+def stream_task_status(task_id):
+    """Push status and progress changes of an analysis task as Server-Sent Events"""
+    def events():
+        last = None
+        last_sent = time.time()
+        while True:
+            status = task_status(task_id)
+            if status != last:
+                yield f"data: {json.dumps(status)}\n\n"
+                last = status
+                last_sent = time.time()
+            elif time.time() - last_sent >= app.config['STATUS_STREAM_HEARTBEAT']:
+                # Keep proxies from closing an idle connection
+                yield ": heartbeat\n\n"
+                last_sent = time.time()
+            
+            if status["status"] in ('SUCCESS', 'FAILURE', 'REVOKED'):
+                return
+            time.sleep(app.config['PROGRESS_INTERVAL'])
+    
+    return Response(stream_with_context(events()), mimetype='text/event-stream', headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    })
 
 @app.route("/results/<result_id>", methods=["GET"])
 def get_result(result_id):
-    """Get analysis result by ID"""
-    result = Database.get_analysis_result(result_id)
+    """
+    Get analysis result by ID; clients revalidating with If-None-Match get 304 when it is unchanged
+    
+    A cached copy is only served while its version is the stored one, so a
+    re-classification finished by a worker is seen on the next request.
+    """
+    version = Database.get_analysis_result_version(result_id)
+    if version is None:
+        result_cache.pop(result_id)
+        return jsonify({"error": "Result not found"}), 404
+    
+    cached = result_cache.get(result_id)
+    if cached is None or cached[0] != version:
+        result = Database.get_analysis_result(result_id)
+        if not result:
+            return jsonify({"error": "Result not found"}), 404
+        
+        # Convert ObjectId to string manually
+        result['_id'] = str(result['_id'])
+        body = app.json.dumps(result)
+        cached = (result.get('version', 0), body, etag_for(f"{result.get('version', 0)}:{body}"))
+        result_cache.set(result_id, cached)
+    
+    return json_response(*cached[1:])
+
+@app.route("/results/<result_id>/segments", methods=["GET"])
+def get_result_segments(result_id):
+    """Get the action timeline of an analysis as [start_ts, end_ts, action] segments"""
+    result = Database.get_analysis_segments(result_id)
     if not result:
         return jsonify({"error": "Result not found"}), 404
     
-    # Convert ObjectId to string manually
-    result['_id'] = str(result['_id'])
-    return jsonify(result)
+    segments = result.get('segments', [])
+    action = request.args.get('action')
+    if action:
+        segments = [segment for segment in segments if segment[2] == action]
+    
+    return jsonify({
+        "result_id": str(result['_id']),
+        "duration": result.get('duration', 0),
+        "count": len(segments),
+        "segments": segments
+    })
+
+# Threshold overrides accepted by /results/<id>/reclassify, with their type and allowed range
+RECLASSIFY_THRESHOLDS = {
+    'knee_angle': (float, 0, 180),
+    'arm_angle': (float, 0, 180),
+    'dribble_window': (int, 3, 120),
+    'dribble_min_changes': (int, 1, 118)
+}
+
+@app.route("/results/<result_id>/reclassify", methods=["POST"])
+def reclassify_result(result_id):
+    """Rerun action detection on a result's stored landmarks with new thresholds"""
+    try:
+        result = Database.get_analysis_result(result_id)
+        if not result:
+            return jsonify({"error": "Result not found"}), 404
+        
+        if not result.get('landmarks_file'):
+            return jsonify({"error": "This analysis has no stored landmarks. Analyze the video again to reclassify it"}), 409
+        
+        params = request.get_json(silent=True) or request.form
+        thresholds = {}
+        for name, (cast, low, high) in RECLASSIFY_THRESHOLDS.items():
+            if params.get(name) is None or params.get(name) == '':
+                continue
+            try:
+                value = cast(params.get(name))
+            except (TypeError, ValueError):
+                return jsonify({"error": f"{name} must be a number"}), 400
+            if not low <= value <= high:
+                return jsonify({"error": f"{name} must be between {low} and {high}"}), 400
+            thresholds[name] = value
+        
+        if thresholds.get('dribble_min_changes', app.config['DRIBBLE_MIN_CHANGES']) > thresholds.get('dribble_window', app.config['DRIBBLE_WINDOW']) - 2:
+            return jsonify({"error": "dribble_min_changes must be at most dribble_window - 2"}), 400
+        
+        task = reclassify_task.delay(result_id, thresholds)
+        
+        return jsonify({
+            "message": "Result is being reclassified",
+            "task_id": task.id,
+            "status": "processing"
+        })
+    
+    except Exception as e:
+        app.logger.error(f"Error reclassifying result: {str(e)}")
+        return jsonify({"error": f"Server error: {str(e)}"}), 500
 
 @app.route("/results", methods=["GET"])
 def list_results():
-    """List recent analysis results with optional filtering"""
+    """
+    List analysis results, newest first, with optional filtering
+    
+    Query parameters: limit, user_id, search, fields=full for complete
+    documents instead of summaries, and cursor, the next_cursor of the
+    previous page.
+    """
     try:
         # Get query parameters
-        limit = request.args.get('limit', default=10, type=int)
+        limit = min(max(request.args.get('limit', default=10, type=int), 1), app.config['MAX_RESULTS_PAGE'])
         search = request.args.get('search', default='', type=str)
+        user_id = request.args.get('user_id') or None
+        full = request.args.get('fields') == 'full'
+        next_cursor = None
         
         if search:
-            results = Database.search_analysis_results(search)
+            results = Database.search_analysis_results(search, limit=limit, user_id=user_id, full=full)
         else:
-            results = Database.list_analysis_results(limit=limit)
+            try:
+                results, next_cursor = Database.list_analysis_results(
+                    limit=limit, user_id=user_id, cursor=request.args.get('cursor'), full=full)
+            except ValueError as e:
+                return jsonify({"status": "error", "error": str(e)}), 400
             
         # Convert ObjectId to string manually
         for result in results:
@@ -427,7 +1064,8 @@ def list_results():
         return jsonify({
             "status": "success",
             "count": len(results),
-            "results": results
+            "results": results,
+            "next_cursor": next_cursor
         })
     except Exception as e:
         app.logger.error(f"Error listing results: {str(e)}")
@@ -439,26 +1077,91 @@ def list_results():
 
 @app.route('/api/stats', methods=["GET"])
 def get_analysis_stats():
-    """Get summary statistics of all analyses"""
+    """Get summary statistics of all analyses, or of one user's with the user_id query parameter"""
     try:
-        stats = Database.get_analysis_stats()
+        user_id = request.args.get('user_id')
+        cached = stats_cache.get(user_id)
+        if cached is None:
+            stats = Database.get_analysis_stats(user_id)
+            body = app.json.dumps({
+                "status": "success",
+                "stats": stats
+            })
+            cached = (body, etag_for(body))
+            if "error" not in stats:
+                stats_cache.set(user_id, cached)
+        
+        return json_response(*cached)
+    except Exception as e:
+        app.logger.error(f"Error getting stats: {str(e)}")
+        return jsonify({
+            "status": "error",
+            "error": "Failed to retrieve statistics",
+            "details": str(e)
+        }), 500
+
+@app.route('/api/trends', methods=["GET"])
+def get_analysis_trends():
+    """
+    Get summary statistics per day, week or month
+    
+    Query parameters: start and end dates (YYYY-MM-DD, default the last 90
+    days), interval (day, week or month) and an optional user_id.
+    """
+    interval = request.args.get('interval', 'day')
+    if interval not in ('day', 'week', 'month'):
+        return jsonify({"error": "interval must be day, week or month"}), 400
+    
+    try:
+        end = datetime.strptime(request.args['end'], '%Y-%m-%d') if request.args.get('end') else datetime.utcnow()
+        start = datetime.strptime(request.args['start'], '%Y-%m-%d') if request.args.get('start') else end - timedelta(days=90)
+    except ValueError:
+        return jsonify({"error": "start and end must be dates formatted as YYYY-MM-DD"}), 400
+    if start > end:
+        return jsonify({"error": "start must not be after end"}), 400
+    if (end - start).days > app.config['MAX_TREND_DAYS']:
+        return jsonify({"error": f"Date range too long. Maximum is {app.config['MAX_TREND_DAYS']} days"}), 400
+    
+    try:
+        trends = Database.get_analysis_trends(start, end, interval, request.args.get('user_id'))
         return jsonify({
             "status": "success",
-            "stats": stats
+            "interval": interval,
+            "trends": trends
         })
     except Exception as e:
-        app.logger.error(f"Error getting stats: {str(e)}")
+        app.logger.error(f"Error getting trends: {str(e)}")
         return jsonify({
             "status": "error",
-            "error": "Failed to retrieve statistics",
+            "error": "Failed to retrieve trends",
             "details": str(e)
         }), 500
 
+@app.cli.command("rebuild-stats")
+def rebuild_stats_command():
+    """Recompute the analysis stats rollups from the stored results"""
+    count = Database.rebuild_analysis_stats()
+    print(f"Rebuilt {count} stats rollups")
+
+@app.cli.command("backfill-trends")
+def backfill_trends_command():
+    """Recompute the per-day stats buckets behind /api/trends from the stored results"""
+    count = Database.backfill_daily_stats()
+    print(f"Wrote {count} daily stats buckets")
+
+@app.cli.command("backfill-search-tokens")
+def backfill_search_tokens_command():
+    """Store the search tokens of analysis results saved before video name search was indexed"""
+    count = Database.backfill_search_tokens()
+    print(f"Indexed {count} analysis results for search")
+
 @app.route('/api/results/<result_id>/delete', methods=["DELETE"])
 def delete_result(result_id):
     """Delete an analysis result"""
     try:
         if Database.delete_analysis_result(result_id):
+            result_cache.pop(result_id)
+            stats_cache.clear()
             return jsonify({
                 "status": "success",
                 "message": f"Result {result_id} deleted successfully"
@@ -476,6 +1179,40 @@ def delete_result(result_id):
             "details": str(e)
         }), 500
 
+@app.route('/static/processed_images/<analysis_id>/<name>.json')
+def serve_legacy_actions(analysis_id, name):
+    """Render an analysis' columnar actions file as the JSON list older clients expect"""
+    folder = safe_join(app.config['PROCESSED_FOLDER'], analysis_id)
+    if folder is None:
+        return jsonify({"error": "Actions not found"}), 404
+    
+    # Analyses from before the columnar format still have their JSON file
+    if os.path.exists(os.path.join(folder, f"{name}.json")):
+        return immutable(send_from_directory(folder, f"{name}.json", max_age=app.config['ARTIFACT_MAX_AGE']), app.config['ARTIFACT_MAX_AGE'])
+    
+    # actions.json, or actions_<version>.json after a re-classification
+    actions_path = safe_join(folder, f"{name}.bin")
+    if not name.startswith('actions') or actions_path is None or not os.path.exists(actions_path):
+        return jsonify({"error": "Actions not found"}), 404
+    
+    # The columnar file is never rewritten, so its size and mtime identify the rendering
+    stat = os.stat(actions_path)
+    etag = etag_for(f"{name}:{stat.st_size}:{stat.st_mtime_ns}")
+    response = not_modified(etag)
+    if response is None:
+        response = Response(stream_with_context(iter_actions_json(actions_path)), mimetype='application/json')
+        response.set_etag(etag)
+    return immutable(response, app.config['ARTIFACT_MAX_AGE'])
+
+@app.route('/static/processed_images/<analysis_id>/<filename>')
+def serve_artifact(analysis_id, filename):
+    """Serve a sample frame or data file of an analysis; these are written once, so clients may keep them"""
+    folder = safe_join(app.config['PROCESSED_FOLDER'], analysis_id)
+    if folder is None:
+        return jsonify({"error": "File not found"}), 404
+    
+    return immutable(send_from_directory(folder, filename, max_age=app.config['ARTIFACT_MAX_AGE']), app.config['ARTIFACT_MAX_AGE'])
+
 @app.route('/static/<path:filename>')
 def serve_static(filename):
     """Serve static files"""
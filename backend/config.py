@@ -8,6 +8,19 @@ class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'dev-secret-key'
     MAX_CONTENT_LENGTH = 50 * 1024 * 1024  # 50MB
     ALLOWED_EXTENSIONS = {'mp4', 'mov', 'avi'}
+    UPLOAD_CHUNK_SIZE = 1024 * 1024  # Bytes read at a time while saving and hashing uploads
+    MAX_UPLOAD_SIZE = int(os.environ.get('MAX_UPLOAD_SIZE') or 20 * 1024 ** 3)  # Largest chunked upload, 20GB
+    UPLOAD_EXPIRY_SECONDS = int(os.environ.get('UPLOAD_EXPIRY_SECONDS') or 24 * 3600)  # Unfinished chunked uploads are deleted after this
+    VIDEO_CACHE_PENDING_TIMEOUT = int(os.environ.get('VIDEO_CACHE_PENDING_TIMEOUT') or 6 * 3600)  # Seconds before an unfinished analysis can be redone
+    MAX_BATCH_SIZE = int(os.environ.get('MAX_BATCH_SIZE') or 50)  # Videos accepted by one /analyze/batch request
+    MAX_TREND_DAYS = int(os.environ.get('MAX_TREND_DAYS') or 3660)  # Longest date range of one /api/trends query
+    MAX_RESULTS_PAGE = int(os.environ.get('MAX_RESULTS_PAGE') or 100)  # Largest page of /results
+    SEARCH_MAX_TIME_MS = int(os.environ.get('SEARCH_MAX_TIME_MS') or 2000)  # Server-side time limit of a /results search
+    SEARCH_CANDIDATES = int(os.environ.get('SEARCH_CANDIDATES') or 200)  # Prefix matches ranked per search
+    RESULT_CACHE_SIZE = int(os.environ.get('RESULT_CACHE_SIZE', 256))  # Serialized results kept in memory per web process; 0 disables the cache
+    RESULT_CACHE_TTL = float(os.environ.get('RESULT_CACHE_TTL', 30))  # Seconds a serialized result is kept; each request checks its version
+    STATS_CACHE_TTL = float(os.environ.get('STATS_CACHE_TTL', 10))  # Seconds /api/stats is answered from memory; 0 disables the cache
+    ARTIFACT_MAX_AGE = int(os.environ.get('ARTIFACT_MAX_AGE') or 365 * 24 * 3600)  # Browser cache lifetime of analysis artifacts
     
     # MongoDB settings
     MONGO_URI = os.environ.get('MONGO_URI') or 'mongodb://localhost:27017/courtiq'
@@ -17,10 +30,87 @@ class Config:
     CELERY_BROKER_URL = os.environ.get('REDIS_URL') or 'redis://localhost:6379/0'
     CELERY_RESULT_BACKEND = os.environ.get('REDIS_URL') or 'redis://localhost:6379/0'
     
+    # Scheduling of analysis tasks
+    SCHEDULER_REDIS_URL = os.environ.get('REDIS_URL') or 'redis://localhost:6379/0'
+    ANALYSIS_SHORT_QUEUE = os.environ.get('ANALYSIS_SHORT_QUEUE') or 'analysis.short'
+    ANALYSIS_LONG_QUEUE = os.environ.get('ANALYSIS_LONG_QUEUE') or 'analysis.long'
+    SHORT_VIDEO_MAX_SECONDS = float(os.environ.get('SHORT_VIDEO_MAX_SECONDS') or 120)  # Longer videos go to the long queue
+    DEFAULT_ANALYSIS_PRIORITY = os.environ.get('DEFAULT_ANALYSIS_PRIORITY') or 'normal'
+    DEFAULT_BATCH_PRIORITY = os.environ.get('DEFAULT_BATCH_PRIORITY') or 'low'
+    USER_MAX_CONCURRENT_ANALYSES = int(os.environ.get('USER_MAX_CONCURRENT_ANALYSES') or 2)  # 0 disables the cap
+    USER_SLOT_LEASE_SECONDS = int(os.environ.get('USER_SLOT_LEASE_SECONDS') or 3 * 3600)  # Slots of lost tasks are freed after this
+    USER_SLOT_RETRY_DELAY = int(os.environ.get('USER_SLOT_RETRY_DELAY') or 10)  # Seconds before a capped task is retried
+    
     # Storage settings
     UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static/uploads')
     PROCESSED_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static/processed_images')
     
+    # Action detection settings
+    DRIBBLE_WINDOW = int(os.environ.get('DRIBBLE_WINDOW') or 3)  # Pose frames per dribble window
+    DRIBBLE_MIN_CHANGES = int(os.environ.get('DRIBBLE_MIN_CHANGES') or 1)  # Wrist direction changes needed
+    
+    # Video analysis settings
+    POSE_MODEL_COMPLEXITY = int(os.environ.get('POSE_MODEL_COMPLEXITY') or 1)  # 0 lite, 1 full, 2 heavy
+    POSE_MIN_DETECTION_CONFIDENCE = float(os.environ.get('POSE_MIN_DETECTION_CONFIDENCE') or 0.7)
+    POSE_MIN_TRACKING_CONFIDENCE = float(os.environ.get('POSE_MIN_TRACKING_CONFIDENCE') or 0.5)
+    ANALYSIS_TARGET_FPS = float(os.environ.get('ANALYSIS_TARGET_FPS') or 0) or None  # None analyzes every frame
+    MOTION_THRESHOLD = float(os.environ.get('MOTION_THRESHOLD') or 0)  # 0 runs inference on every analyzed frame
+    INFERENCE_MAX_DIM = int(os.environ.get('INFERENCE_MAX_DIM') or 0)  # Longest side sent to MediaPipe; 0 keeps full resolution
+    ROI_TRACKING = os.environ.get('ROI_TRACKING', '').lower() in ('1', 'true', 'yes')  # Crop inference to the tracked player
+    ROI_PADDING = float(os.environ.get('ROI_PADDING') or 0.25)  # Fraction of the pose box added on each side
+    ROI_MIN_VISIBILITY = float(os.environ.get('ROI_MIN_VISIBILITY') or 0.5)  # Mean visibility below which a crop falls back
+    
+    # Parallel analysis of a single video ('local' process pool or 'celery' chord)
+    ANALYSIS_PARALLEL = os.environ.get('ANALYSIS_PARALLEL') or None
+    ANALYSIS_CHUNKS = int(os.environ.get('ANALYSIS_CHUNKS') or os.cpu_count() or 1)
+    MIN_CHUNK_FRAMES = int(os.environ.get('MIN_CHUNK_FRAMES') or 900)  # Shorter videos are not split
+    CHUNK_OVERLAP_FRAMES = int(os.environ.get('CHUNK_OVERLAP_FRAMES') or 30)  # Warmup frames before each chunk
+    PROGRESS_INTERVAL = float(os.environ.get('PROGRESS_INTERVAL') or 1.0)  # Seconds between task progress updates
+    BATCH_POLL_INTERVAL = int(os.environ.get('BATCH_POLL_INTERVAL') or 10)  # Seconds between checks of batch videos analyzed outside its chord
+    STATUS_STREAM_HEARTBEAT = 15  # Seconds between keep-alive comments on an idle status stream
+    PIPELINE_QUEUE_SIZE = int(os.environ.get('PIPELINE_QUEUE_SIZE', 8))  # Frames buffered between stages; 0 runs stages inline
+    MAX_SAMPLE_FRAMES = int(os.environ.get('MAX_SAMPLE_FRAMES', 10))  # Annotated sample frames saved per analysis
+    SAMPLE_FRAME_INTERVAL = int(os.environ.get('SAMPLE_FRAME_INTERVAL') or 60)  # Frames between periodic sample frames
+    SEGMENT_MAX_GAP = float(os.environ.get('SEGMENT_MAX_GAP', 0.25))  # Shorter gaps do not split an action segment
+    STORE_LANDMARKS = os.environ.get('STORE_LANDMARKS', 'true').lower() in ('1', 'true', 'yes')  # Keep raw landmarks for re-analysis
+    
+    # Named bundles of analysis options accepted by /analyze; explicit options override them
+    ANALYSIS_PRESETS = {
+        'fast': {
+            'model_complexity': 0,
+            'target_fps': 10,
+            'max_inference_dim': 480,
+            'motion_threshold': 2.0,
+            'max_sample_frames': 5,
+            'sample_interval': 120
+        },
+        'balanced': {
+            'model_complexity': 1,
+            'target_fps': 15,
+            'max_inference_dim': 720,
+            'motion_threshold': 1.0,
+            'max_sample_frames': 10,
+            'sample_interval': 60
+        },
+        'accurate': {
+            'model_complexity': 2,
+            'target_fps': None,
+            'max_inference_dim': 0,
+            'motion_threshold': 0,
+            'max_sample_frames': 10,
+            'sample_interval': 60
+        }
+    }
+    DEFAULT_ANALYSIS_PRESET = os.environ.get('DEFAULT_ANALYSIS_PRESET') or None  # None keeps the settings above
+    
+    # Live analysis of streamed frames
+    LIVE_QUEUE_SIZE = int(os.environ.get('LIVE_QUEUE_SIZE') or 2)  # Frames waiting for inference; older ones are dropped
+    LIVE_MAX_FRAME_SIZE = int(os.environ.get('LIVE_MAX_FRAME_SIZE') or 4 * 1024 * 1024)  # Largest encoded frame accepted
+    LIVE_EVENT_BUFFER = 1000  # Action events kept per session for clients to fetch
+    LIVE_LATENCY_WINDOW = 1000  # Most recent frames the latency percentiles cover
+    LIVE_SESSION_TIMEOUT = int(os.environ.get('LIVE_SESSION_TIMEOUT') or 300)  # Seconds without frames before a session is closed
+    LIVE_MAX_SESSIONS = int(os.environ.get('LIVE_MAX_SESSIONS') or 4)  # Concurrent sessions per web process
+    
     # Ensure directories exist
     @classmethod
     def init_app(cls, app):
@@ -1,6 +1,9 @@
-from pymongo import MongoClient
+from pymongo import MongoClient, ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
 import os
-from datetime import datetime
+import re
+import unicodedata
+from datetime import datetime, timedelta
 from bson import ObjectId
 from config import Config
 
@@ -8,6 +11,101 @@ from config import Config
 client = MongoClient(Config.MONGO_URI)
 db = client.get_database(Config.MONGO_DB_NAME)
 
+# Running totals kept in analysis_stats documents, by the analysis_results field they sum
+STATS_FIELDS = {
+    'total_frames': 'total_frames',
+    'total_pose_frames': 'frames_with_pose',
+    'total_jumping_frames': 'jumping_frames',
+    'total_shooting_frames': 'shooting_frames',
+    'total_dribbling_frames': 'dribbling_frames',
+    'sum_detection_rate': 'detection_rate',
+    'sum_duration': 'duration'
+}
+
+# Fields of analysis results returned by listings unless full documents are asked for
+RESULT_SUMMARY_FIELDS = {
+    'video_name': 1,
+    'user_id': 1,
+    'created_at': 1,
+    'total_frames': 1,
+    'frames_with_pose': 1,
+    'detection_rate': 1,
+    'jumping_frames': 1,
+    'shooting_frames': 1,
+    'dribbling_frames': 1,
+    'duration': 1,
+    'preset': 1
+}
+
+_EPOCH = datetime(1970, 1, 1)
+
+# Query words matched per search; more would only narrow an already indexed scan
+MAX_SEARCH_TERMS = 8
+
+def search_tokens(text):
+    """
+    Normalized words of a video name, as stored in search_tokens
+
+    Lowercase, without accents, split on anything that is not a letter or a
+    digit: "Práctica_Tiros-01.MP4" gives ["practica", "tiros", "01", "mp4"].
+    """
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(c for c in text if not unicodedata.combining(c)).lower()
+    return list(dict.fromkeys(token for token in re.split(r'[\W_]+', text) if token))
+
+def encode_results_cursor(result):
+    """Opaque position after result in the newest-first listing"""
+    return f"{(result['created_at'] - _EPOCH) // timedelta(milliseconds=1)}.{result['_id']}"
+
+def _decode_results_cursor(cursor):
+    try:
+        created_ms, result_id = cursor.split('.')
+        return _EPOCH + timedelta(milliseconds=int(created_ms)), ObjectId(result_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+def _stats_ids(user_id):
+    """analysis_stats documents an analysis counts towards: the global one and its user's"""
+    return ['global', f'user:{user_id}'] if user_id else ['global']
+
+def _stats_increment(result, sign=1):
+    """$inc document adding (or with sign -1, removing) an analysis result to the rollups"""
+    increment = {'total_analyses': sign}
+    for stat, field in STATS_FIELDS.items():
+        increment[stat] = sign * (result.get(field) or 0)
+    return increment
+
+def _stats_day(created_at):
+    """Start of the UTC day bucket an analysis created at created_at falls in"""
+    return datetime(created_at.year, created_at.month, created_at.day)
+
+def _update_stats(user_id, increment, created_at):
+    """Apply increment to the running totals and to the day bucket of an analysis"""
+    now = datetime.utcnow()
+    scopes = _stats_ids(user_id)
+    db.analysis_stats.bulk_write([
+        UpdateOne({'_id': scope}, {'$inc': increment, '$set': {'updated_at': now}}, upsert=True)
+        for scope in scopes
+    ], ordered=False)
+    db.analysis_daily_stats.bulk_write([
+        UpdateOne({'scope': scope, 'day': _stats_day(created_at)}, {'$inc': increment}, upsert=True)
+        for scope in scopes
+    ], ordered=False)
+
+def _period_start(day, interval):
+    if interval == 'week':
+        return day - timedelta(days=day.weekday())
+    if interval == 'month':
+        return day.replace(day=1)
+    return day
+
+def _next_period(start, interval):
+    if interval == 'week':
+        return start + timedelta(days=7)
+    if interval == 'month':
+        return start.replace(year=start.year + start.month // 12, month=start.month % 12 + 1)
+    return start + timedelta(days=1)
+
 class Database:
     @staticmethod
     def init_db():
@@ -22,10 +120,37 @@ class Database:
             db.analysis_results.create_index("created_at")
             db.analysis_results.create_index("video_name")
             db.analysis_results.create_index("user_id")  # Index for user_id
+            # Keyset pagination of /results, newest first, for everyone or one user
+            db.analysis_results.create_index([("created_at", -1), ("_id", -1)])
+            db.analysis_results.create_index([("user_id", 1), ("created_at", -1), ("_id", -1)])
+            # Video name search: exact words come out newest first, prefixes as a range scan
+            db.analysis_results.create_index([("search_tokens", 1), ("created_at", -1)])
             
             # Create user collection indexes
             db.users.create_index("email", unique=True)
             
+            # One analysis per video content, analysis options and user
+            if "video_hash_1_options_key_1" in db.video_cache.index_information():
+                # Entries from before the cache was scoped by user could hand one user's result to another
+                db.video_cache.drop_index("video_hash_1_options_key_1")
+                db.video_cache.delete_many({'user_id': {'$exists': False}})
+            db.video_cache.create_index([("video_hash", 1), ("options_key", 1), ("user_id", 1)], unique=True)
+            db.video_cache.create_index("task_id")
+            db.video_cache.create_index("result_id")
+            
+            db.analysis_batches.create_index("created_at")
+            
+            # One bucket per day and scope (all analyses, or one user's)
+            db.analysis_daily_stats.create_index([("scope", 1), ("day", 1)], unique=True)
+            
+            # Build the stats rollups for analyses stored before they existed
+            if db.analysis_stats.find_one({'_id': 'global'}) is None:
+                Database.rebuild_analysis_stats()
+            if db.analysis_daily_stats.find_one({'scope': 'global'}) is None:
+                Database.backfill_daily_stats()
+            if db.analysis_results.find_one({'search_tokens': {'$exists': False}}, {'_id': 1}) is not None:
+                Database.backfill_search_tokens()
+            
             print(f"Database '{Config.MONGO_DB_NAME}' initialized successfully")
             return True
         except Exception as e:
@@ -46,10 +171,13 @@ class Database:
     @staticmethod
     def save_analysis_result(video_name, total_frames, frames_with_pose, 
                             jumping_frames=0, shooting_frames=0, dribbling_frames=0, 
-                            duration=0, actions_file=""):
+                            duration=0, actions_file="", actions_data_file="", landmarks_file="",
+                            segments=None, preset=None, processing_stats=None, user_id=None,
+                            segment_max_gap=None):
         """Save analysis result to database with enhanced action detection"""
         result = {
             'video_name': video_name,
+            'search_tokens': search_tokens(video_name),
             'total_frames': total_frames,
             'frames_with_pose': frames_with_pose,
             'detection_rate': frames_with_pose / total_frames if total_frames > 0 else 0,
@@ -61,10 +189,19 @@ class Database:
             'dribbling_percentage': dribbling_frames / frames_with_pose if frames_with_pose > 0 else 0,
             'duration': duration,
             'actions_file': actions_file,
+            'actions_data_file': actions_data_file,
+            'landmarks_file': landmarks_file,
+            'segments': segments or [],
+            'segment_max_gap': segment_max_gap,
+            'preset': preset,
+            'processing_stats': processing_stats or {},
+            'user_id': user_id,
             'created_at': datetime.utcnow()
         }
         
-        return db.analysis_results.insert_one(result).inserted_id
+        result_id = db.analysis_results.insert_one(result).inserted_id
+        _update_stats(user_id, _stats_increment(result), result['created_at'])
+        return result_id
     
     @staticmethod
     def get_analysis_result(result_id):
@@ -75,36 +212,249 @@ class Database:
         return db.analysis_results.find_one({'_id': ObjectId(result_id)})
     
     @staticmethod
-    def list_analysis_results(limit=10):
-        """List recent analysis results"""
-        return list(db.analysis_results.find().sort('created_at', -1).limit(limit))
+    def get_analysis_result_version(result_id):
+        """Version of an analysis result, 0 until it is first updated, or None if it does not exist"""
+        if not ObjectId.is_valid(result_id):
+            return None
+        
+        result = db.analysis_results.find_one({'_id': ObjectId(result_id)}, {'version': 1})
+        return None if result is None else result.get('version', 0)
+    
+    @staticmethod
+    def get_analysis_segments(result_id):
+        """Get only the action segments of an analysis result, or None if it does not exist"""
+        if not ObjectId.is_valid(result_id):
+            return None
+        
+        return db.analysis_results.find_one({'_id': ObjectId(result_id)}, {'segments': 1, 'duration': 1})
+    
+    @staticmethod
+    def list_analysis_results(limit=10, user_id=None, cursor=None, full=False):
+        """
+        List analysis results, newest first, a page at a time
+
+        cursor is the next_cursor of the previous page; each page is an index
+        range scan starting after it, however deep into the history it is.
+        Returns (results, next_cursor), with next_cursor None on the last
+        page. Raises ValueError for a malformed cursor.
+        """
+        query = {}
+        if user_id:
+            query['user_id'] = user_id
+        if cursor:
+            created_at, result_id = _decode_results_cursor(cursor)
+            query['$or'] = [
+                {'created_at': {'$lt': created_at}},
+                {'created_at': created_at, '_id': {'$lt': result_id}}
+            ]
+        
+        # One extra document tells whether there is a next page
+        results = list(db.analysis_results.find(query, None if full else RESULT_SUMMARY_FIELDS)
+                       .sort([('created_at', -1), ('_id', -1)]).limit(limit + 1))
+        if len(results) <= limit:
+            return results, None
+        
+        results = results[:limit]
+        return results, encode_results_cursor(results[-1])
+        
+    @staticmethod
+    def update_analysis_result(result_id, fields):
+        """
+        Set fields of an analysis result; returns whether it exists
+
+        Every update increments the result's version, which tells cached
+        copies of the document that they are stale.
+        """
+        if not ObjectId.is_valid(result_id):
+            return False
+        
+        update = {'$set': fields, '$inc': {'version': 1}}
+        if not any(field in fields for field in STATS_FIELDS.values()):
+            return db.analysis_results.update_one({'_id': ObjectId(result_id)}, update).matched_count > 0
+        
+        # Move the rollups by the difference to the values replaced
+        previous = db.analysis_results.find_one_and_update(
+            {'_id': ObjectId(result_id)}, update, return_document=ReturnDocument.BEFORE)
+        if previous is None:
+            return False
+        
+        increment = {}
+        for stat, field in STATS_FIELDS.items():
+            if field in fields:
+                increment[stat] = (fields[field] or 0) - (previous.get(field) or 0)
+        _update_stats(previous.get('user_id'), increment, previous['created_at'])
+        return True
         
     @staticmethod
     def delete_analysis_result(result_id):
         """Delete analysis result by ID"""
         if not ObjectId.is_valid(result_id):
             return False
-            
-        return db.analysis_results.delete_one({'_id': ObjectId(result_id)}).deleted_count > 0
+        
+        # Uploading the same video again should run a fresh analysis
+        db.video_cache.delete_many({'result_id': ObjectId(result_id)})
+        
+        # Only the request that actually deleted the document takes it out of the rollups
+        result = db.analysis_results.find_one_and_delete({'_id': ObjectId(result_id)})
+        if result is None:
+            return False
+        
+        _update_stats(result.get('user_id'), _stats_increment(result, -1), result['created_at'])
+        return True
+    
+    @staticmethod
+    def claim_video_analysis(video_hash, options_key, task_id, user_id=None):
+        """
+        Register task_id as the analysis of a video's content with the given options for user_id
+
+        Returns (entry, claimed). When the same user already analyzed, or is
+        analyzing, the same video with the same options, the existing entry is
+        returned with claimed False; other users get an analysis of their own.
+        Pending entries older than VIDEO_CACHE_PENDING_TIMEOUT are assumed to
+        belong to a lost task and are taken over.
+        """
+        entry = {
+            'video_hash': video_hash,
+            'options_key': options_key,
+            'user_id': user_id,
+            'status': 'pending',
+            'task_id': task_id,
+            'result_id': None,
+            'created_at': datetime.utcnow()
+        }
+        
+        for _ in range(2):
+            try:
+                db.video_cache.insert_one(entry)
+                return entry, True
+            except DuplicateKeyError:
+                existing = db.video_cache.find_one({'video_hash': video_hash, 'options_key': options_key, 'user_id': user_id})
+                if existing is None:
+                    # Released between the insert and the lookup
+                    entry.pop('_id', None)
+                    continue
+                
+                stale_before = datetime.utcnow() - timedelta(seconds=Config.VIDEO_CACHE_PENDING_TIMEOUT)
+                if existing['status'] == 'pending' and existing['created_at'] < stale_before:
+                    db.video_cache.delete_one({'_id': existing['_id'], 'status': 'pending'})
+                    entry.pop('_id', None)
+                    continue
+                
+                return existing, False
+        
+        return existing, False
+    
+    @staticmethod
+    def complete_video_analysis(entry_id, result_id, summary):
+        """Attach the stored result and task summary to a video cache entry"""
+        db.video_cache.update_one({'_id': ObjectId(entry_id)}, {'$set': {
+            'status': 'done',
+            'result_id': ObjectId(result_id),
+            'summary': summary,
+            'completed_at': datetime.utcnow()
+        }})
+    
+    @staticmethod
+    def release_video_analysis(entry_id):
+        """Drop a pending video cache entry so the video can be analyzed again"""
+        db.video_cache.delete_one({'_id': ObjectId(entry_id), 'status': 'pending'})
+    
+    @staticmethod
+    def get_video_analysis_by_task(task_id):
+        """Get the completed video cache entry of an analysis task, if any"""
+        return db.video_cache.find_one({'task_id': task_id, 'status': 'done'})
+        
+    @staticmethod
+    def create_analysis_batch(options, user_id=None):
+        """Start a batch of analyses; its items are set once the videos are queued"""
+        batch = {
+            'status': 'processing',
+            'options': options,
+            'user_id': user_id,
+            'items': [],
+            'aggregate': None,
+            'created_at': datetime.utcnow()
+        }
+        
+        return db.analysis_batches.insert_one(batch).inserted_id
+    
+    @staticmethod
+    def get_analysis_batch(batch_id):
+        """Get a batch of analyses by ID"""
+        if not ObjectId.is_valid(batch_id):
+            return None
+        
+        return db.analysis_batches.find_one({'_id': ObjectId(batch_id)})
+    
+    @staticmethod
+    def update_analysis_batch(batch_id, fields):
+        """Set fields of a batch of analyses"""
+        db.analysis_batches.update_one({'_id': ObjectId(batch_id)}, {'$set': fields})
         
     @staticmethod
-    def search_analysis_results(query):
-        """Search analysis results by video name"""
-        if not query:
+    def search_analysis_results(query, limit=10, user_id=None, full=False):
+        """
+        Search analysis results by the words of their video name
+
+        Every word of the query must start a word of the name. Names with
+        more words matched exactly rank first, then newer ones. Both lookups
+        scan the search_tokens index only over the query's words, so the
+        cost does not grow with the collection; prefix matches are ranked
+        among the newest SEARCH_CANDIDATES of them.
+        """
+        terms = search_tokens(query)[:MAX_SEARCH_TERMS]
+        if not terms:
             return []
+        
+        projection = None if full else dict(RESULT_SUMMARY_FIELDS, search_tokens=1)
+        base = {'user_id': user_id} if user_id else {}
+        candidates = {}
+        
+        # Names containing every word exactly, newest first from the index
+        exact = dict(base, search_tokens={'$all': terms})
+        for result in (db.analysis_results.find(exact, projection).sort('created_at', -1)
+                       .limit(limit).max_time_ms(Config.SEARCH_MAX_TIME_MS)):
+            candidates[result['_id']] = result
+        
+        # Anchored prefixes, newest first up to a fixed number of candidates; index order
+        # would be alphabetical by word and could drop the newest matches
+        prefixes = dict(base, **{'$and': [{'search_tokens': re.compile('^' + re.escape(term))} for term in terms]})
+        for result in (db.analysis_results.find(prefixes, projection).sort('created_at', -1)
+                       .limit(Config.SEARCH_CANDIDATES).max_time_ms(Config.SEARCH_MAX_TIME_MS)):
+            candidates.setdefault(result['_id'], result)
+        
+        def rank(result):
+            tokens = set(result.get('search_tokens', []))
+            return sum(term in tokens for term in terms), result['created_at']
+        
+        results = sorted(candidates.values(), key=rank, reverse=True)[:limit]
+        if not full:
+            for result in results:
+                result.pop('search_tokens', None)
+        return results
+    
+    @staticmethod
+    def backfill_search_tokens(batch_size=1000):
+        """Store search_tokens on analysis results saved before they existed; returns how many were updated"""
+        updated = 0
+        while True:
+            batch = list(db.analysis_results.find({'search_tokens': {'$exists': False}}, {'video_name': 1}).limit(batch_size))
+            if not batch:
+                return updated
             
-        return list(db.analysis_results.find({
-            'video_name': {'$regex': query, '$options': 'i'}
-        }).sort('created_at', -1))
+            db.analysis_results.bulk_write([
+                UpdateOne({'_id': result['_id']}, {'$set': {'search_tokens': search_tokens(result.get('video_name'))}})
+                for result in batch
+            ], ordered=False)
+            updated += len(batch)
         
     @staticmethod
-    def get_analysis_stats():
-        """Get summary statistics of all analyses"""
+    def get_analysis_stats(user_id=None):
+        """Get summary statistics of all analyses, or of one user's, from the stats rollup"""
         try:
-            # Get total count of analyses
-            total_count = db.analysis_results.count_documents({})
+            stats = db.analysis_stats.find_one({'_id': _stats_ids(user_id)[-1]})
             
-            if total_count == 0:
+            if not stats or stats['total_analyses'] <= 0:
                 return {
                     "total_analyses": 0,
                     "total_frames_analyzed": 0,
@@ -112,40 +462,17 @@ class Database:
                     "avg_duration": 0
                 }
             
-            # Calculate aggregate statistics
-            pipeline = [
-                {
-                    "$group": {
-                        "_id": None,
-                        "total_frames": {"$sum": "$total_frames"},
-                        "total_pose_frames": {"$sum": "$frames_with_pose"},
-                        "total_jumping_frames": {"$sum": "$jumping_frames"},
-                        "total_shooting_frames": {"$sum": "$shooting_frames"},
-                        "total_dribbling_frames": {"$sum": "$dribbling_frames"},
-                        "avg_detection_rate": {"$avg": "$detection_rate"},
-                        "avg_duration": {"$avg": "$duration"}
-                    }
-                }
-            ]
-            
-            stats = list(db.analysis_results.aggregate(pipeline))
-            
-            if not stats:
-                return {
-                    "total_analyses": total_count,
-                    "total_frames_analyzed": 0,
-                    "avg_pose_detection_rate": 0,
-                    "avg_duration": 0
-                }
-                
-            result = stats[0]
-            
-            # Remove the _id field
-            if "_id" in result:
-                del result["_id"]
-                
-            # Add total analyses count
-            result["total_analyses"] = total_count
+            count = stats['total_analyses']
+            result = {
+                "total_frames": stats['total_frames'],
+                "total_pose_frames": stats['total_pose_frames'],
+                "total_jumping_frames": stats['total_jumping_frames'],
+                "total_shooting_frames": stats['total_shooting_frames'],
+                "total_dribbling_frames": stats['total_dribbling_frames'],
+                "avg_detection_rate": stats['sum_detection_rate'] / count,
+                "avg_duration": stats['sum_duration'] / count,
+                "total_analyses": count
+            }
             
             # Round floating point values
             for key in result:
@@ -159,3 +486,110 @@ class Database:
             return {
                 "error": str(e)
             }
+    
+    @staticmethod
+    def rebuild_analysis_stats():
+        """
+        Recompute the stats rollups from the analysis results
+
+        Repairs rollups that drifted, e.g. after a crash between storing a
+        result and counting it. Analyses saved or deleted while the rebuild
+        runs may be missed; run it again once writes are quiet.
+        """
+        group = {"_id": "$user_id", "total_analyses": {"$sum": 1}}
+        for stat, field in STATS_FIELDS.items():
+            group[stat] = {"$sum": f"${field}"}
+        
+        rollups = {'global': dict.fromkeys(['total_analyses', *STATS_FIELDS], 0)}
+        for row in db.analysis_results.aggregate([{"$group": group}]):
+            user_id = row.pop('_id')
+            for stat, value in row.items():
+                rollups['global'][stat] += value
+            if user_id:
+                rollups[f'user:{user_id}'] = row
+        
+        now = datetime.utcnow()
+        db.analysis_stats.bulk_write([
+            UpdateOne({'_id': stats_id}, {'$set': dict(stats, updated_at=now)}, upsert=True)
+            for stats_id, stats in rollups.items()
+        ])
+        # Users whose analyses are all gone
+        db.analysis_stats.delete_many({'_id': {'$nin': list(rollups)}})
+        return len(rollups)
+    
+    @staticmethod
+    def backfill_daily_stats():
+        """
+        Recompute the per-day stats buckets from the analysis results
+
+        Fills the buckets for analyses stored before they existed, and
+        repairs them like rebuild_analysis_stats does for the totals.
+        Returns the number of buckets written.
+        """
+        group = {
+            "_id": {
+                "user_id": "$user_id",
+                "day": {"$dateToString": {"format": "%Y-%m-%d", "date": "$created_at"}}
+            },
+            "total_analyses": {"$sum": 1}
+        }
+        for stat, field in STATS_FIELDS.items():
+            group[stat] = {"$sum": f"${field}"}
+        
+        buckets = {}
+        for row in db.analysis_results.aggregate([{"$group": group}], allowDiskUse=True):
+            key = row.pop('_id')
+            day = datetime.strptime(key['day'], "%Y-%m-%d")
+            for scope in _stats_ids(key.get('user_id')):
+                bucket = buckets.setdefault((scope, day), dict.fromkeys(row, 0))
+                for stat, value in row.items():
+                    bucket[stat] += value
+        
+        db.analysis_daily_stats.delete_many({})
+        if buckets:
+            db.analysis_daily_stats.insert_many([
+                dict(stats, scope=scope, day=day) for (scope, day), stats in buckets.items()
+            ])
+        return len(buckets)
+    
+    @staticmethod
+    def get_analysis_trends(start, end, interval='day', user_id=None):
+        """
+        Summary statistics per day, week (from Monday) or month between start and end
+
+        Reads one bucket per day of the range, never the analyses themselves.
+        Periods without analyses are included with zero counts.
+        """
+        start = _period_start(_stats_day(start), interval)
+        end = _stats_day(end)
+        buckets = db.analysis_daily_stats.find({
+            'scope': _stats_ids(user_id)[-1],
+            'day': {'$gte': start, '$lte': end}
+        }).sort('day', 1)
+        
+        totals = {}
+        for bucket in buckets:
+            period = totals.setdefault(_period_start(bucket['day'], interval), dict.fromkeys(['total_analyses', *STATS_FIELDS], 0))
+            for stat in period:
+                period[stat] += bucket.get(stat, 0)
+        
+        trends = []
+        period_start = start
+        while period_start <= end:
+            stats = totals.get(period_start, dict.fromkeys(['total_analyses', *STATS_FIELDS], 0))
+            count = stats['total_analyses']
+            trends.append({
+                "start": period_start.strftime("%Y-%m-%d"),
+                "total_analyses": count,
+                "total_frames": stats['total_frames'],
+                "total_pose_frames": stats['total_pose_frames'],
+                "total_jumping_frames": stats['total_jumping_frames'],
+                "total_shooting_frames": stats['total_shooting_frames'],
+                "total_dribbling_frames": stats['total_dribbling_frames'],
+                "total_duration": round(stats['sum_duration'], 2),
+                "avg_detection_rate": round(stats['sum_detection_rate'] / count, 2) if count > 0 else 0,
+                "avg_duration": round(stats['sum_duration'] / count, 2) if count > 0 else 0
+            })
+            period_start = _next_period(period_start, interval)
+        
+        return trends
@@ -0,0 +1,362 @@
+"""
+Staged frame pipeline used by the video analysis tasks.
+
+Decoding, pose inference and annotation/JPEG encoding run on separate
+threads connected by bounded queues. OpenCV and MediaPipe release the GIL
+while they work, so the stages overlap instead of running back to back.
+"""
+
+import queue
+import threading
+import time
+import cv2
+import mediapipe as mp
+import numpy as np
+
+# How long a blocked stage waits before checking whether the pipeline was stopped
+STOP_POLL_INTERVAL = 0.1
+
+
+class StageQueue:
+    """
+    Bounded queue between two pipeline stages that records its depth
+
+    Depth is sampled every time the consumer takes an item. Producer wait is
+    the time spent blocked on a full queue (the consumer is the bottleneck);
+    consumer wait is the time spent blocked on an empty one (the producer is).
+    """
+
+    def __init__(self, name, maxsize):
+        self.name = name
+        self.maxsize = maxsize
+        self._queue = queue.Queue(maxsize)
+        self._samples = 0
+        self._depth_total = 0
+        self._max_depth = 0
+        self._producer_wait = 0.0
+        self._consumer_wait = 0.0
+
+    def put(self, item, stop_event=None):
+        """Add an item, blocking while the queue is full; returns False if the pipeline stopped"""
+        start = time.perf_counter()
+        try:
+            while True:
+                try:
+                    self._queue.put(item, timeout=STOP_POLL_INTERVAL)
+                    return True
+                except queue.Full:
+                    if stop_event is not None and stop_event.is_set():
+                        return False
+        finally:
+            self._producer_wait += time.perf_counter() - start
+
+    def get(self):
+        """Take the next item, blocking while the queue is empty"""
+        depth = self._queue.qsize()
+        self._samples += 1
+        self._depth_total += depth
+        self._max_depth = max(self._max_depth, depth)
+
+        start = time.perf_counter()
+        item = self._queue.get()
+        self._consumer_wait += time.perf_counter() - start
+        return item
+
+    def drain(self):
+        """Discard queued items so a blocked producer can finish"""
+        while True:
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                return
+
+    def stats(self):
+        """Depth and wait statistics for this queue"""
+        return {
+            "capacity": self.maxsize,
+            "samples": self._samples,
+            "avg_depth": round(self._depth_total / self._samples, 2) if self._samples else 0,
+            "max_depth": self._max_depth,
+            "producer_wait_seconds": round(self._producer_wait, 3),
+            "consumer_wait_seconds": round(self._consumer_wait, 3)
+        }
+
+
+def combine_stage_stats(stats_list):
+    """Combine the stats of the same queue from several pipeline runs"""
+    samples = sum(stats["samples"] for stats in stats_list)
+    return {
+        "capacity": max(stats["capacity"] for stats in stats_list),
+        "samples": samples,
+        "avg_depth": round(sum(stats["avg_depth"] * stats["samples"] for stats in stats_list) / samples, 2) if samples else 0,
+        "max_depth": max(stats["max_depth"] for stats in stats_list),
+        "producer_wait_seconds": round(sum(stats["producer_wait_seconds"] for stats in stats_list), 3),
+        "consumer_wait_seconds": round(sum(stats["consumer_wait_seconds"] for stats in stats_list), 3)
+    }
+
+
+class FrameDecoder:
+    """
+    Iterates over the decoded frames of a video capture
+
+    Only every frame_stride-th frame is decoded; frames in between are
+    advanced with cap.grab(). Yields (frame_number, frame, motion_frame)
+    tuples where frame_number is 1-based and motion_frame is the downscaled
+    grayscale frame used by the motion gate (None unless motion_size is set).
+    After iteration, position holds the number of frames read or grabbed.
+    """
+
+    def __init__(self, cap, position, end_frame=None, frame_stride=1, motion_size=None):
+        self.cap = cap
+        self.position = position
+        self.end_frame = end_frame
+        self.frame_stride = frame_stride
+        self.motion_size = motion_size
+
+    def __iter__(self):
+        while self.cap.isOpened() and (self.end_frame is None or self.position < self.end_frame):
+            if self.position % self.frame_stride:
+                # Advance past frames between samples without decoding them
+                if not self.cap.grab():
+                    break
+                self.position += 1
+                continue
+
+            success, frame = self.cap.read()
+            if not success:
+                break
+            self.position += 1
+
+            motion_frame = None
+            if self.motion_size:
+                motion_frame = cv2.cvtColor(
+                    cv2.resize(frame, self.motion_size, interpolation=cv2.INTER_AREA),
+                    cv2.COLOR_BGR2GRAY
+                )
+
+            yield self.position, frame, motion_frame
+
+
+class InferenceFrameConverter:
+    """
+    Prepares BGR frames for pose inference at a bounded resolution
+
+    Frames whose longest side exceeds max_dim are shrunk first and converted
+    to RGB afterwards, so the color conversion only touches the small image.
+    Both steps write into buffers reused across frames of the same size;
+    MediaPipe copies its input, so the returned array may be overwritten by
+    the next call. Landmarks are normalized to the image size, so they can be
+    drawn on the full-resolution frame unchanged.
+    """
+
+    def __init__(self, max_dim=0):
+        self.max_dim = max_dim
+        self._resized = None
+        self._rgb = None
+
+    def __call__(self, frame):
+        height, width = frame.shape[:2]
+        scale = self.max_dim / max(height, width) if self.max_dim else 1
+        if scale < 1:
+            size = (max(1, round(width * scale)), max(1, round(height * scale)))
+            self._resized = self._buffer(self._resized, (size[1], size[0], 3))
+            frame = cv2.resize(frame, size, dst=self._resized, interpolation=cv2.INTER_LINEAR)
+
+        self._rgb = self._buffer(self._rgb, frame.shape)
+        return cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=self._rgb)
+
+    @staticmethod
+    def _buffer(buffer, shape):
+        if buffer is None or buffer.shape != shape:
+            buffer = np.empty(shape, dtype=np.uint8)
+        return buffer
+
+
+class PoseRoiTracker:
+    """
+    Runs pose inference on a crop around the previous frame's pose
+
+    After a confident detection, the next frame is cropped to the landmarks'
+    bounding box padded by padding times its size on every side, and the
+    landmarks found in the crop are mapped back to full-frame coordinates.
+    When the crop yields no pose, or its mean landmark visibility falls below
+    min_visibility, the frame is re-run at full size.
+    """
+
+    # Crops covering more of the frame than this save too little to be worth it
+    MAX_CROP_AREA = 0.8
+
+    def __init__(self, padding=0.25, min_visibility=0.5):
+        self.padding = padding
+        self.min_visibility = min_visibility
+        self.box = None
+        self.used_crop = False
+
+    def process(self, pose, frame, convert):
+        """Run pose.process on a crop of frame when possible, else on all of it"""
+        height, width = frame.shape[:2]
+        self.used_crop = False
+
+        if self.box is not None:
+            x0, y0, x1, y1 = (
+                int(self.box[0] * width), int(self.box[1] * height),
+                int(np.ceil(self.box[2] * width)), int(np.ceil(self.box[3] * height))
+            )
+            results = pose.process(convert(frame[y0:y1, x0:x1]))
+            if self._confident(results.pose_landmarks):
+                self._to_frame_coordinates(results.pose_landmarks, x0 / width, y0 / height,
+                                           (x1 - x0) / width, (y1 - y0) / height)
+                self.used_crop = True
+                self._track(results.pose_landmarks)
+                return results
+
+        results = pose.process(convert(frame))
+        self._track(results.pose_landmarks if self._confident(results.pose_landmarks) else None)
+        return results
+
+    def reset(self):
+        """Go back to full-frame inference"""
+        self.box = None
+
+    def _confident(self, pose_landmarks):
+        if not pose_landmarks:
+            return False
+        visibility = [lm.visibility for lm in pose_landmarks.landmark]
+        return sum(visibility) / len(visibility) >= self.min_visibility
+
+    @staticmethod
+    def _to_frame_coordinates(pose_landmarks, left, top, crop_width, crop_height):
+        for lm in pose_landmarks.landmark:
+            lm.x = left + lm.x * crop_width
+            lm.y = top + lm.y * crop_height
+            # z shares the x scale
+            lm.z = lm.z * crop_width
+
+    def _track(self, pose_landmarks):
+        if not pose_landmarks:
+            self.box = None
+            return
+
+        xs = [lm.x for lm in pose_landmarks.landmark]
+        ys = [lm.y for lm in pose_landmarks.landmark]
+        pad_x = (max(xs) - min(xs)) * self.padding
+        pad_y = (max(ys) - min(ys)) * self.padding
+        box = (
+            max(0.0, min(xs) - pad_x), max(0.0, min(ys) - pad_y),
+            min(1.0, max(xs) + pad_x), min(1.0, max(ys) + pad_y)
+        )
+
+        area = (box[2] - box[0]) * (box[3] - box[1])
+        self.box = box if 0 < area <= self.MAX_CROP_AREA else None
+
+
+def prefetch(iterable, stage_queue):
+    """
+    Run iterable on a background thread and yield its items through stage_queue
+
+    Exceptions raised by the producer are re-raised in the consumer. Closing
+    the generator early stops the producer thread.
+    """
+    done = object()
+    stop_event = threading.Event()
+    errors = []
+
+    def produce():
+        try:
+            for item in iterable:
+                if stop_event.is_set() or not stage_queue.put(item, stop_event):
+                    return
+        except Exception as e:
+            errors.append(e)
+        finally:
+            stage_queue.put(done, stop_event)
+
+    thread = threading.Thread(target=produce, name=f"{stage_queue.name}-stage", daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = stage_queue.get()
+            if item is done:
+                break
+            yield item
+    finally:
+        stop_event.set()
+        stage_queue.drain()
+        thread.join()
+
+    if errors:
+        raise errors[0]
+
+
+def annotate_frame(frame, pose_landmarks, frame_actions):
+    """Draw pose landmarks and detected action labels on a copy of a frame"""
+    # Draw pose landmarks
+    annotated_frame = frame.copy()
+    mp_drawing = mp.solutions.drawing_utils
+    mp_drawing.draw_landmarks(
+        annotated_frame, pose_landmarks, mp.solutions.pose.POSE_CONNECTIONS)
+
+    # Add action labels to the frame
+    actions_text = []
+    if frame_actions["is_jumping"]:
+        actions_text.append("Jumping")
+    if frame_actions["is_shooting"]:
+        actions_text.append("Shooting")
+    if frame_actions["is_dribbling"]:
+        actions_text.append("Dribbling")
+
+    if actions_text:
+        cv2.putText(
+            annotated_frame,
+            " & ".join(actions_text),
+            (10, 30),
+            cv2.FONT_HERSHEY_SIMPLEX,
+            0.8,
+            (0, 255, 0),
+            2
+        )
+
+    return annotated_frame
+
+
+class SampleFrameWriter:
+    """
+    Annotates and saves sample frames, on a writer thread when queue_size > 0
+    """
+
+    def __init__(self, queue_size=0):
+        self.queue = None
+        self._errors = []
+        if queue_size:
+            self.queue = StageQueue("annotate", queue_size)
+            self._thread = threading.Thread(target=self._run, name="annotate-stage", daemon=True)
+            self._thread.start()
+
+    def write(self, output_path, frame, pose_landmarks, frame_actions):
+        """Save an annotated copy of frame to output_path"""
+        if self.queue is None:
+            self._save(output_path, frame, pose_landmarks, frame_actions)
+        else:
+            self.queue.put((output_path, frame, pose_landmarks, frame_actions))
+
+    def close(self):
+        """Wait for pending frames to be written"""
+        if self.queue is not None:
+            self.queue.put(None)
+            self._thread.join()
+        if self._errors:
+            raise self._errors[0]
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            try:
+                self._save(*item)
+            except Exception as e:
+                self._errors.append(e)
+
+    @staticmethod
+    def _save(output_path, frame, pose_landmarks, frame_actions):
+        cv2.imwrite(output_path, annotate_frame(frame, pose_landmarks, frame_actions))
@@ -0,0 +1,22 @@
+"""
+Gunicorn settings of the web process.
+
+Status streams and live sessions hold their request open for as long as an
+analysis or a practice session runs, so requests are served by threads: a
+sync worker would block every other request behind one stream and kill it
+at its timeout. Live sessions live in the memory of the process that
+created them, so there is a single worker process; scale out with more
+threads, or with several instances behind a proxy that routes each
+session to one of them.
+"""
+
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT') or 5000}"
+workers = 1
+worker_class = 'gthread'
+threads = int(os.environ.get('WEB_THREADS') or 32)  # Concurrent requests, open streams included
+# Only the worker's heartbeat is timed; threads serving long requests keep it alive
+timeout = int(os.environ.get('WEB_TIMEOUT') or 120)
+graceful_timeout = 30
+keepalive = 5
@@ -0,0 +1,301 @@
+"""
+Live analysis of frames streamed from a practice session.
+
+Each session owns a thread that keeps one Pose instance and the action
+detectors warm across frames. Incoming frames wait in a small bounded queue;
+when inference falls behind, the oldest waiting frame is dropped rather than
+letting latency grow without limit. The detectors' output is turned into
+start/end events for each action, and the time from a frame's arrival to
+its result is kept to report latency percentiles.
+
+Sessions live in the memory of the web process that created them, so a
+deployment with several web processes must route a session's requests to
+the same one. A session's streamed frame upload and event long-poll are
+each held open by a request, which gunicorn.conf.py serves from threads of
+a single process.
+"""
+
+import struct
+import threading
+import time
+import uuid
+from collections import deque
+import cv2
+import numpy as np
+from config import Config
+from frame_pipeline import InferenceFrameConverter
+from pose_analyzer import PoseAnalyzer, StreamingDribbleDetector
+from pose_pool import pose_config, pose_session
+
+# Action flags reported as events, by event name
+LIVE_ACTIONS = (("jumping", "is_jumping"), ("shooting", "is_shooting"), ("dribbling", "is_dribbling"))
+
+# Prefix of each frame in a multi-frame request body: encoded size in bytes, capture time in seconds
+FRAME_HEADER = struct.Struct(">Id")
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+class LiveSessionError(Exception):
+    """A live session request that cannot be served, with its HTTP status"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+class LiveSession:
+    """Incremental pose analysis of one client's frame stream"""
+
+    def __init__(self, options=None):
+        options = options or {}
+        self.session_id = uuid.uuid4().hex
+        self.options = options
+        self.created_at = time.time()
+        self.last_activity = self.created_at
+
+        self.queue_size = options.get('queue_size', Config.LIVE_QUEUE_SIZE)
+        self._frames = deque(maxlen=self.queue_size)
+        self._events = deque(maxlen=Config.LIVE_EVENT_BUFFER)
+        self._latencies = deque(maxlen=Config.LIVE_LATENCY_WINDOW)
+        self._condition = threading.Condition()
+        self._closed = False
+        self._error = None
+
+        self._next_event = 0
+        self._active = {}
+        self.received = 0
+        self.processed = 0
+        self.dropped = 0
+        self.undecodable = 0
+
+        self._thread = threading.Thread(target=self._run, name=f"live-{self.session_id[:8]}", daemon=True)
+        self._thread.start()
+
+    def submit(self, data, timestamp=None):
+        """
+        Queue an encoded frame (JPEG, PNG...) for analysis
+
+        timestamp is the client's capture time of the frame in seconds and is
+        echoed in events; it defaults to the time since the session started.
+        Returns False if the session is closed.
+        """
+        received_at = time.time()
+        if timestamp is None:
+            timestamp = received_at - self.created_at
+
+        with self._condition:
+            if self._closed:
+                return False
+            if len(self._frames) == self._frames.maxlen:
+                # Fall behind by at most the queue size: the oldest frame gives way
+                self.dropped += 1
+            self._frames.append((data, timestamp, received_at))
+            self.received += 1
+            self.last_activity = received_at
+            self._condition.notify_all()
+        return True
+
+    def events_after(self, after=0, timeout=0):
+        """Events with a sequence number of at least after, waiting up to timeout seconds for one"""
+        deadline = time.time() + timeout
+        with self._condition:
+            while self._next_event <= after and not self._closed:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            return [event for event in self._events if event["seq"] >= after], self._next_event
+
+    @property
+    def closed(self):
+        """Whether the session stopped, by its client or by an error"""
+        return self._closed
+
+    def stats(self):
+        """Frame counters, queue depth and end-to-end latency percentiles in milliseconds"""
+        with self._condition:
+            latencies = np.array(self._latencies) * 1000
+            stats = {
+                "session_id": self.session_id,
+                "received": self.received,
+                "processed": self.processed,
+                "dropped": self.dropped,
+                "undecodable": self.undecodable,
+                "queue_depth": len(self._frames),
+                "active_actions": sorted(self._active),
+                "closed": self._closed,
+                "error": self._error
+            }
+
+        stats["latency_ms"] = {
+            "p50": round(float(np.percentile(latencies, 50)), 1),
+            "p95": round(float(np.percentile(latencies, 95)), 1),
+            "p99": round(float(np.percentile(latencies, 99)), 1),
+            "max": round(float(latencies.max()), 1),
+            "samples": len(latencies)
+        } if len(latencies) else None
+        return stats
+
+    def close(self):
+        """Stop the session after the frame being analyzed; queued frames are discarded"""
+        with self._condition:
+            self._closed = True
+            self._frames.clear()
+            self._condition.notify_all()
+        if threading.current_thread() is not self._thread:
+            self._thread.join()
+
+    def _next_frame(self):
+        with self._condition:
+            while not self._frames and not self._closed:
+                self._condition.wait()
+            if self._closed:
+                return None
+            return self._frames.popleft()
+
+    def _run(self):
+        to_inference_frame = InferenceFrameConverter(self.options.get('max_inference_dim', Config.INFERENCE_MAX_DIM))
+        dribble_detector = StreamingDribbleDetector(
+            window=Config.DRIBBLE_WINDOW,
+            min_changes=Config.DRIBBLE_MIN_CHANGES
+        )
+
+        try:
+            with pose_session(pose_config(self.options)) as pose:
+                while True:
+                    item = self._next_frame()
+                    if item is None:
+                        return
+                    data, timestamp, received_at = item
+
+                    frame = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+                    if frame is None:
+                        with self._condition:
+                            self.undecodable += 1
+                        continue
+
+                    results = pose.process(to_inference_frame(frame))
+                    flags = dict.fromkeys((flag for _, flag in LIVE_ACTIONS), False)
+                    if results.pose_landmarks:
+                        frame_landmarks = PoseAnalyzer.landmarks_to_array(results.pose_landmarks.landmark)[np.newaxis]
+                        flags["is_jumping"] = bool(PoseAnalyzer.is_jumping_batch(frame_landmarks)[0])
+                        flags["is_shooting"] = bool(PoseAnalyzer.is_shooting_batch(frame_landmarks)[0])
+                        flags["is_dribbling"] = dribble_detector.push(results.pose_landmarks.landmark)
+
+                    self._record(flags, timestamp, received_at)
+        except Exception as e:
+            print(f"Error in live session {self.session_id}: {str(e)}")
+            with self._condition:
+                self._error = str(e)
+                self._closed = True
+                self._condition.notify_all()
+
+    def _record(self, flags, timestamp, received_at):
+        latency = time.time() - received_at
+        with self._condition:
+            self.processed += 1
+            self._latencies.append(latency)
+
+            # Emit an event whenever an action starts or stops
+            for action, flag in LIVE_ACTIONS:
+                if flags[flag] == (action in self._active):
+                    continue
+
+                event = {
+                    "seq": self._next_event,
+                    "action": action,
+                    "type": "start" if flags[flag] else "end",
+                    "timestamp": round(timestamp, 3),
+                    "latency_ms": round(latency * 1000, 1)
+                }
+                if flags[flag]:
+                    self._active[action] = timestamp
+                else:
+                    event["duration"] = round(timestamp - self._active.pop(action), 3)
+                self._events.append(event)
+                self._next_event += 1
+
+            self._condition.notify_all()
+
+
+def _read_exact(stream, size):
+    data = bytearray()
+    while len(data) < size:
+        chunk = stream.read(size - len(data))
+        if not chunk:
+            break
+        data += chunk
+    return bytes(data)
+
+
+def iter_frames(stream, max_frame_size=None):
+    """
+    Read the frames of a multi-frame request body as (data, timestamp)
+
+    Each frame is a FRAME_HEADER followed by its encoded bytes, so a client
+    can keep one chunked request open and write frames as they are captured.
+    Frames are yielded as soon as they are complete.
+    """
+    max_frame_size = max_frame_size or Config.LIVE_MAX_FRAME_SIZE
+    while True:
+        header = _read_exact(stream, FRAME_HEADER.size)
+        if not header:
+            return
+        if len(header) < FRAME_HEADER.size:
+            raise LiveSessionError("Truncated frame header")
+
+        size, timestamp = FRAME_HEADER.unpack(header)
+        if size > max_frame_size:
+            raise LiveSessionError("Frame too large", 413)
+        data = _read_exact(stream, size)
+        if len(data) < size:
+            raise LiveSessionError("Truncated frame")
+        yield data, timestamp
+
+
+def create_session(options=None):
+    """Start a live session, closing idle ones first"""
+    expire_sessions()
+    with _sessions_lock:
+        if len(_sessions) >= Config.LIVE_MAX_SESSIONS:
+            raise LiveSessionError("Too many live sessions", 503)
+        session = LiveSession(options)
+        _sessions[session.session_id] = session
+    return session
+
+
+def get_session(session_id):
+    """The live session with this id"""
+    with _sessions_lock:
+        session = _sessions.get(session_id)
+    if session is None:
+        raise LiveSessionError("Live session not found", 404)
+    return session
+
+
+def close_session(session_id):
+    """Close and forget a live session; returns its final stats"""
+    with _sessions_lock:
+        session = _sessions.pop(session_id, None)
+    if session is None:
+        raise LiveSessionError("Live session not found", 404)
+
+    session.close()
+    return session.stats()
+
+
+def expire_sessions(max_idle=None):
+    """Close sessions that received no frame for max_idle seconds"""
+    max_idle = Config.LIVE_SESSION_TIMEOUT if max_idle is None else max_idle
+    cutoff = time.time() - max_idle
+    with _sessions_lock:
+        idle = [session_id for session_id, session in _sessions.items() if session.last_activity < cutoff]
+
+    for session_id in idle:
+        try:
+            close_session(session_id)
+        except LiveSessionError:
+            # Closed by its client in the meantime
+            pass
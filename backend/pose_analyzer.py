@@ -1,102 +1,192 @@
 import numpy as np
 import math
+from collections import deque
+
+# MediaPipe Pose landmark indices used by the detectors
+LEFT_SHOULDER = 11
+RIGHT_SHOULDER = 12
+LEFT_ELBOW = 13
+RIGHT_ELBOW = 14
+LEFT_WRIST = 15
+RIGHT_WRIST = 16
+LEFT_HIP = 23
+RIGHT_HIP = 24
+LEFT_KNEE = 25
+RIGHT_KNEE = 26
+LEFT_ANKLE = 27
+# The detectors have always sampled landmark 29 (left heel) as the "right ankle";
+# kept as-is so results stay comparable with earlier analyses.
+RIGHT_ANKLE = 29
+
+NUM_LANDMARKS = 33
+
+# Default detection thresholds, in degrees
+JUMP_KNEE_ANGLE = 170  # Knees bent below this angle
+SHOOT_ARM_ANGLE = 160  # Arm straight above this angle
+
 
 class PoseAnalyzer:
     """
     A class to analyze basketball poses and detect specific actions
     """
-    
+
+    @staticmethod
+    def landmarks_to_array(landmarks):
+        """
+        Convert a MediaPipe landmark list into a (33, 4) float32 array of
+        (x, y, z, visibility) values, the row format used by the batch API
+        """
+        return np.array(
+            [(lm.x, lm.y, lm.z, lm.visibility) for lm in landmarks],
+            dtype=np.float32
+        )
+
     @staticmethod
     def calculate_angle(a, b, c):
         """Calculate the angle between three points"""
-        a = np.array(a)
-        b = np.array(b)
-        c = np.array(c)
-        
-        radians = np.arctan2(c[1] - b[1], c[0] - b[0]) - np.arctan2(a[1] - b[1], a[0] - b[0])
+        return float(PoseAnalyzer.calculate_angles(a, b, c))
+
+    @staticmethod
+    def calculate_angles(a, b, c):
+        """
+        Calculate the angle at b for arrays of points
+
+        a, b and c are (..., 2) arrays of (x, y) coordinates; the result has
+        the leading shape and holds angles in degrees in [0, 180]
+        """
+        a = np.asarray(a)
+        b = np.asarray(b)
+        c = np.asarray(c)
+
+        radians = np.arctan2(c[..., 1] - b[..., 1], c[..., 0] - b[..., 0]) - \
+            np.arctan2(a[..., 1] - b[..., 1], a[..., 0] - b[..., 0])
         angle = np.abs(radians * 180.0 / np.pi)
-        
-        if angle > 180.0:
-            angle = 360.0 - angle
-            
-        return angle
-    
+
+        return np.where(angle > 180.0, 360.0 - angle, angle)
+
     @staticmethod
     def is_jumping(landmarks):
         """
         Detect if the person is jumping based on pose landmarks
-        
+
+        Thin wrapper around is_jumping_batch for a single frame
+        """
+        if not landmarks:
+            return False
+
+        frame = PoseAnalyzer.landmarks_to_array(landmarks)
+        return bool(PoseAnalyzer.is_jumping_batch(frame[np.newaxis])[0])
+
+    @staticmethod
+    def is_jumping_batch(landmarks, knee_angle=JUMP_KNEE_ANGLE):
+        """
+        Detect jumping for every frame of an (N, 33, 4) landmark array
+
         The following logic is used:
         1. Ankles are higher than the knees
-        2. Knees are slightly bent
+        2. Knees are slightly bent (both knee angles below knee_angle)
         3. Arms are raised
+
+        Returns a boolean array of shape (N,)
         """
-        if not landmarks:
-            return False
-            
-        # Get relevant landmarks
-        left_shoulder = (landmarks[11].x, landmarks[11].y)
-        right_shoulder = (landmarks[12].x, landmarks[12].y)
-        left_hip = (landmarks[23].x, landmarks[23].y)
-        right_hip = (landmarks[24].x, landmarks[24].y)
-        left_knee = (landmarks[25].x, landmarks[25].y)
-        right_knee = (landmarks[26].x, landmarks[26].y)
-        left_ankle = (landmarks[27].x, landmarks[27].y)
-        right_ankle = (landmarks[29].x, landmarks[29].y)
-        left_elbow = (landmarks[13].x, landmarks[13].y)
-        right_elbow = (landmarks[14].x, landmarks[14].y)
-        left_wrist = (landmarks[15].x, landmarks[15].y)
-        right_wrist = (landmarks[16].x, landmarks[16].y)
-        
+        landmarks = np.asarray(landmarks)
+        xy = landmarks[..., :2]
+        y = landmarks[..., 1]
+
         # Check if ankles are higher than knees (jumping indicator)
-        ankles_higher_than_knees = (left_ankle[1] < left_knee[1]) and (right_ankle[1] < right_knee[1])
-        
+        ankles_higher_than_knees = (y[:, LEFT_ANKLE] < y[:, LEFT_KNEE]) & \
+            (y[:, RIGHT_ANKLE] < y[:, RIGHT_KNEE])
+
         # Check if knees are bent
-        left_knee_angle = PoseAnalyzer.calculate_angle(left_hip, left_knee, left_ankle)
-        right_knee_angle = PoseAnalyzer.calculate_angle(right_hip, right_knee, right_ankle)
-        knees_bent = (left_knee_angle < 170) and (right_knee_angle < 170)
-        
+        left_knee_angle = PoseAnalyzer.calculate_angles(
+            xy[:, LEFT_HIP], xy[:, LEFT_KNEE], xy[:, LEFT_ANKLE])
+        right_knee_angle = PoseAnalyzer.calculate_angles(
+            xy[:, RIGHT_HIP], xy[:, RIGHT_KNEE], xy[:, RIGHT_ANKLE])
+        knees_bent = (left_knee_angle < knee_angle) & (right_knee_angle < knee_angle)
+
         # Check if arms are raised (common in jump shots)
-        left_arm_raised = left_wrist[1] < left_elbow[1] < left_shoulder[1]
-        right_arm_raised = right_wrist[1] < right_elbow[1] < right_shoulder[1]
-        arms_raised = left_arm_raised or right_arm_raised
-        
-        return ankles_higher_than_knees and knees_bent and arms_raised
-    
+        arms_raised = PoseAnalyzer._arms_raised(y, LEFT_WRIST, LEFT_ELBOW, LEFT_SHOULDER) | \
+            PoseAnalyzer._arms_raised(y, RIGHT_WRIST, RIGHT_ELBOW, RIGHT_SHOULDER)
+
+        return ankles_higher_than_knees & knees_bent & arms_raised
+
     @staticmethod
     def is_shooting(landmarks):
         """
         Detect if the person is shooting the basketball
-        
+
+        Thin wrapper around is_shooting_batch for a single frame
+        """
+        if not landmarks:
+            return False
+
+        frame = PoseAnalyzer.landmarks_to_array(landmarks)
+        return bool(PoseAnalyzer.is_shooting_batch(frame[np.newaxis])[0])
+
+    @staticmethod
+    def is_shooting_batch(landmarks, arm_angle=SHOOT_ARM_ANGLE):
+        """
+        Detect shooting for every frame of an (N, 33, 4) landmark array
+
         The following logic is used:
         1. One arm is extended upward
         2. The wrist is above the elbow and shoulder
-        3. The arm is relatively straight
+        3. The arm is relatively straight (elbow angle above arm_angle)
+
+        Returns a boolean array of shape (N,)
         """
-        if not landmarks:
-            return False
-            
-        # Get relevant landmarks
-        left_shoulder = (landmarks[11].x, landmarks[11].y)
-        right_shoulder = (landmarks[12].x, landmarks[12].y)
-        left_elbow = (landmarks[13].x, landmarks[13].y)
-        right_elbow = (landmarks[14].x, landmarks[14].y)
-        left_wrist = (landmarks[15].x, landmarks[15].y)
-        right_wrist = (landmarks[16].x, landmarks[16].y)
-        
-        # Check for right arm shooting motion
-        right_shooting = (right_wrist[1] < right_elbow[1] < right_shoulder[1])
-        left_shooting = (left_wrist[1] < left_elbow[1] < left_shoulder[1])
-        
+        landmarks = np.asarray(landmarks)
+        xy = landmarks[..., :2]
+        y = landmarks[..., 1]
+
+        # Check for arm shooting motion
+        right_shooting = PoseAnalyzer._arms_raised(y, RIGHT_WRIST, RIGHT_ELBOW, RIGHT_SHOULDER)
+        left_shooting = PoseAnalyzer._arms_raised(y, LEFT_WRIST, LEFT_ELBOW, LEFT_SHOULDER)
+
         # Check if the arm is relatively straight
-        right_arm_angle = PoseAnalyzer.calculate_angle(right_shoulder, right_elbow, right_wrist)
-        left_arm_angle = PoseAnalyzer.calculate_angle(left_shoulder, left_elbow, left_wrist)
-        
-        right_arm_straight = right_arm_angle > 160
-        left_arm_straight = left_arm_angle > 160
-        
-        return (right_shooting and right_arm_straight) or (left_shooting and left_arm_straight)
-    
+        right_arm_angle = PoseAnalyzer.calculate_angles(
+            xy[:, RIGHT_SHOULDER], xy[:, RIGHT_ELBOW], xy[:, RIGHT_WRIST])
+        left_arm_angle = PoseAnalyzer.calculate_angles(
+            xy[:, LEFT_SHOULDER], xy[:, LEFT_ELBOW], xy[:, LEFT_WRIST])
+
+        right_arm_straight = right_arm_angle > arm_angle
+        left_arm_straight = left_arm_angle > arm_angle
+
+        return (right_shooting & right_arm_straight) | (left_shooting & left_arm_straight)
+
+    @staticmethod
+    def is_dribbling_batch(landmarks, window=3, min_changes=1):
+        """
+        Detect dribbling for a sequence of pose frames in an (N, 33, 4) array
+
+        Vectorized equivalent of pushing every frame, in order, through a
+        StreamingDribbleDetector(window, min_changes). Returns a boolean
+        array of shape (N,)
+        """
+        landmarks = np.asarray(landmarks)
+        # Take the lower of the two wrists as the dribbling hand
+        wrist_y = np.maximum(landmarks[:, LEFT_WRIST, 1], landmarks[:, RIGHT_WRIST, 1]).astype(np.float64)
+
+        dribbling = np.zeros(len(wrist_y), dtype=bool)
+        if len(wrist_y) < window:
+            return dribbling
+
+        # changes[i] flags a direction change at frame i + 1
+        diffs = np.diff(wrist_y)
+        changes = (diffs[:-1] * diffs[1:]) < 0
+        cumulative = np.concatenate(([0], np.cumsum(changes)))
+
+        # The window ending at frame j has interior frames j - window + 2 .. j - 1
+        ends = np.arange(window - 1, len(wrist_y))
+        counts = cumulative[ends - 1] - cumulative[ends - window + 1]
+        dribbling[window - 1:] = counts >= min_changes
+        return dribbling
+
+    @staticmethod
+    def _arms_raised(y, wrist, elbow, shoulder):
+        """Wrist above elbow above shoulder, for an (N, 33) array of y values"""
+        return (y[:, wrist] < y[:, elbow]) & (y[:, elbow] < y[:, shoulder])
+
     @staticmethod
     def is_dribbling(landmarks_history, min_frames=3):
         """
@@ -137,3 +227,57 @@ class PoseAnalyzer:
                 
         # If we have at least one direction change in the hand movement, consider it dribbling
         return direction_changes >= 1
+
+
+class StreamingDribbleDetector:
+    """
+    Incremental dribble detector over a sliding window of wrist heights
+
+    Keeps a fixed-size ring buffer of wrist-y values and the direction-change
+    flag of every interior point in the window, so each push costs O(1) no
+    matter how wide the window is. With the defaults it gives the same answer
+    as PoseAnalyzer.is_dribbling on the same sequence of frames.
+    """
+
+    def __init__(self, window=3, min_changes=1):
+        if window < 3:
+            raise ValueError("window must be at least 3 frames")
+        if min_changes < 1:
+            raise ValueError("min_changes must be at least 1")
+
+        self.window = window
+        self.min_changes = min_changes
+        self.reset()
+
+    def reset(self):
+        """Forget all buffered frames"""
+        self._wrist_y = deque(maxlen=self.window)
+        # One flag per interior point of the window
+        self._changes = deque(maxlen=self.window - 2)
+        self._change_count = 0
+
+    def push(self, landmarks):
+        """Add a frame's landmarks and return whether the player is dribbling"""
+        # Take the lower of the two wrists as the dribbling hand
+        return self.push_wrist_y(max(landmarks[LEFT_WRIST].y, landmarks[RIGHT_WRIST].y))
+
+    def push_wrist_y(self, wrist_y):
+        """Add the dribbling hand's y value for a frame and return whether the player is dribbling"""
+        if len(self._wrist_y) >= 2:
+            # The previous newest point becomes interior; check it for a direction change
+            prev_diff = self._wrist_y[-1] - self._wrist_y[-2]
+            next_diff = wrist_y - self._wrist_y[-1]
+            changed = (prev_diff * next_diff) < 0
+
+            if len(self._changes) == self._changes.maxlen:
+                self._change_count -= self._changes[0]
+            self._changes.append(changed)
+            self._change_count += changed
+
+        self._wrist_y.append(wrist_y)
+        return self.is_dribbling
+
+    @property
+    def is_dribbling(self):
+        """Whether the current window holds enough direction changes"""
+        return len(self._wrist_y) == self.window and self._change_count >= self.min_changes
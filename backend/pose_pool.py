@@ -0,0 +1,90 @@
+"""
+Per-process pool of MediaPipe Pose instances.
+
+Building a Pose graph loads the model and starts its calculator threads,
+which used to happen (and leak) on every analysis. Instances here are kept
+for the life of the worker process, keyed by their configuration, and reset
+between videos so tracking state does not carry over from one to the next.
+"""
+
+import os
+import threading
+from contextlib import contextmanager
+import mediapipe as mp
+from config import Config
+
+_idle = {}
+_inherited = []
+_lock = threading.Lock()
+
+
+def pose_config(options=None):
+    """Pose constructor arguments for an analysis, from its options or the worker defaults"""
+    options = options or {}
+    return {
+        "model_complexity": int(options.get('model_complexity', Config.POSE_MODEL_COMPLEXITY)),
+        "min_detection_confidence": float(options.get('min_detection_confidence', Config.POSE_MIN_DETECTION_CONFIDENCE)),
+        "min_tracking_confidence": float(options.get('min_tracking_confidence', Config.POSE_MIN_TRACKING_CONFIDENCE))
+    }
+
+
+def _key(config):
+    return tuple(sorted(config.items()))
+
+
+@contextmanager
+def pose_session(config):
+    """
+    Borrow a freshly reset Pose instance for one video
+
+    Each borrower gets its own instance, so concurrent analyses in the same
+    process (thread pools, live sessions) never share graph state.
+    """
+    key = _key(config)
+    with _lock:
+        idle = _idle.get(key)
+        pose = idle.pop() if idle else None
+
+    if pose is None:
+        pose = mp.solutions.pose.Pose(**config)
+    else:
+        pose.reset()
+
+    try:
+        yield pose
+    except BaseException:
+        # The graph may be mid-frame; do not hand it to the next video
+        pose.close()
+        raise
+    else:
+        with _lock:
+            _idle.setdefault(key, []).append(pose)
+
+
+def preload(config=None):
+    """Build a Pose instance ahead of the first analysis"""
+    with pose_session(config or pose_config()):
+        pass
+
+
+def close_all():
+    """Close every idle Pose instance"""
+    with _lock:
+        poses = [pose for idle in _idle.values() for pose in idle]
+        _idle.clear()
+
+    for pose in poses:
+        pose.close()
+
+
+def _forget_after_fork():
+    # The calculator threads of inherited graphs do not exist in a forked child
+    # (e.g. the local chunk pool); set them aside so they are never used, closed
+    # or garbage collected there
+    global _idle, _lock
+    _inherited.append(_idle)
+    _idle = {}
+    _lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_forget_after_fork)
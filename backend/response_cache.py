@@ -0,0 +1,103 @@
+"""
+HTTP caching of analysis results, stats and artifacts.
+
+JSON responses carry a strong ETag, the hash of their exact body, so a
+client revalidating with If-None-Match gets a bodiless 304 when nothing
+changed. Serialized bodies of hot documents are kept in a small in-process
+LRU cache with a time to live: a dashboard reload is answered from memory
+without a database round trip. Entries are dropped when the web process
+changes a document; the time to live bounds how long a change made by a
+worker or another web process can go unseen. Analysis results are the
+exception: every update increments their version, and a cached result is
+only served after reading just that field confirms it is current.
+
+Artifact files are written once under the analysis' own folder and a
+re-classification writes new files next to them, so they are served as
+immutable.
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from flask import Response, request
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries expire ttl seconds after they were set"""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """The value stored for key, or None if it is missing or expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        if self.maxsize <= 0 or self.ttl <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def etag_for(data):
+    """Strong entity tag of a response body or of a version string"""
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    return hashlib.sha256(data).hexdigest()[:32]
+
+
+def not_modified(etag, cache_control=None):
+    """A 304 response if the request's If-None-Match matches etag, otherwise None"""
+    if not request.if_none_match.contains(etag):
+        return None
+    response = Response(status=304)
+    response.set_etag(etag)
+    if cache_control:
+        response.headers['Cache-Control'] = cache_control
+    return response
+
+
+def json_response(body, etag, cache_control='no-cache'):
+    """Response for a serialized JSON body, or 304 when the client's copy is current"""
+    response = not_modified(etag, cache_control)
+    if response is None:
+        response = Response(body, mimetype='application/json')
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = cache_control
+    return response
+
+
+def immutable(response, max_age):
+    """Let clients and shared caches keep a response for max_age seconds without revalidating"""
+    response.cache_control.no_cache = None
+    response.cache_control.public = True
+    response.cache_control.max_age = max_age
+    response.cache_control.immutable = True
+    return response
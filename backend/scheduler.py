@@ -0,0 +1,90 @@
+"""
+Scheduling of analysis tasks.
+
+Videos are routed to a short or a long queue by their probed duration, so a
+backlog of long uploads never sits in front of a single clip; workers
+dedicated to the short queue keep interactive latency low. Within a queue,
+tasks carry a priority. A Redis sorted set per user holds a lease for each
+analysis running for that user; a task over the user's cap goes back to the
+queue instead of holding a worker. Leases expire, so a worker that dies
+mid-analysis cannot lock its user out.
+"""
+
+import time
+import redis
+from config import Config
+
+# Named priorities accepted by /analyze. With the Redis transport lower
+# values are consumed first, in steps of 0, 3, 6 and 9.
+PRIORITIES = {
+    'high': 0,
+    'normal': 3,
+    'low': 6
+}
+
+# Drop expired leases, then take or renew one if the user is under the cap.
+# KEYS[1]: the user's lease set; ARGV: now, cap, lease seconds, task id
+_ACQUIRE_SCRIPT = """
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', tonumber(ARGV[1]) - tonumber(ARGV[3]))
+if redis.call('ZSCORE', KEYS[1], ARGV[4]) or redis.call('ZCARD', KEYS[1]) < tonumber(ARGV[2]) then
+    redis.call('ZADD', KEYS[1], ARGV[1], ARGV[4])
+    redis.call('EXPIRE', KEYS[1], ARGV[3])
+    return 1
+end
+return 0
+"""
+
+_client = None
+_acquire = None
+
+
+def _redis():
+    global _client, _acquire
+    if _client is None:
+        _client = redis.Redis.from_url(Config.SCHEDULER_REDIS_URL)
+        _acquire = _client.register_script(_ACQUIRE_SCRIPT)
+    return _client
+
+
+def _slots_key(user_id):
+    return f"courtiq:analysis_slots:{user_id}"
+
+
+def analysis_queue(duration):
+    """Queue for a video of duration seconds"""
+    if duration <= Config.SHORT_VIDEO_MAX_SECONDS:
+        return Config.ANALYSIS_SHORT_QUEUE
+    return Config.ANALYSIS_LONG_QUEUE
+
+
+def acquire_user_slot(user_id, task_id):
+    """
+    Take one of user_id's concurrent analysis slots for task_id
+
+    Returns False when the user already runs USER_MAX_CONCURRENT_ANALYSES
+    analyses. Anonymous analyses, a cap of 0 and an unreachable Redis do not
+    limit anything.
+    """
+    if not user_id or Config.USER_MAX_CONCURRENT_ANALYSES <= 0:
+        return True
+
+    try:
+        _redis()
+        return bool(_acquire(
+            keys=[_slots_key(user_id)],
+            args=[time.time(), Config.USER_MAX_CONCURRENT_ANALYSES, Config.USER_SLOT_LEASE_SECONDS, task_id]
+        ))
+    except redis.RedisError as e:
+        print(f"Scheduler unavailable, not limiting user {user_id}: {str(e)}")
+        return True
+
+
+def release_user_slot(user_id, task_id):
+    """Give back the slot taken by task_id"""
+    if not user_id or not task_id or Config.USER_MAX_CONCURRENT_ANALYSES <= 0:
+        return
+
+    try:
+        _redis().zrem(_slots_key(user_id), task_id)
+    except redis.RedisError as e:
+        print(f"Scheduler unavailable, could not release slot of user {user_id}: {str(e)}")
@@ -33,7 +33,7 @@ fi
 
 # Start Celery worker in background
 echo "Starting Celery worker..."
-celery -A tasks.celery worker --loglevel=info &
+celery -A tasks.celery worker --loglevel=info -Q analysis.short,analysis.long,celery &
 CELERY_PID=$!
 
 # Start Flask server
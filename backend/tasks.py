@@ -1,15 +1,26 @@
-from celery import Celery
+from celery import Celery, chord, group
+from celery.exceptions import Ignore
+from celery.signals import worker_process_init, worker_process_shutdown
+from kombu import Queue
 import os
 import cv2
-import mediapipe as mp
-import tempfile
-import json
 import numpy as np
 from database import Database
 import uuid
 import shutil
+import time
+import ctypes
+from datetime import datetime, timedelta
 from config import Config
-from pose_analyzer import PoseAnalyzer
+from pose_analyzer import PoseAnalyzer, StreamingDribbleDetector, JUMP_KNEE_ANGLE, SHOOT_ARM_ANGLE
+from pose_pool import pose_config, pose_session, preload, close_all
+from scheduler import PRIORITIES, acquire_user_slot, release_user_slot
+from frame_pipeline import FrameDecoder, InferenceFrameConverter, PoseRoiTracker, SampleFrameWriter, StageQueue, combine_stage_stats, prefetch
+from action_store import (
+    ACTIONS_FILE, LEGACY_ACTIONS_FILE, LANDMARKS_FILE, ActionWriter, ActionSegmentBuilder, LandmarkWriter,
+    concat_actions, concat_landmarks, load_actions, load_landmarks, merge_segments, pack_flag_masks,
+    save_actions, segments_from_columns
+)
 
 def make_celery(app):
     celery = Celery(
@@ -27,189 +38,920 @@ def make_celery(app):
     celery.Task = ContextTask
     return celery
 
+# Frame size used by the motion gate; small enough to make the check nearly free
+MOTION_GATE_SIZE = (64, 36)
+
+# Stored landmark rows classified at a time by reclassify_task
+RECLASSIFY_BLOCK_ROWS = 65536
+
+# Per-frame counters produced by each analyzed frame range
+COUNTER_KEYS = (
+    "frame_count",
+    "analyzed_frames",
+    "motion_skipped_frames",
+    "roi_frames",
+    "pose_frames",
+    "jumping_frames",
+    "shooting_frames",
+    "dribbling_frames"
+)
+
 # Define Celery tasks
 celery = Celery(__name__, broker=Config.CELERY_BROKER_URL, backend=Config.CELERY_RESULT_BACKEND)
+# Reserve one task per worker process at a time, so queue priorities decide what runs next
+celery.conf.worker_prefetch_multiplier = 1
+# Workers started without -Q consume the analysis queues along with the default one
+celery.conf.task_queues = (
+    Queue(celery.conf.task_default_queue),
+    Queue(Config.ANALYSIS_SHORT_QUEUE),
+    Queue(Config.ANALYSIS_LONG_QUEUE)
+)
 
-@celery.task
-def analyze_video_task(video_path, filename):
+@worker_process_init.connect
+def load_pose_model(**kwargs):
+    """Load the default Pose model once per worker process instead of per task"""
+    preload()
+
+@worker_process_shutdown.connect
+def close_pose_models(**kwargs):
+    """Release the worker's MediaPipe graphs on shutdown"""
+    close_all()
+
+class ProgressReporter:
     """
-    Analyze video for pose detection asynchronously with enhanced action detection
+    Publishes analysis progress at most once per interval
+
+    publish receives a dict with the frames done, total_frames, percent,
+    the processing rate over the last interval (fps) and an ETA based on
+    the average rate so far.
     """
-    try:
-        # Initialize MediaPipe Pose
-        mp_pose = mp.solutions.pose
-        pose = mp_pose.Pose(
-            min_detection_confidence=0.7,
-            min_tracking_confidence=0.5
-        )
-        
-        # Open video file
-        cap = cv2.VideoCapture(video_path)
-        
-        # Get video info
-        fps = cap.get(cv2.CAP_PROP_FPS)
-        frame_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-        frame_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-        
-        # Initialize counters
-        frame_count = 0
-        pose_frames = 0
-        jumping_frames = 0
-        shooting_frames = 0
-        dribbling_frames = 0
-        
-        # Create a folder for this analysis with a unique ID
-        analysis_id = str(uuid.uuid4())
-        output_folder = os.path.join(Config.PROCESSED_FOLDER, analysis_id)
-        os.makedirs(output_folder, exist_ok=True)
-        
-        # Store frame timestamps with actions
-        action_timestamps = []
-        sample_frames_paths = []
+    
+    def __init__(self, publish, total_frames, interval=None):
+        self.publish = publish
+        self.total_frames = total_frames
+        self.interval = Config.PROGRESS_INTERVAL if interval is None else interval
+        self.started_at = time.time()
+        self._last_time = self.started_at
+        self._last_frames = 0
+    
+    def update(self, frames_done):
+        """Record the frames done so far, publishing if the interval has passed"""
+        now = time.time()
+        if now - self._last_time < self.interval:
+            return
         
-        # Store landmarks history for dribbling detection
-        landmarks_history = []
+        fps = (frames_done - self._last_frames) / (now - self._last_time)
+        average_fps = frames_done / (now - self.started_at)
+        remaining = max(0, self.total_frames - frames_done)
+        self._last_time = now
+        self._last_frames = frames_done
         
-        # Process frames
-        while cap.isOpened():
-            success, frame = cap.read()
-            if not success:
-                break
-            
-            frame_count += 1
-            timestamp = frame_count / fps  # Current timestamp in seconds
-            
-            # Process the frame with MediaPipe
-            image_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            results = pose.process(image_rgb)
-            
-            # Initialize frame actions
-            frame_actions = {
-                "timestamp": timestamp,
-                "has_pose": False,
-                "is_jumping": False,
-                "is_shooting": False,
-                "is_dribbling": False
-            }
-            
-            if results.pose_landmarks:
-                pose_frames += 1
-                frame_actions["has_pose"] = True
+        self.publish({
+            "frames_done": frames_done,
+            "total_frames": self.total_frames,
+            "percent": round(min(100.0, frames_done / self.total_frames * 100), 1) if self.total_frames > 0 else 0,
+            "fps": round(fps, 1),
+            "eta_seconds": round(remaining / average_fps, 1) if average_fps > 0 else None
+        })
+
+def resolve_analysis_options(options):
+    """
+    Expand an analysis preset into its settings
+
+    Options given explicitly take precedence over the preset's. Raises
+    ValueError for an unknown preset name.
+    """
+    options = dict(options or {})
+    preset = options.get('preset') or Config.DEFAULT_ANALYSIS_PRESET
+    if not preset:
+        return options
+    if preset not in Config.ANALYSIS_PRESETS:
+        raise ValueError(f"Unknown analysis preset: {preset}")
+    
+    return {**Config.ANALYSIS_PRESETS[preset], **options, 'preset': preset}
+
+def _probe_video(video_path):
+    """Return the frame rate and frame count reported by the container"""
+    cap = cv2.VideoCapture(video_path)
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap.release()
+    return fps, total_frames
+
+def video_duration(video_path):
+    """Duration of a video in seconds, from its container metadata"""
+    fps, total_frames = _probe_video(video_path)
+    return total_frames / fps if fps > 0 else 0
+
+def _schedule_options(options):
+    """Routing of the tasks an analysis spawns: the queue and priority it was sent with"""
+    if not options.get('queue'):
+        return {}
+    return {'queue': options['queue'], 'priority': PRIORITIES.get(options.get('priority'))}
+
+def _frame_stride(fps, options):
+    """Only every frame_stride-th frame is decoded and sent to MediaPipe"""
+    # An explicit None (e.g. the accurate preset) analyzes every frame
+    target_fps = options.get('target_fps', Config.ANALYSIS_TARGET_FPS)
+    return max(1, int(round(fps / target_fps))) if target_fps and fps > 0 else 1
+
+def _plan_chunks(total_frames, num_chunks):
+    """
+    Split [0, total_frames) into up to num_chunks contiguous frame ranges
+
+    The last range is open-ended because CAP_PROP_FRAME_COUNT is only an
+    estimate for some containers.
+    """
+    num_chunks = min(num_chunks, total_frames // Config.MIN_CHUNK_FRAMES) if total_frames > 0 else 1
+    if num_chunks <= 1:
+        return [(0, None)]
+    
+    chunk_size = -(-total_frames // num_chunks)
+    starts = list(range(0, total_frames, chunk_size))
+    return [(start, end) for start, end in zip(starts, starts[1:] + [None])]
+
+def _analyze_frame_range(video_path, analysis_id, options, start_frame=0, end_frame=None, warmup_frames=0, progress=None):
+    """
+    Run pose detection over frames [start_frame, end_frame) of a video
+
+    The warmup_frames frames before start_frame are run through MediaPipe and
+    the detectors to prime their tracking state but are not recorded. This
+    fills the dribble window, but MediaPipe does not converge on the tracking
+    state a sequential run has at start_frame: landmarks, and the actions
+    judged from them, can differ from a sequential run until the player is
+    lost and detected afresh. Actions are written to their own file in the
+    analysis folder; returns the counters, the sample frames saved and the
+    actions file name. progress, when given, is called with the number of
+    frames of the range done so far after every analyzed frame.
+    """
+    output_folder = os.path.join(Config.PROCESSED_FOLDER, analysis_id)
+    
+    # Open video file
+    cap = cv2.VideoCapture(video_path)
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    frame_stride = _frame_stride(fps, options)
+    
+    # Seek to the first warmup frame
+    first_frame = max(0, start_frame - warmup_frames)
+    if first_frame > 0:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, first_frame)
+    
+    # Frames that barely differ from the last inferred one skip inference
+    motion_threshold = options.get('motion_threshold', Config.MOTION_THRESHOLD)
+    reference_frame = None
+    last_results = None
+    last_frame_actions = None
+    last_frame_landmarks = None
+    
+    # Decoding and sample frame annotation run on their own threads unless the queue size is 0
+    queue_size = options.get('pipeline_queue_size', Config.PIPELINE_QUEUE_SIZE)
+    decoder = FrameDecoder(
+        cap, first_frame, end_frame, frame_stride,
+        motion_size=MOTION_GATE_SIZE if motion_threshold else None
+    )
+    decode_queue = StageQueue("decode", queue_size) if queue_size else None
+    frames = prefetch(decoder, decode_queue) if decode_queue else iter(decoder)
+    frame_writer = SampleFrameWriter(queue_size)
+    
+    # Inference runs on a downscaled copy; sample frames are still annotated at full resolution
+    to_inference_frame = InferenceFrameConverter(options.get('max_inference_dim', Config.INFERENCE_MAX_DIM))
+    
+    # Optionally crop each frame to the area around the previous frame's pose
+    roi_tracker = None
+    if options.get('roi_tracking', Config.ROI_TRACKING):
+        roi_tracker = PoseRoiTracker(
+            padding=options.get('roi_padding', Config.ROI_PADDING),
+            min_visibility=options.get('roi_min_visibility', Config.ROI_MIN_VISIBILITY)
+        )
+    
+    # Initialize counters
+    counts = dict.fromkeys(COUNTER_KEYS, 0)
+    
+    # Sample frame settings
+    max_sample_frames = options.get('max_sample_frames', Config.MAX_SAMPLE_FRAMES)
+    sample_interval = options.get('sample_interval', Config.SAMPLE_FRAME_INTERVAL)
+    
+    # Stream frame timestamps with actions to this range's actions file
+    actions_file = f"actions_{start_frame}.bin"
+    action_writer = ActionWriter(os.path.join(output_folder, actions_file))
+    sample_frames_paths = []
+    
+    # Stream the landmarks of the same frames, row for row, so they can be re-analyzed later
+    landmarks_file = None
+    landmark_writer = None
+    if options.get('store_landmarks', Config.STORE_LANDMARKS):
+        landmarks_file = f"landmarks_{start_frame}.npy"
+        landmark_writer = LandmarkWriter(os.path.join(output_folder, landmarks_file))
+    
+    # Run-length encode the actions into timeline segments as frames are analyzed
+    frame_duration = frame_stride / fps if fps > 0 else 0
+    segment_builder = ActionSegmentBuilder(
+        frame_duration,
+        max_gap=options.get('segment_max_gap', Config.SEGMENT_MAX_GAP)
+    )
+    
+    # Streaming dribble detector over the wrist heights of recent pose frames
+    dribble_detector = StreamingDribbleDetector(
+        window=Config.DRIBBLE_WINDOW,
+        min_changes=Config.DRIBBLE_MIN_CHANGES
+    )
+    
+    # Process frames
+    try:
+        # Borrow this worker's Pose instance for the configured model, reset for this video
+        with pose_session(pose_config(options)) as pose:
+            for frame_count, frame, motion_frame in frames:
+                timestamp = frame_count / fps  # Current timestamp in seconds
                 
-                # Store landmarks in history (keep last 10 frames for dribbling detection)
-                if len(landmarks_history) >= 10:
-                    landmarks_history.pop(0)
-                landmarks_history.append(results.pose_landmarks.landmark)
+                # Reuse the last inference while the scene is static
+                motion_gated = False
+                if motion_threshold:
+                    # Compare against the last inferred frame so slow drift still triggers inference
+                    motion_gated = reference_frame is not None and \
+                        bool(cv2.absdiff(motion_frame, reference_frame).mean() < motion_threshold)
+                    if not motion_gated:
+                        reference_frame = motion_frame
                 
-                # Detect specific actions
-                if PoseAnalyzer.is_jumping(results.pose_landmarks.landmark):
-                    jumping_frames += 1
-                    frame_actions["is_jumping"] = True
+                if motion_gated:
+                    results = last_results
+                    frame_actions = dict(last_frame_actions, timestamp=timestamp)
+                    frame_landmarks = last_frame_landmarks
+                    if results.pose_landmarks:
+                        # Dribbling is judged over time: the reused pose shows the wrist at rest
+                        frame_actions["is_dribbling"] = dribble_detector.push(results.pose_landmarks.landmark)
+                else:
+                    # Process the frame with MediaPipe
+                    if roi_tracker:
+                        results = roi_tracker.process(pose, frame, to_inference_frame)
+                    else:
+                        results = pose.process(to_inference_frame(frame))
+                    
+                    # Initialize frame actions
+                    frame_actions = {
+                        "timestamp": timestamp,
+                        "has_pose": False,
+                        "is_jumping": False,
+                        "is_shooting": False,
+                        "is_dribbling": False
+                    }
+                    frame_landmarks = None
                     
-                if PoseAnalyzer.is_shooting(results.pose_landmarks.landmark):
-                    shooting_frames += 1
-                    frame_actions["is_shooting"] = True
+                    if results.pose_landmarks:
+                        frame_actions["has_pose"] = True
+                        
+                        # Detect specific actions (one landmark array feeds both classifiers)
+                        frame_landmarks = PoseAnalyzer.landmarks_to_array(results.pose_landmarks.landmark)[np.newaxis]
+                        frame_actions["is_jumping"] = bool(PoseAnalyzer.is_jumping_batch(frame_landmarks)[0])
+                        frame_actions["is_shooting"] = bool(PoseAnalyzer.is_shooting_batch(frame_landmarks)[0])
+                        frame_actions["is_dribbling"] = dribble_detector.push(results.pose_landmarks.landmark)
                     
-                if PoseAnalyzer.is_dribbling(landmarks_history):
-                    dribbling_frames += 1
-                    frame_actions["is_dribbling"] = True
+                    last_results = results
+                    last_frame_actions = frame_actions
+                    last_frame_landmarks = frame_landmarks
                 
-                # Store frame actions
-                action_timestamps.append(frame_actions)
+                # Warmup frames only prime the detectors
+                if frame_count <= start_frame:
+                    continue
                 
-                # Save key action frames (jumping, shooting, dribbling)
-                should_save_frame = frame_actions["is_jumping"] or frame_actions["is_shooting"] or frame_actions["is_dribbling"]
+                if progress:
+                    progress(frame_count - start_frame)
                 
-                # Also save periodic frames (every 60 frames) for general visualization
-                should_save_frame = should_save_frame or (frame_count % 60 == 0)
+                counts["analyzed_frames"] += 1
+                counts["motion_skipped_frames"] += motion_gated
+                counts["roi_frames"] += bool(roi_tracker and not motion_gated and roi_tracker.used_crop)
                 
-                # Only save up to 10 sample frames
-                if should_save_frame and len(sample_frames_paths) < 10:
-                    # Draw pose landmarks
-                    annotated_frame = frame.copy()
-                    mp_drawing = mp.solutions.drawing_utils
-                    mp_drawing.draw_landmarks(
-                        annotated_frame, results.pose_landmarks, mp_pose.POSE_CONNECTIONS)
+                if frame_actions["has_pose"]:
+                    counts["pose_frames"] += 1
+                    counts["jumping_frames"] += frame_actions["is_jumping"]
+                    counts["shooting_frames"] += frame_actions["is_shooting"]
+                    counts["dribbling_frames"] += frame_actions["is_dribbling"]
                     
-                    # Add action labels to the frame
-                    actions_text = []
-                    if frame_actions["is_jumping"]:
-                        actions_text.append("Jumping")
-                    if frame_actions["is_shooting"]:
-                        actions_text.append("Shooting")
-                    if frame_actions["is_dribbling"]:
-                        actions_text.append("Dribbling")
+                    # Store frame actions
+                    action_writer.append(frame_actions)
+                    segment_builder.push(frame_actions)
+                    if landmark_writer is not None:
+                        landmark_writer.append(frame_landmarks[0])
                     
-                    if actions_text:
-                        cv2.putText(
-                            annotated_frame, 
-                            " & ".join(actions_text), 
-                            (10, 30), 
-                            cv2.FONT_HERSHEY_SIMPLEX, 
-                            0.8, 
-                            (0, 255, 0), 
-                            2
-                        )
+                    # Save key action frames (jumping, shooting, dribbling)
+                    should_save_frame = frame_actions["is_jumping"] or frame_actions["is_shooting"] or frame_actions["is_dribbling"]
                     
-                    # Save the frame
-                    output_path = os.path.join(output_folder, f"frame_{frame_count}.jpg")
-                    cv2.imwrite(output_path, annotated_frame)
-                    sample_frames_paths.append(f"/static/processed_images/{analysis_id}/frame_{frame_count}.jpg")
-                
+                    # Also save periodic frames (every 60 frames by default) for general visualization
+                    should_save_frame = should_save_frame or (frame_count % sample_interval < frame_stride)
+                    
+                    # Only save up to 10 sample frames by default
+                    if should_save_frame and len(sample_frames_paths) < max_sample_frames:
+                        output_path = os.path.join(output_folder, f"frame_{frame_count}.jpg")
+                        frame_writer.write(output_path, frame, results.pose_landmarks, frame_actions)
+                        sample_frames_paths.append(f"/static/processed_images/{analysis_id}/frame_{frame_count}.jpg")
+    finally:
+        frames.close()
+        frame_writer.close()
+        action_writer.close()
+        if landmark_writer is not None:
+            landmark_writer.close()
         cap.release()
+    
+    # Every frame read or grabbed inside the range counts towards the total
+    counts["frame_count"] = max(0, decoder.position - start_frame)
+    
+    # Per-stage queue statistics
+    pipeline_stats = {}
+    if decode_queue:
+        pipeline_stats["decode"] = decode_queue.stats()
+    if frame_writer.queue:
+        pipeline_stats["annotate"] = frame_writer.queue.stats()
+    
+    return {
+        "start_frame": start_frame,
+        "counts": counts,
+        "sample_frames": sample_frames_paths,
+        "actions_file": actions_file,
+        "landmarks_file": landmarks_file,
+        "segments": segment_builder.close(),
+        "frame_duration": frame_duration,
+        "pipeline_stats": pipeline_stats
+    }
+
+# Frames done by each range of a local pool analysis, shared with the pool processes
+_chunk_progress = None
+
+def _init_chunk_process(chunk_progress):
+    global _chunk_progress
+    _chunk_progress = chunk_progress
+
+def _analyze_pooled_chunk(index, *args):
+    def progress(frames_done):
+        _chunk_progress[index] = frames_done
+    return _analyze_frame_range(*args, progress=progress)
+
+def _analyze_chunks_locally(video_path, analysis_id, options, chunks, warmup_frames, progress=None):
+    """Analyze frame ranges of one video in a local process pool"""
+    # billiard (unlike multiprocessing) lets daemonic Celery workers fork a pool
+    from billiard import Pool
+    from billiard.sharedctypes import RawArray
+    
+    chunk_progress = RawArray(ctypes.c_int64, len(chunks))
+    with Pool(processes=len(chunks), initializer=_init_chunk_process, initargs=(chunk_progress,)) as pool:
+        result = pool.starmap_async(_analyze_pooled_chunk, [
+            (index, video_path, analysis_id, options, start, end, warmup_frames)
+            for index, (start, end) in enumerate(chunks)
+        ])
         
-        # Save actions data to JSON file
-        actions_file_path = os.path.join(output_folder, "actions.json")
-        with open(actions_file_path, 'w') as f:
-            json.dump(action_timestamps, f)
-        
-        # Calculate percentages
-        pose_percentage = (pose_frames / frame_count) * 100 if frame_count > 0 else 0
-        jumping_percentage = (jumping_frames / pose_frames) * 100 if pose_frames > 0 else 0
-        shooting_percentage = (shooting_frames / pose_frames) * 100 if pose_frames > 0 else 0
-        dribbling_percentage = (dribbling_frames / pose_frames) * 100 if pose_frames > 0 else 0
-        
-        # Calculate video duration in seconds
-        duration = total_frames / fps if fps > 0 else 0
-        
-        # Store results in database
-        result_id = Database.save_analysis_result(
-            filename,
-            frame_count,
-            pose_frames,
-            jumping_frames,
-            shooting_frames,
-            dribbling_frames,
-            duration,
-            f"/static/processed_images/{analysis_id}/actions.json"
-        )
+        # Report the combined progress of the ranges while waiting for them
+        while not result.ready():
+            result.wait(Config.PROGRESS_INTERVAL)
+            if progress:
+                progress(sum(chunk_progress))
         
-        # Return analysis data
-        return {
-            "total_frames": frame_count,
-            "frames_with_pose": pose_frames,
-            "jumping_frames": jumping_frames,
-            "shooting_frames": shooting_frames,
-            "dribbling_frames": dribbling_frames,
-            "pose_percentage": round(pose_percentage, 2),
-            "jumping_percentage": round(jumping_percentage, 2),
-            "shooting_percentage": round(shooting_percentage, 2),
-            "dribbling_percentage": round(dribbling_percentage, 2),
-            "duration": round(duration, 2),
-            "sample_frames": sample_frames_paths,
-            "actions_file": f"/static/processed_images/{analysis_id}/actions.json",
-            "result_id": str(result_id)
-        }
+        return result.get()
+
+def _merge_partials(analysis_id, options, partials):
+    """
+    Combine frame range results into one result shaped like a sequential run's
+
+    Counters are summed, the per-range action and landmark files are
+    concatenated into one file each, segments touching at range boundaries are joined and
+    only the first max_sample_frames sample frames are kept.
+    Returns a dict shaped like a single range's result.
+    """
+    output_folder = os.path.join(Config.PROCESSED_FOLDER, analysis_id)
+    partials = sorted(partials, key=lambda partial: partial["start_frame"])
+    
+    counts = dict.fromkeys(COUNTER_KEYS, 0)
+    for partial in partials:
+        for key in COUNTER_KEYS:
+            counts[key] += partial["counts"][key]
+    
+    # Each range keeps its own first sample frames, so the global first ones are among them
+    sample_frames = [path for partial in partials for path in partial["sample_frames"]]
+    max_sample_frames = options.get('max_sample_frames', Config.MAX_SAMPLE_FRAMES)
+    for path in sample_frames[max_sample_frames:]:
+        os.remove(os.path.join(output_folder, os.path.basename(path)))
+    sample_frames = sample_frames[:max_sample_frames]
+    
+    pipeline_stats = {}
+    for stage in {stage for partial in partials for stage in partial["pipeline_stats"]}:
+        pipeline_stats[stage] = combine_stage_stats([
+            partial["pipeline_stats"][stage] for partial in partials if stage in partial["pipeline_stats"]
+        ])
+    
+    merged = {
+        "counts": counts,
+        "sample_frames": sample_frames,
+        "actions_file": ACTIONS_FILE,
+        "landmarks_file": LANDMARKS_FILE if partials[0]["landmarks_file"] else None,
+        "segments": merge_segments(
+            [partial["segments"] for partial in partials],
+            partials[0]["frame_duration"],
+            max_gap=options.get('segment_max_gap', Config.SEGMENT_MAX_GAP)
+        ),
+        "pipeline_stats": pipeline_stats,
+        "chunks": len(partials)
+    }
+    
+    # Append the rows of each range in order
+    artifacts = [("actions_file", concat_actions)]
+    if merged["landmarks_file"]:
+        artifacts.append(("landmarks_file", concat_landmarks))
+    
+    for key, concat in artifacts:
+        output_path = os.path.join(output_folder, merged[key])
+        part_paths = [os.path.join(output_folder, partial[key]) for partial in partials]
+        if len(part_paths) == 1:
+            os.replace(part_paths[0], output_path)
+            continue
+        
+        concat(output_path, part_paths)
+        for part_path in part_paths:
+            os.remove(part_path)
+    
+    return merged
+
+def _save_analysis(filename, analysis_id, options, fps, total_frames, merged, started_at):
+    """Compute summary statistics, store them and build the task result"""
+    counts = merged["counts"]
+    frame_count = counts["frame_count"]
+    analyzed_frames = counts["analyzed_frames"]
+    pose_frames = counts["pose_frames"]
+    jumping_frames = counts["jumping_frames"]
+    shooting_frames = counts["shooting_frames"]
+    dribbling_frames = counts["dribbling_frames"]
+    frame_stride = _frame_stride(fps, options)
+    
+    # Calculate percentages (from the analyzed frames, so sampling does not skew them)
+    pose_percentage = (pose_frames / analyzed_frames) * 100 if analyzed_frames > 0 else 0
+    jumping_percentage = (jumping_frames / pose_frames) * 100 if pose_frames > 0 else 0
+    shooting_percentage = (shooting_frames / pose_frames) * 100 if pose_frames > 0 else 0
+    dribbling_percentage = (dribbling_frames / pose_frames) * 100 if pose_frames > 0 else 0
+    
+    # Scale sampled counts back to the full frame rate
+    if frame_stride > 1 and analyzed_frames > 0:
+        scale = frame_count / analyzed_frames
+        pose_frames = int(round(pose_frames * scale))
+        jumping_frames = int(round(jumping_frames * scale))
+        shooting_frames = int(round(shooting_frames * scale))
+        dribbling_frames = int(round(dribbling_frames * scale))
+    
+    # Calculate video duration in seconds
+    duration = total_frames / fps if fps > 0 else 0
+    
+    # Measure throughput over the whole task, including queueing of chunks
+    elapsed = max(time.time() - started_at, 1e-6)
+    processing_stats = {
+        "processing_seconds": round(elapsed, 2),
+        "frames_per_second": round(frame_count / elapsed, 2),
+        "inferred_frames_per_second": round((analyzed_frames - counts["motion_skipped_frames"]) / elapsed, 2),
+        "realtime_factor": round(duration / elapsed, 2),
+        # Time from the upload being accepted to the task starting, including waits for a user slot
+        "queue_wait_seconds": round(started_at - options['enqueued_at'], 2) if options.get('enqueued_at') else None,
+        "queue": options.get('queue'),
+        "priority": options.get('priority'),
+        # Frame ranges analyzed separately; actions near their boundaries may differ from a single run
+        "chunks": merged["chunks"]
+    }
+    
+    # actions_file stays the JSON URL older clients fetch; it is rendered from the columnar file
+    actions_url = f"/static/processed_images/{analysis_id}/{LEGACY_ACTIONS_FILE}"
+    actions_data_url = f"/static/processed_images/{analysis_id}/{merged['actions_file']}"
+    landmarks_url = f"/static/processed_images/{analysis_id}/{merged['landmarks_file']}" if merged["landmarks_file"] else ""
+    
+    # Store results in database
+    result_id = Database.save_analysis_result(
+        filename,
+        frame_count,
+        pose_frames,
+        jumping_frames,
+        shooting_frames,
+        dribbling_frames,
+        duration,
+        actions_url,
+        actions_data_file=actions_data_url,
+        landmarks_file=landmarks_url,
+        segments=merged["segments"],
+        segment_max_gap=options.get('segment_max_gap', Config.SEGMENT_MAX_GAP),
+        preset=options.get('preset'),
+        processing_stats=processing_stats,
+        user_id=options.get('user_id')
+    )
+    
+    # Return analysis data
+    summary = {
+        "total_frames": frame_count,
+        "frames_with_pose": pose_frames,
+        "jumping_frames": jumping_frames,
+        "shooting_frames": shooting_frames,
+        "dribbling_frames": dribbling_frames,
+        "pose_percentage": round(pose_percentage, 2),
+        "jumping_percentage": round(jumping_percentage, 2),
+        "shooting_percentage": round(shooting_percentage, 2),
+        "dribbling_percentage": round(dribbling_percentage, 2),
+        "duration": round(duration, 2),
+        "analyzed_frames": analyzed_frames,
+        "frame_stride": frame_stride,
+        "motion_skipped_frames": counts["motion_skipped_frames"],
+        "roi_frames": counts["roi_frames"],
+        "preset": options.get('preset'),
+        "processing_stats": processing_stats,
+        "pipeline_stats": merged["pipeline_stats"],
+        "sample_frames": merged["sample_frames"],
+        "actions_file": actions_url,
+        "actions_data_file": actions_data_url,
+        "landmarks_file": landmarks_url,
+        "segment_count": len(merged["segments"]),
+        "result_id": str(result_id)
+    }
+    
+    # Later uploads of the same video with the same options reuse this result
+    if options.get('cache_entry_id'):
+        Database.complete_video_analysis(options['cache_entry_id'], result_id, summary)
+    
+    return summary
+
+@celery.task(bind=True)
+def analyze_video_task(self, video_path, filename, options=None):
+    """
+    Analyze video for pose detection asynchronously with enhanced action detection
+
+    Supported options:
+        preset: name of an entry in Config.ANALYSIS_PRESETS bundling the
+            settings below; explicit options override the preset's values
+        target_fps: run pose inference at roughly this rate; frames in between
+            are skipped with cap.grab() and counts are scaled back to the full
+            frame rate
+        motion_threshold: mean absolute difference (0-255) of a downscaled
+            grayscale frame against the last inferred frame below which the
+            previous landmarks and action flags are reused; 0 disables it
+        parallel: "local" to split the video into frame ranges analyzed in a
+            process pool on this worker, or "celery" to fan the ranges out to
+            other workers as a chord (the upload folder must be shared).
+            Pose tracking restarts at each range, so action counts can differ
+            from a sequential analysis of the same video
+        chunks: number of frame ranges to split the video into
+        pipeline_queue_size: frames buffered between the decode, inference
+            and annotation stages; 0 runs them all on the task thread
+        model_complexity, min_detection_confidence, min_tracking_confidence:
+            MediaPipe Pose settings, defaulting to the worker config
+        max_inference_dim: longest side, in pixels, of the frames sent to
+            MediaPipe; larger frames are downscaled (0 keeps full resolution)
+        roi_tracking: run inference on a padded crop around the previous
+            frame's pose, falling back to the full frame when confidence drops
+            (roi_padding and roi_min_visibility tune it)
+        max_sample_frames, sample_interval: how many annotated sample frames
+            to save, and the frame interval of the periodic ones
+        segment_max_gap: seconds without an action that still continue its
+            timeline segment
+        store_landmarks: keep every pose frame's landmarks (float16) for
+            later re-analysis
+        cache_entry_id: video cache entry claimed by /analyze, completed with
+            the result or released on failure
+        user_id: owner of the analysis; at most USER_MAX_CONCURRENT_ANALYSES
+            of a user's analyses run at once, the others wait in the queue
+        queue, priority, enqueued_at: where /analyze routed the task and when,
+            to route chunk tasks alike and record the time spent queued
+    """
+    started_at = time.time()
+    user_id = (options or {}).get('user_id')
+    if self.request.id and not acquire_user_slot(user_id, self.request.id):
+        # Let other users' analyses have the worker; the queue wait keeps counting
+        raise self.retry(countdown=Config.USER_SLOT_RETRY_DELAY, max_retries=None)
+    
+    keep_video = False
+    try:
+        options = resolve_analysis_options(options)
+        
+        fps, total_frames = _probe_video(video_path)
+        
+        # Throttled PROGRESS updates for /status (tasks called directly have no id to report under)
+        progress = None
+        if self.request.id:
+            progress = ProgressReporter(
+                lambda meta: self.update_state(state='PROGRESS', meta=meta), total_frames).update
+        
+        # Create a folder for this analysis with a unique ID
+        analysis_id = str(uuid.uuid4())
+        output_folder = os.path.join(Config.PROCESSED_FOLDER, analysis_id)
+        os.makedirs(output_folder, exist_ok=True)
+        
+        parallel = options.get('parallel', Config.ANALYSIS_PARALLEL)
+        chunks = [(0, None)]
+        if parallel:
+            chunks = _plan_chunks(total_frames, options.get('chunks') or Config.ANALYSIS_CHUNKS)
+        
+        # Overlap each range with the frames before it so the dribble window is full at its start
+        warmup_frames = max(Config.CHUNK_OVERLAP_FRAMES, Config.DRIBBLE_WINDOW * _frame_stride(fps, options))
+        
+        if len(chunks) == 1:
+            partials = [_analyze_frame_range(video_path, analysis_id, options, progress=progress)]
+        elif parallel == 'celery':
+            # The user's slot is held until the ranges are merged
+            options = dict(options, slot_task_id=self.request.id)
+            header = group(
+                analyze_chunk_task.s(video_path, analysis_id, options, start, end, warmup_frames).set(**_schedule_options(options))
+                for start, end in chunks
+            )
+            callback = merge_chunks_task.s(video_path, filename, analysis_id, options, fps, total_frames, started_at)
+            callback.on_error(discard_analysis_task.s(video_path, analysis_id, options.get('cache_entry_id'),
+                                                      user_id, self.request.id))
+            
+            # Each range reports progress under its own id; /status combines them
+            chunk_task_ids = [result.id for result in header.freeze().results]
+            if self.request.id:
+                self.update_state(state='PROGRESS', meta={
+                    "frames_done": 0,
+                    "total_frames": total_frames,
+                    "percent": 0,
+                    "fps": 0,
+                    "eta_seconds": None,
+                    "chunk_task_ids": chunk_task_ids
+                })
+            
+            # The merge callback deletes the video once every range is done
+            keep_video = True
+            return self.replace(chord(header, callback))
+        else:
+            partials = _analyze_chunks_locally(video_path, analysis_id, options, chunks, warmup_frames, progress)
+        
+        merged = _merge_partials(analysis_id, options, partials)
+        return _save_analysis(filename, analysis_id, options, fps, total_frames, merged, started_at)
+    
+    except Ignore:
+        # Replaced by the chunk chord
+        raise
     
     except Exception as e:
         print(f"Error analyzing video: {str(e)}")
         # Clean up
         if os.path.exists(video_path):
             os.remove(video_path)
+        if (options or {}).get('cache_entry_id'):
+            Database.release_video_analysis(options['cache_entry_id'])
         raise e
     
     finally:
         # Clean up the temporary file
+        if not keep_video:
+            if os.path.exists(video_path):
+                os.remove(video_path)
+            release_user_slot(user_id, self.request.id)
+
+@celery.task(bind=True)
+def analyze_chunk_task(self, video_path, analysis_id, options, start_frame, end_frame, warmup_frames):
+    """Analyze one frame range of a video split by analyze_video_task"""
+    reporter = ProgressReporter(
+        lambda meta: self.update_state(state='PROGRESS', meta=meta),
+        (end_frame or _probe_video(video_path)[1]) - start_frame
+    )
+    return _analyze_frame_range(video_path, analysis_id, options, start_frame, end_frame, warmup_frames,
+                                progress=reporter.update)
+
+@celery.task
+def merge_chunks_task(partials, video_path, filename, analysis_id, options, fps, total_frames, started_at):
+    """Merge the frame range results of a chunked analysis and store them"""
+    try:
+        merged = _merge_partials(analysis_id, options, partials)
+        return _save_analysis(filename, analysis_id, options, fps, total_frames, merged, started_at)
+    finally:
         if os.path.exists(video_path):
             os.remove(video_path)
+        release_user_slot(options.get('user_id'), options.get('slot_task_id'))
+
+@celery.task
+def discard_analysis_task(request, exc, traceback, video_path, analysis_id, cache_entry_id=None,
+                          user_id=None, slot_task_id=None):
+    """Error callback of a chunked analysis: remove the video and partial output"""
+    print(f"Error analyzing video: {str(exc)}")
+    if os.path.exists(video_path):
+        os.remove(video_path)
+    if cache_entry_id:
+        Database.release_video_analysis(cache_entry_id)
+    release_user_slot(user_id, slot_task_id)
+    shutil.rmtree(os.path.join(Config.PROCESSED_FOLDER, analysis_id), ignore_errors=True)
+
+def _artifact_path(url):
+    """Local path of an analysis artifact from its /static/processed_images URL"""
+    analysis_id, name = url.split('/')[-2:]
+    return os.path.join(Config.PROCESSED_FOLDER, analysis_id, name)
+
+@celery.task
+def reclassify_task(result_id, thresholds=None):
+    """
+    Rerun action detection on the landmarks stored by an earlier analysis
+
+    Supported thresholds (defaults are the ones used during analysis):
+        knee_angle: knees bent below this angle count towards a jump
+        arm_angle: elbow angles above this count as a straight shooting arm
+        dribble_window, dribble_min_changes: wrist direction changes needed
+            within a window of pose frames to count as dribbling
+
+    Actions whose thresholds are not overridden keep the flags of the
+    original analysis, so reclassifying without overrides reproduces it:
+    landmarks are stored as float16, which loses wrist movements too small
+    for the dribble detector to be judged the same way again. Counts,
+    percentages and segments of the result are replaced, and a new actions
+    file is written next to the original one.
+    """
+    thresholds = thresholds or {}
+    started_at = time.time()
+    try:
+        result = Database.get_analysis_result(result_id)
+        if not result:
+            raise ValueError(f"Analysis result {result_id} not found")
+        if not result.get('landmarks_file'):
+            raise ValueError(f"Analysis result {result_id} has no stored landmarks")
+        
+        landmarks = load_landmarks(_artifact_path(result['landmarks_file']))
+        # The flags of the analysis itself, not of an earlier re-classification
+        analysis_id = result['actions_data_file'].split('/')[-2]
+        columns = load_actions(os.path.join(Config.PROCESSED_FOLDER, analysis_id, ACTIONS_FILE))
+        num_rows = len(landmarks)
+        
+        masks = {
+            "has_pose": columns.mask("has_pose"),
+            "is_jumping": columns.mask("is_jumping"),
+            "is_shooting": columns.mask("is_shooting"),
+            "is_dribbling": columns.mask("is_dribbling")
+        }
+        
+        # Jumping and shooting are per-frame; classify in blocks to bound memory
+        if 'knee_angle' in thresholds or 'arm_angle' in thresholds:
+            jumping = np.zeros(num_rows, dtype=bool)
+            shooting = np.zeros(num_rows, dtype=bool)
+            for start in range(0, num_rows, RECLASSIFY_BLOCK_ROWS):
+                block = np.asarray(landmarks[start:start + RECLASSIFY_BLOCK_ROWS], dtype=np.float32)
+                jumping[start:start + len(block)] = PoseAnalyzer.is_jumping_batch(
+                    block, knee_angle=thresholds.get('knee_angle', JUMP_KNEE_ANGLE))
+                shooting[start:start + len(block)] = PoseAnalyzer.is_shooting_batch(
+                    block, arm_angle=thresholds.get('arm_angle', SHOOT_ARM_ANGLE))
+            if 'knee_angle' in thresholds:
+                masks["is_jumping"] = jumping
+            if 'arm_angle' in thresholds:
+                masks["is_shooting"] = shooting
+        
+        # Motion-gated frames repeat the previous row, as the detector saw them during analysis
+        if 'dribble_window' in thresholds or 'dribble_min_changes' in thresholds:
+            masks["is_dribbling"] = PoseAnalyzer.is_dribbling_batch(
+                landmarks,
+                window=thresholds.get('dribble_window', Config.DRIBBLE_WINDOW),
+                min_changes=thresholds.get('dribble_min_changes', Config.DRIBBLE_MIN_CHANGES)
+            )
+        
+        # Write the new flags under a new name so cached copies of the old file stay valid
+        actions_name = f"actions_{uuid.uuid4().hex[:8]}"
+        save_actions(
+            os.path.join(Config.PROCESSED_FOLDER, analysis_id, f"{actions_name}.bin"),
+            columns.timestamps,
+            pack_flag_masks(masks)
+        )
+        
+        # Rebuild the timeline with the frame spacing of the original analysis
+        timestamps = np.asarray(columns.timestamps, dtype=np.float64)
+        frame_duration = float(np.median(np.diff(timestamps))) if num_rows > 1 else 0
+        max_gap = result.get('segment_max_gap')
+        segments = segments_from_columns(timestamps, masks, frame_duration,
+                                         max_gap=Config.SEGMENT_MAX_GAP if max_gap is None else max_gap)
+        
+        # Stored counts were scaled to the full frame rate when frames were sampled
+        pose_frames = result['frames_with_pose']
+        scale = pose_frames / num_rows if num_rows else 0
+        jumping_frames = int(round(masks["is_jumping"].sum() * scale))
+        shooting_frames = int(round(masks["is_shooting"].sum() * scale))
+        dribbling_frames = int(round(masks["is_dribbling"].sum() * scale))
+        
+        Database.update_analysis_result(result_id, {
+            'jumping_frames': jumping_frames,
+            'shooting_frames': shooting_frames,
+            'dribbling_frames': dribbling_frames,
+            'jumping_percentage': jumping_frames / pose_frames if pose_frames > 0 else 0,
+            'shooting_percentage': shooting_frames / pose_frames if pose_frames > 0 else 0,
+            'dribbling_percentage': dribbling_frames / pose_frames if pose_frames > 0 else 0,
+            'actions_file': f"/static/processed_images/{analysis_id}/{actions_name}.json",
+            'actions_data_file': f"/static/processed_images/{analysis_id}/{actions_name}.bin",
+            'segments': segments,
+            'thresholds': thresholds,
+            'reclassified_at': datetime.utcnow()
+        })
+        
+        # Earlier re-classifications are superseded; the original analysis output is kept
+        previous_file = os.path.basename(result['actions_data_file'])
+        if previous_file != ACTIONS_FILE:
+            try:
+                os.remove(_artifact_path(result['actions_data_file']))
+            except FileNotFoundError:
+                pass
+        
+        return {
+            "result_id": result_id,
+            "frames_with_pose": pose_frames,
+            "jumping_frames": jumping_frames,
+            "shooting_frames": shooting_frames,
+            "dribbling_frames": dribbling_frames,
+            "segment_count": len(segments),
+            "thresholds": thresholds,
+            "processing_seconds": round(time.time() - started_at, 2)
+        }
+    
+    except Exception as e:
+        print(f"Error reclassifying result {result_id}: {str(e)}")
+        raise
+
+# Fields of an analysis summary that are summed over a batch
+BATCH_SUM_KEYS = (
+    "total_frames",
+    "frames_with_pose",
+    "jumping_frames",
+    "shooting_frames",
+    "dribbling_frames",
+    "duration"
+)
+
+def batch_item_counts(summary):
+    """The fields of an analysis summary kept on its batch item"""
+    return {key: summary.get(key, 0) for key in BATCH_SUM_KEYS}
+
+def _aggregate_batch(items):
+    """Combined action counts and duration of the finished analyses of a batch"""
+    done = [item for item in items if item['status'] == 'done']
+    aggregate = {key: sum(item['counts'][key] for item in done) for key in BATCH_SUM_KEYS}
+    
+    pose_frames = aggregate["frames_with_pose"]
+    aggregate.update({
+        "videos": len(done),
+        "failed_videos": sum(item['status'] == 'failed' for item in items),
+        "duration": round(aggregate["duration"], 2),
+        "pose_percentage": round(pose_frames / aggregate["total_frames"] * 100, 2) if aggregate["total_frames"] > 0 else 0,
+        "jumping_percentage": round(aggregate["jumping_frames"] / pose_frames * 100, 2) if pose_frames > 0 else 0,
+        "shooting_percentage": round(aggregate["shooting_frames"] / pose_frames * 100, 2) if pose_frames > 0 else 0,
+        "dribbling_percentage": round(aggregate["dribbling_frames"] / pose_frames * 100, 2) if pose_frames > 0 else 0
+    })
+    return aggregate
+
+def _collect_batch(batch_id, results=None):
+    """
+    Settle the items of a batch and store its aggregate once all are finished
+
+    results maps task ids to the summaries returned by the batch chord;
+    other items are looked up by task id, which covers videos deduplicated
+    against analyses running outside the batch. Returns whether the batch
+    is complete.
+    """
+    batch = Database.get_analysis_batch(batch_id)
+    if batch is None:
+        return True
+    
+    timed_out = batch['created_at'] < datetime.utcnow() - timedelta(seconds=Config.VIDEO_CACHE_PENDING_TIMEOUT)
+    items = batch['items']
+    for item in items:
+        if item['status'] != 'processing':
+            continue
+        
+        summary = (results or {}).get(item['task_id'])
+        if summary is None:
+            task = analyze_video_task.AsyncResult(item['task_id'])
+            if task.state == 'SUCCESS':
+                summary = task.result
+            elif task.state == 'FAILURE':
+                item.update(status='failed', error=str(task.result))
+                continue
+            else:
+                # Results of deduplicated uploads outlive the task result in the broker
+                entry = Database.get_video_analysis_by_task(item['task_id'])
+                if entry is not None:
+                    summary = entry['summary']
+                elif timed_out:
+                    item.update(status='failed', error="Analysis did not finish")
+                    continue
+                else:
+                    continue
+        
+        item.update(status='done', result_id=summary['result_id'], counts=batch_item_counts(summary))
+    
+    finished = all(item['status'] != 'processing' for item in items)
+    fields = {'items': items}
+    if finished:
+        failed = sum(item['status'] == 'failed' for item in items)
+        fields.update({
+            'status': 'completed' if not failed else 'failed' if failed == len(items) else 'partial',
+            'aggregate': _aggregate_batch(items),
+            'completed_at': datetime.utcnow()
+        })
+    Database.update_analysis_batch(batch_id, fields)
+    return finished
+
+@celery.task
+def aggregate_batch_task(results, batch_id, task_ids):
+    """Chord callback of a batch: store the combined counts of its analyses"""
+    if not _collect_batch(batch_id, dict(zip(task_ids, results))):
+        # Some videos are duplicates of analyses still running outside the batch
+        collect_batch_task.apply_async((batch_id,), countdown=Config.BATCH_POLL_INTERVAL)
+
+@celery.task(bind=True, max_retries=None)
+def collect_batch_task(self, batch_id):
+    """Wait for the analyses of a batch that are not part of its chord, then aggregate"""
+    if not _collect_batch(batch_id):
+        raise self.retry(countdown=Config.BATCH_POLL_INTERVAL)
+
+@celery.task
+def batch_failed_task(request, exc, traceback, batch_id):
+    """Error callback of a batch chord: aggregate the other videos once they finish"""
+    print(f"Error analyzing batch {batch_id}: {str(exc)}")
+    collect_batch_task.delay(batch_id)
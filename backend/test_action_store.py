@@ -0,0 +1,189 @@
+import unittest
+import json
+import os
+import tempfile
+from unittest import mock
+import numpy as np
+import action_store
+from action_store import (ActionWriter, ActionSegmentBuilder, LandmarkWriter, load_actions, load_landmarks,
+                          concat_actions, concat_landmarks, iter_actions_json, merge_segments,
+                          pack_flag_masks, save_actions, segments_from_columns)
+
+def make_actions(count, offset=0):
+    return [{
+        "timestamp": (offset + i) / 30,
+        "has_pose": True,
+        "is_jumping": i % 3 == 0,
+        "is_shooting": i % 5 == 0,
+        "is_dribbling": i % 2 == 0
+    } for i in range(count)]
+
+class ActionStoreTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def write(self, name, actions):
+        path = os.path.join(self.tmp.name, name)
+        writer = ActionWriter(path)
+        for frame_actions in actions:
+            writer.append(frame_actions)
+        writer.close()
+        return path
+
+    def test_round_trip(self):
+        """Test rows written are read back as columns and as legacy JSON."""
+        actions = make_actions(100)
+        path = self.write("actions.bin", actions)
+
+        columns = load_actions(path)
+        self.assertEqual(len(columns), 100)
+        self.assertEqual(columns.timestamps.dtype, np.float32)
+        np.testing.assert_array_equal(columns.mask("is_jumping"), [a["is_jumping"] for a in actions])
+        # One float32 and one flag byte per row after the header
+        self.assertEqual(os.path.getsize(path), 16 + 100 * 5)
+
+        rendered = json.loads("".join(iter_actions_json(path, batch_size=7)))
+        self.assertEqual(len(rendered), 100)
+        for expected, row in zip(actions, rendered):
+            self.assertAlmostEqual(row.pop("timestamp"), expected.pop("timestamp"), places=5)
+            self.assertEqual(row, expected)
+
+    def test_empty(self):
+        """Test a file without rows renders as an empty list."""
+        path = self.write("actions.bin", [])
+        self.assertEqual(len(load_actions(path)), 0)
+        self.assertEqual(json.loads("".join(iter_actions_json(path))), [])
+
+    def test_concat(self):
+        """Test concatenated files keep the rows of each part in order."""
+        first = make_actions(10)
+        second = make_actions(15, offset=10)
+        output_path = os.path.join(self.tmp.name, "actions.bin")
+        concat_actions(output_path, [self.write("a.bin", first), self.write("b.bin", second)])
+
+        columns = load_actions(output_path)
+        np.testing.assert_allclose(columns.timestamps, [a["timestamp"] for a in first + second], rtol=1e-6)
+        np.testing.assert_array_equal(columns.mask("is_shooting"), [a["is_shooting"] for a in first + second])
+
+    def test_concat_in_blocks(self):
+        """Test parts are copied in blocks that need not end on a row or a column."""
+        first = make_actions(37)
+        second = make_actions(41, offset=37)
+        output_path = os.path.join(self.tmp.name, "actions.bin")
+        with mock.patch.object(action_store, 'COPY_BLOCK_SIZE', 10):
+            concat_actions(output_path, [self.write("a.bin", first), self.write("b.bin", second)])
+
+        columns = load_actions(output_path)
+        np.testing.assert_allclose(columns.timestamps, [a["timestamp"] for a in first + second], rtol=1e-6)
+        np.testing.assert_array_equal(columns.mask("is_jumping"), [a["is_jumping"] for a in first + second])
+
+    def test_save_columns(self):
+        """Test whole columns written at once read back like streamed rows."""
+        actions = make_actions(50)
+        masks = {name: np.array([a[name] for a in actions]) for name in actions[0] if name != "timestamp"}
+        path = os.path.join(self.tmp.name, "actions.bin")
+        save_actions(path, [a["timestamp"] for a in actions], pack_flag_masks(masks))
+
+        streamed = load_actions(self.write("streamed.bin", actions))
+        saved = load_actions(path)
+        np.testing.assert_array_equal(saved.timestamps, streamed.timestamps)
+        np.testing.assert_array_equal(saved.flags, streamed.flags)
+
+    def test_rejects_other_files(self):
+        """Test files without the actions header are rejected."""
+        path = os.path.join(self.tmp.name, "actions.json")
+        with open(path, "w") as f:
+            f.write("[" + " " * 32 + "]")
+        with self.assertRaises(ValueError):
+            load_actions(path)
+
+class LandmarkStoreTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.frames = np.random.default_rng(3).random((20, 33, 4), dtype=np.float32)
+
+    def write(self, name, frames):
+        path = os.path.join(self.tmp.name, name)
+        writer = LandmarkWriter(path)
+        for frame in frames:
+            writer.append(frame)
+        writer.close()
+        return path
+
+    def test_round_trip(self):
+        """Test streamed rows load back as a memory-mapped float16 array."""
+        landmarks = load_landmarks(self.write("landmarks.npy", self.frames))
+        self.assertIsInstance(landmarks, np.memmap)
+        self.assertEqual(landmarks.shape, (20, 33, 4))
+        self.assertEqual(landmarks.dtype, np.float16)
+        np.testing.assert_allclose(landmarks, self.frames, atol=1e-3)
+
+    def test_concat(self):
+        """Test concatenated files keep the rows of each part in order, including empty parts."""
+        output_path = os.path.join(self.tmp.name, "landmarks.npy")
+        concat_landmarks(output_path, [
+            self.write("a.npy", self.frames[:8]),
+            self.write("b.npy", []),
+            self.write("c.npy", self.frames[8:])
+        ])
+        np.testing.assert_allclose(np.load(output_path), self.frames, atol=1e-3)
+
+    def test_concat_in_blocks(self):
+        """Test parts are copied in blocks that need not end on a row."""
+        output_path = os.path.join(self.tmp.name, "landmarks.npy")
+        with mock.patch.object(action_store, 'COPY_BLOCK_SIZE', 100):
+            concat_landmarks(output_path, [self.write("a.npy", self.frames[:7]), self.write("b.npy", self.frames[7:])])
+        np.testing.assert_allclose(np.load(output_path), self.frames, atol=1e-3)
+
+class ActionSegmentTestCase(unittest.TestCase):
+    def frames(self, dribbling, offset=0):
+        return [{
+            "timestamp": (offset + i) / 10,
+            "has_pose": True,
+            "is_jumping": False,
+            "is_shooting": i == 4,
+            "is_dribbling": flag
+        } for i, flag in enumerate(dribbling)]
+
+    def build(self, frames, max_gap=0.0):
+        builder = ActionSegmentBuilder(0.1, max_gap=max_gap)
+        for frame_actions in frames:
+            builder.push(frame_actions)
+        return builder.close()
+
+    def test_runs(self):
+        """Test consecutive detections become one segment ending a frame after the last."""
+        segments = self.build(self.frames([True, True, False, True, True, True]))
+        self.assertEqual(segments, [
+            [0.0, 0.2, "dribbling"],
+            [0.3, 0.6, "dribbling"],
+            [0.4, 0.5, "shooting"]
+        ])
+
+    def test_short_gaps_are_bridged(self):
+        """Test a gap shorter than max_gap does not split a segment."""
+        segments = self.build(self.frames([True, False, True, False, False, False, True]), max_gap=0.15)
+        dribbling = [segment for segment in segments if segment[2] == "dribbling"]
+        self.assertEqual(dribbling, [[0.0, 0.3, "dribbling"], [0.6, 0.7, "dribbling"]])
+
+    def test_from_columns_matches_builder(self):
+        """Test segments built from whole columns match the incremental builder."""
+        frames = self.frames([True, True, False, True, False, False, True, True, False, True])
+        masks = {flag: np.array([f[flag] for f in frames]) for flag in ("is_jumping", "is_shooting", "is_dribbling")}
+        timestamps = [f["timestamp"] for f in frames]
+        for max_gap in (0.0, 0.15):
+            self.assertEqual(segments_from_columns(timestamps, masks, 0.1, max_gap=max_gap),
+                             self.build(frames, max_gap=max_gap))
+
+    def test_merge_across_ranges(self):
+        """Test segments of consecutive ranges match a single pass over all frames."""
+        flags = [True, True, False, True, True, True, True, False]
+        frames = self.frames(flags)
+        whole = self.build(frames)
+        parts = [self.build(frames[:5]), self.build(frames[5:])]
+        self.assertEqual(merge_segments(parts, 0.1), whole)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,564 @@
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from io import BytesIO
+from types import SimpleNamespace
+from unittest import mock
+import app as app_module
+import database
+import tasks
+from app import app
+from database import Database, search_tokens
+
+try:
+    import mongomock
+except ImportError:
+    mongomock = None
+
+class FrozenDatetime(datetime):
+    """datetime whose utcnow() is set by the test"""
+    current = datetime(2026, 3, 2, 12, 0)
+
+    @classmethod
+    def utcnow(cls):
+        return cls.current
+
+@unittest.skipUnless(mongomock, "mongomock is not installed")
+class DatabaseTestCase(unittest.TestCase):
+    """Runs Database against an in-memory MongoDB"""
+
+    def setUp(self):
+        for patcher in (
+            mock.patch.object(database, 'db', mongomock.MongoClient().get_database('courtiq')),
+            mock.patch.object(database, 'datetime', FrozenDatetime),
+            mock.patch.object(FrozenDatetime, 'current', datetime(2026, 3, 2, 12, 0)),
+            mock.patch.object(Database, 'is_connected', return_value=True)
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        Database.init_db()
+        self.db = database.db
+
+    def save(self, video_name="clip.mp4", created_at=None, user_id=None, total_frames=100, **counts):
+        """Store an analysis result created at created_at; returns its id"""
+        if created_at is not None:
+            FrozenDatetime.current = created_at
+        return Database.save_analysis_result(
+            video_name, total_frames, counts.pop('frames_with_pose', 80), duration=counts.pop('duration', 10.0),
+            user_id=user_id, **counts)
+
+class VideoCacheTestCase(DatabaseTestCase):
+    def test_claim_complete_and_reuse(self):
+        """Test the first claim of a video wins and later claims get the pending, then completed, entry."""
+        entry, claimed = Database.claim_video_analysis("hash", "{}", "task-1")
+        self.assertTrue(claimed)
+
+        pending, claimed = Database.claim_video_analysis("hash", "{}", "task-2")
+        self.assertFalse(claimed)
+        self.assertEqual((pending['status'], pending['task_id']), ('pending', 'task-1'))
+
+        # Other options are another analysis
+        self.assertTrue(Database.claim_video_analysis("hash", '{"preset": "fast"}', "task-3")[1])
+
+        result_id = self.save()
+        Database.complete_video_analysis(str(entry['_id']), str(result_id), {"total_frames": 100})
+        done, claimed = Database.claim_video_analysis("hash", "{}", "task-4")
+        self.assertFalse(claimed)
+        self.assertEqual((done['status'], done['result_id'], done['summary']), ('done', result_id, {"total_frames": 100}))
+        self.assertEqual(Database.get_video_analysis_by_task("task-1")['result_id'], result_id)
+
+        # Deleting the result lets the video be analyzed again
+        Database.delete_analysis_result(str(result_id))
+        self.assertTrue(Database.claim_video_analysis("hash", "{}", "task-5")[1])
+
+    def test_release_and_stale_claims(self):
+        """Test released and long-pending claims can be taken over."""
+        entry, _ = Database.claim_video_analysis("hash", "{}", "task-1")
+        Database.release_video_analysis(str(entry['_id']))
+        entry, claimed = Database.claim_video_analysis("hash", "{}", "task-2")
+        self.assertTrue(claimed)
+
+        FrozenDatetime.current += timedelta(seconds=database.Config.VIDEO_CACHE_PENDING_TIMEOUT - 1)
+        self.assertFalse(Database.claim_video_analysis("hash", "{}", "task-3")[1])
+        FrozenDatetime.current += timedelta(seconds=2)
+        entry, claimed = Database.claim_video_analysis("hash", "{}", "task-4")
+        self.assertTrue(claimed)
+        self.assertEqual(self.db.video_cache.count_documents({}), 1)
+
+    def test_scoped_by_user(self):
+        """Test users never get each other's analysis of the same video."""
+        alice, claimed = Database.claim_video_analysis("hash", "{}", "task-1", "alice")
+        self.assertTrue(claimed)
+        self.assertTrue(Database.claim_video_analysis("hash", "{}", "task-2", "bob")[1])
+        self.assertTrue(Database.claim_video_analysis("hash", "{}", "task-3")[1])
+
+        Database.complete_video_analysis(str(alice['_id']), str(self.save(user_id="alice")), {})
+        entry, claimed = Database.claim_video_analysis("hash", "{}", "task-4", "alice")
+        self.assertEqual((claimed, entry['task_id']), (False, "task-1"))
+        self.assertEqual(Database.claim_video_analysis("hash", "{}", "task-5", "bob")[0]['task_id'], "task-2")
+
+    def test_unscoped_entries_dropped(self):
+        """Test init_db replaces the cache index that ignored users, with the entries written under it."""
+        self.db.video_cache.drop_indexes()
+        self.db.video_cache.create_index([("video_hash", 1), ("options_key", 1)], unique=True)
+        self.db.video_cache.insert_one({'video_hash': "hash", 'options_key': "{}", 'status': 'done', 'task_id': "task-1"})
+
+        Database.init_db()
+        self.assertNotIn("video_hash_1_options_key_1", self.db.video_cache.index_information())
+        self.assertEqual(self.db.video_cache.count_documents({}), 0)
+        self.assertTrue(Database.claim_video_analysis("hash", "{}", "task-2", "bob")[1])
+
+class QueueFailureTestCase(DatabaseTestCase):
+    """Uploads whose analysis could not be queued"""
+
+    def setUp(self):
+        super().setUp()
+        self.upload_folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.upload_folder)
+        patcher = mock.patch.dict(app.config, UPLOAD_FOLDER=self.upload_folder)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = app.test_client()
+
+    def analyze(self):
+        return self.client.post('/analyze', data={'video': (BytesIO(b"same video"), 'clip.mp4'), 'user_id': "alice"},
+                                content_type='multipart/form-data')
+
+    def test_broker_down(self):
+        """Test a failed publish releases the video's cache claim and deletes the upload."""
+        with mock.patch.object(app_module.analyze_video_task, 'apply_async', side_effect=ConnectionError("broker down")):
+            self.assertEqual(self.analyze().status_code, 500)
+        self.assertEqual(os.listdir(self.upload_folder), [])
+        self.assertEqual(self.db.video_cache.count_documents({}), 0)
+
+        # The next upload of the video is analyzed instead of pointing at the lost task
+        with mock.patch.object(app_module.analyze_video_task, 'apply_async', return_value=SimpleNamespace(id="task-2")):
+            response = self.analyze()
+        self.assertEqual(response.get_json()["message"], "Video uploaded and being processed")
+        self.assertEqual(self.db.video_cache.count_documents({'status': 'pending'}), 1)
+
+    def test_probe_fails(self):
+        """Test a failure while routing the analysis releases the claim as well."""
+        with mock.patch.object(app_module, 'video_duration', side_effect=OSError("unreadable")):
+            self.assertEqual(self.analyze().status_code, 500)
+        self.assertEqual(os.listdir(self.upload_folder), [])
+        self.assertEqual(self.db.video_cache.count_documents({}), 0)
+
+    def test_batch_not_queued(self):
+        """Test a batch whose chord could not be published releases every video it claimed."""
+        data = {
+            'videos': [(BytesIO(b"first video"), 'one.mp4'), (BytesIO(b"second video"), 'two.mp4')],
+            'user_id': "alice"
+        }
+        with mock.patch.object(app_module, 'chord') as chord:
+            chord.return_value.apply_async.side_effect = ConnectionError("broker down")
+            response = self.client.post('/analyze/batch', data=data, content_type='multipart/form-data')
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(os.listdir(self.upload_folder), [])
+        self.assertEqual(self.db.video_cache.count_documents({}), 0)
+        self.assertEqual(self.db.analysis_batches.find_one()['status'], 'failed')
+
+def summary(result_id, total_frames, frames_with_pose, dribbling_frames=0, duration=1.0):
+    """Analysis task result of a batch video"""
+    return {
+        "result_id": result_id,
+        "total_frames": total_frames,
+        "frames_with_pose": frames_with_pose,
+        "jumping_frames": 0,
+        "shooting_frames": 0,
+        "dribbling_frames": dribbling_frames,
+        "duration": duration
+    }
+
+class BatchAggregateTestCase(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        for patcher in (
+            mock.patch.object(tasks, 'datetime', FrozenDatetime),
+            mock.patch.object(tasks.analyze_video_task, 'AsyncResult', side_effect=lambda task_id: self.tasks[task_id]),
+            mock.patch.object(tasks.collect_batch_task, 'apply_async'),
+            mock.patch.object(tasks.collect_batch_task, 'delay')
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        pending = SimpleNamespace(state='PENDING')
+        self.tasks = {
+            'task-chord': pending,
+            'task-failed': SimpleNamespace(state='FAILURE', result=RuntimeError("corrupt video")),
+            'task-elsewhere': pending,
+            'task-running': pending
+        }
+        # A video analyzed outside the batch before it was submitted
+        cached = {'task_id': 'task-cached', 'status': 'done', 'cached': True,
+                  'counts': tasks.batch_item_counts(summary('r-cached', 100, 50, dribbling_frames=10, duration=4.0))}
+        # A video deduplicated against an analysis that was still running
+        entry, _ = Database.claim_video_analysis("hash", "{}", 'task-elsewhere')
+        self.elsewhere_id = str(self.save())
+        Database.complete_video_analysis(str(entry['_id']), self.elsewhere_id,
+                                         summary(self.elsewhere_id, 300, 150, duration=10.0))
+
+        self.batch_id = str(Database.create_analysis_batch({}))
+        Database.update_analysis_batch(self.batch_id, {'items': [
+            {'task_id': task_id, 'status': 'processing', 'cached': False}
+            for task_id in ('task-chord', 'task-failed', 'task-elsewhere', 'task-running')
+        ] + [cached]})
+
+    def items(self):
+        return {item['task_id']: item for item in Database.get_analysis_batch(self.batch_id)['items']}
+
+    def test_chord_results_matched_by_task_id(self):
+        """Test the chord's summaries settle their items and the batch waits for a video analyzed elsewhere."""
+        tasks.aggregate_batch_task([summary('r-chord', 200, 100, dribbling_frames=30, duration=6.123)],
+                                   self.batch_id, ['task-chord'])
+        items = self.items()
+        self.assertEqual((items['task-chord']['status'], items['task-chord']['result_id']), ('done', 'r-chord'))
+        self.assertEqual(items['task-chord']['counts']['dribbling_frames'], 30)
+        self.assertEqual((items['task-failed']['status'], items['task-failed']['error']), ('failed', "corrupt video"))
+        self.assertEqual(items['task-elsewhere']['result_id'], self.elsewhere_id)
+        self.assertEqual(items['task-running']['status'], 'processing')
+        self.assertEqual(Database.get_analysis_batch(self.batch_id)['status'], 'processing')
+        tasks.collect_batch_task.apply_async.assert_called_once_with(
+            (self.batch_id,), countdown=tasks.Config.BATCH_POLL_INTERVAL)
+
+        self.tasks['task-running'] = SimpleNamespace(
+            state='SUCCESS', result=summary('r-running', 400, 100, dribbling_frames=20, duration=2.0))
+        self.assertTrue(tasks._collect_batch(self.batch_id))
+        batch = Database.get_analysis_batch(self.batch_id)
+        self.assertEqual(batch['status'], 'partial')
+        self.assertEqual(batch['aggregate'], {
+            "total_frames": 1000,
+            "frames_with_pose": 400,
+            "jumping_frames": 0,
+            "shooting_frames": 0,
+            "dribbling_frames": 60,
+            "duration": 22.12,
+            "videos": 4,
+            "failed_videos": 1,
+            "pose_percentage": 40.0,
+            "jumping_percentage": 0,
+            "shooting_percentage": 0,
+            "dribbling_percentage": 15.0
+        })
+
+    def test_failed_chord(self):
+        """Test the chord's error callback collects the batch from the task results instead."""
+        tasks.batch_failed_task(None, RuntimeError("corrupt video"), None, self.batch_id)
+        tasks.collect_batch_task.delay.assert_called_once_with(self.batch_id)
+
+        self.tasks['task-chord'] = SimpleNamespace(state='SUCCESS', result=summary('r-chord', 200, 100))
+        self.assertFalse(tasks._collect_batch(self.batch_id))
+        self.assertEqual(self.items()['task-chord']['status'], 'done')
+
+        # Videos still unfinished after the pending timeout are given up on
+        FrozenDatetime.current += timedelta(seconds=tasks.Config.VIDEO_CACHE_PENDING_TIMEOUT + 1)
+        self.assertTrue(tasks._collect_batch(self.batch_id))
+        self.assertEqual(self.items()['task-running']['error'], "Analysis did not finish")
+        self.assertEqual(Database.get_analysis_batch(self.batch_id)['aggregate']['failed_videos'], 2)
+
+class ResultCacheTestCase(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        app_module.result_cache.clear()
+        self.addCleanup(app_module.result_cache.clear)
+        self.client = app.test_client()
+        self.result_id = str(self.save(dribbling_frames=10))
+
+    def test_update_by_worker(self):
+        """Test a change made outside the web process replaces the cached result and its ETag at once."""
+        response = self.client.get(f'/results/{self.result_id}')
+        etag = response.get_etag()[0]
+        with mock.patch.object(Database, 'get_analysis_result', wraps=Database.get_analysis_result) as get_result:
+            response = self.client.get(f'/results/{self.result_id}', headers={'If-None-Match': f'"{etag}"'})
+            self.assertEqual(response.status_code, 304)
+            get_result.assert_not_called()
+
+        # What reclassify_task writes once it finishes, after the request that queued it
+        Database.update_analysis_result(self.result_id, {'dribbling_frames': 25})
+        response = self.client.get(f'/results/{self.result_id}', headers={'If-None-Match': f'"{etag}"'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['dribbling_frames'], 25)
+        self.assertNotEqual(response.get_etag()[0], etag)
+
+        Database.update_analysis_result(self.result_id, {'thresholds': {'dribble_window': 8}})
+        self.assertEqual(self.client.get(f'/results/{self.result_id}').get_json()['version'], 2)
+
+    def test_deleted(self):
+        """Test a result deleted elsewhere is not served from the cache."""
+        self.assertEqual(self.client.get(f'/results/{self.result_id}').status_code, 200)
+        self.db.analysis_results.delete_one({})
+        self.assertEqual(self.client.get(f'/results/{self.result_id}').status_code, 404)
+        self.assertIsNone(app_module.result_cache.get(self.result_id))
+
+class StatsRollupTestCase(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.ids = [
+            self.save(user_id="alice", total_frames=100, frames_with_pose=80, dribbling_frames=10, duration=4.0),
+            self.save(user_id="alice", total_frames=300, frames_with_pose=150, jumping_frames=6, duration=12.0),
+            self.save(user_id="bob", total_frames=50, frames_with_pose=50, shooting_frames=5, duration=2.0),
+            self.save(total_frames=10, frames_with_pose=0, duration=1.0)
+        ]
+
+    def expected(self, user_id=None):
+        """Stats aggregated from the stored results"""
+        results = list(self.db.analysis_results.find({'user_id': user_id} if user_id else {}))
+        if not results:
+            return {"total_analyses": 0, "total_frames_analyzed": 0, "avg_pose_detection_rate": 0, "avg_duration": 0}
+        return {
+            "total_analyses": len(results),
+            "total_frames": sum(result['total_frames'] for result in results),
+            "total_pose_frames": sum(result['frames_with_pose'] for result in results),
+            "total_jumping_frames": sum(result['jumping_frames'] for result in results),
+            "total_shooting_frames": sum(result['shooting_frames'] for result in results),
+            "total_dribbling_frames": sum(result['dribbling_frames'] for result in results),
+            "avg_detection_rate": round(sum(result['detection_rate'] for result in results) / len(results), 2),
+            "avg_duration": round(sum(result['duration'] for result in results) / len(results), 2)
+        }
+
+    def assertStatsMatchResults(self):
+        for user_id in (None, "alice", "bob"):
+            self.assertEqual(Database.get_analysis_stats(user_id), self.expected(user_id))
+
+    def test_rollups_follow_writes(self):
+        """Test saves, updates and deletes keep the global and per-user rollups equal to an aggregation."""
+        self.assertStatsMatchResults()
+
+        Database.update_analysis_result(str(self.ids[0]), {'dribbling_frames': 25, 'segments': []})
+        Database.update_analysis_result(str(self.ids[2]), {'thresholds': {}})
+        self.assertStatsMatchResults()
+
+        Database.delete_analysis_result(str(self.ids[2]))
+        self.assertFalse(Database.delete_analysis_result(str(self.ids[2])))
+        self.assertStatsMatchResults()
+        self.assertEqual(Database.get_analysis_stats("bob")["total_analyses"], 0)
+
+    def test_rebuild(self):
+        """Test rebuild_analysis_stats repairs drifted rollups and drops users without analyses."""
+        self.db.analysis_stats.update_one({'_id': 'global'}, {'$inc': {'total_analyses': 3, 'total_frames': -40}})
+        self.db.analysis_stats.update_one({'_id': 'user:alice'}, {'$set': {'total_dribbling_frames': 0}})
+        self.db.analysis_results.delete_one({'_id': self.ids[2]})
+        self.assertNotEqual(Database.get_analysis_stats(), self.expected())
+
+        self.assertEqual(Database.rebuild_analysis_stats(), 2)
+        self.assertStatsMatchResults()
+        self.assertIsNone(self.db.analysis_stats.find_one({'_id': 'user:bob'}))
+
+class TrendsTestCase(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.save(created_at=datetime(2026, 2, 27, 23, 59), user_id="alice", total_frames=100, duration=4.0)
+        self.save(created_at=datetime(2026, 3, 2, 0, 0), user_id="alice", total_frames=200, jumping_frames=3, duration=6.0)
+        self.save(created_at=datetime(2026, 3, 2, 18, 30), user_id="bob", total_frames=50, frames_with_pose=50, duration=2.0)
+        self.save(created_at=datetime(2026, 3, 12, 9, 0), total_frames=10, frames_with_pose=0, duration=1.0)
+        self.save(created_at=datetime(2026, 4, 1, 8, 0), user_id="alice", total_frames=30, dribbling_frames=7, duration=3.0)
+
+    def summary(self, trends):
+        return [(period['start'], period['total_analyses'], period['total_frames']) for period in trends]
+
+    def test_days(self):
+        """Test analyses are counted on their UTC day and days without any are zero."""
+        trends = Database.get_analysis_trends(datetime(2026, 2, 27), datetime(2026, 3, 3, 12, 0))
+        self.assertEqual(self.summary(trends), [
+            ('2026-02-27', 1, 100),
+            ('2026-02-28', 0, 0),
+            ('2026-03-01', 0, 0),
+            ('2026-03-02', 2, 250),
+            ('2026-03-03', 0, 0)
+        ])
+        self.assertEqual(trends[3]['total_duration'], 8.0)
+        self.assertEqual(trends[3]['avg_duration'], 4.0)
+        self.assertEqual(trends[3]['avg_detection_rate'], 0.7)
+        self.assertEqual((trends[1]['avg_detection_rate'], trends[1]['avg_duration']), (0, 0))
+
+    def test_weeks_and_months(self):
+        """Test weeks start on Monday and months on their first day, from the period holding start."""
+        trends = Database.get_analysis_trends(datetime(2026, 2, 26), datetime(2026, 3, 15), 'week')
+        self.assertEqual(self.summary(trends), [
+            ('2026-02-23', 1, 100),
+            ('2026-03-02', 2, 250),
+            ('2026-03-09', 1, 10)
+        ])
+
+        trends = Database.get_analysis_trends(datetime(2026, 1, 15), datetime(2026, 4, 30), 'month')
+        self.assertEqual(self.summary(trends), [
+            ('2026-01-01', 0, 0),
+            ('2026-02-01', 1, 100),
+            ('2026-03-01', 3, 260),
+            ('2026-04-01', 1, 30)
+        ])
+        self.assertEqual(trends[3]['total_dribbling_frames'], 7)
+
+    def test_user_filter(self):
+        """Test a user's trends only count their own analyses."""
+        trends = Database.get_analysis_trends(datetime(2026, 2, 1), datetime(2026, 4, 30), 'month', user_id="alice")
+        self.assertEqual(self.summary(trends), [
+            ('2026-02-01', 1, 100),
+            ('2026-03-01', 1, 200),
+            ('2026-04-01', 1, 30)
+        ])
+        trends = Database.get_analysis_trends(datetime(2026, 2, 1), datetime(2026, 4, 30), 'month', user_id="carol")
+        self.assertEqual([period['total_analyses'] for period in trends], [0, 0, 0])
+
+    def test_deletes_and_backfill(self):
+        """Test deleting an analysis leaves its bucket and backfill_daily_stats rebuilds the same buckets."""
+        Database.delete_analysis_result(str(self.save(created_at=datetime(2026, 3, 3), user_id="bob")))
+        incremental = {
+            (bucket['scope'], bucket['day']): {stat: bucket[stat] for stat in ('total_analyses', *database.STATS_FIELDS)}
+            for bucket in self.db.analysis_daily_stats.find()
+        }
+        self.db.analysis_daily_stats.update_many({}, {'$inc': {'total_analyses': 5}})
+
+        self.assertEqual(Database.backfill_daily_stats(), 8)
+        backfilled = {
+            (bucket['scope'], bucket['day']): {stat: bucket[stat] for stat in ('total_analyses', *database.STATS_FIELDS)}
+            for bucket in self.db.analysis_daily_stats.find()
+        }
+        # The emptied bucket of the deleted analysis is not recreated
+        self.assertEqual(incremental.pop(('user:bob', datetime(2026, 3, 3)))['total_analyses'], 0)
+        self.assertEqual(incremental.pop(('global', datetime(2026, 3, 3)))['total_analyses'], 0)
+        self.assertEqual(backfilled, incremental)
+
+    def test_endpoint(self):
+        """Test /api/trends fills the requested range and rejects bad parameters."""
+        client = app.test_client()
+        response = client.get('/api/trends?start=2026-03-01&end=2026-03-04&user_id=bob')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [period['total_analyses'] for period in response.get_json()['trends']],
+            [0, 1, 0, 0])
+
+        self.assertEqual(client.get('/api/trends?interval=year').status_code, 400)
+        self.assertEqual(client.get('/api/trends?start=2026-03-04&end=2026-03-01').status_code, 400)
+        self.assertEqual(client.get('/api/trends?start=03/01/2026').status_code, 400)
+
+class ResultsCursorTestCase(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        # Several analyses share a creation time, so pages must split ties by _id
+        start = datetime(2026, 3, 2, 12, 0)
+        for index, seconds in enumerate([0, 0, 0, 5, 5, 9, 9, 9, 9, 20, 20]):
+            self.save(f"clip{index}.mp4", start + timedelta(seconds=seconds), user_id="alice" if index % 3 else "bob")
+
+    def pages(self, **kwargs):
+        """The pages of the listing, following next_cursor to the end"""
+        pages, cursor = [], None
+        while True:
+            results, cursor = Database.list_analysis_results(limit=3, cursor=cursor, **kwargs)
+            pages.append([result['_id'] for result in results])
+            if cursor is None:
+                return pages
+
+    def newest_first(self, query={}):
+        results = sorted(self.db.analysis_results.find(query), key=lambda result: (result['created_at'], result['_id']), reverse=True)
+        return [result['_id'] for result in results]
+
+    def test_pages_cover_listing(self):
+        """Test following the cursors visits every result once, newest first."""
+        pages = self.pages()
+        self.assertEqual([len(page) for page in pages], [3, 3, 3, 2])
+        self.assertEqual(sum(pages, []), self.newest_first())
+
+        # A full last page has no cursor after it
+        self.db.analysis_results.delete_many({'_id': {'$in': pages[-1]}})
+        self.assertEqual([len(page) for page in self.pages()], [3, 3, 3])
+        self.assertEqual(Database.list_analysis_results(limit=10)[1], None)
+
+    def test_user_filter(self):
+        """Test a user's listing only pages through their own results."""
+        pages = self.pages(user_id="alice")
+        self.assertEqual([len(page) for page in pages], [3, 3, 1])
+        self.assertEqual(sum(pages, []), self.newest_first({'user_id': "alice"}))
+
+    def test_invalid_cursor(self):
+        """Test a malformed cursor raises ValueError and is a 400 for /results."""
+        for cursor in ("garbage", "12.notanid", "abc.507f1f77bcf86cd799439011"):
+            with self.assertRaises(ValueError):
+                Database.list_analysis_results(cursor=cursor)
+
+        client = app.test_client()
+        self.assertEqual(client.get('/results?cursor=garbage').status_code, 400)
+        first = client.get('/results?limit=4').get_json()
+        second = client.get(f"/results?limit=4&cursor={first['next_cursor']}").get_json()
+        self.assertEqual(
+            [result['_id'] for result in first['results'] + second['results']],
+            [str(result_id) for result_id in self.newest_first()[:8]])
+
+class SearchTestCase(DatabaseTestCase):
+    def names(self, results):
+        return [result['video_name'] for result in results]
+
+    def test_search_tokens(self):
+        """Test video names are split into lowercase words without accents or repeats."""
+        self.assertEqual(search_tokens("Práctica_Tiros-01.MP4"), ["practica", "tiros", "01", "mp4"])
+        self.assertEqual(search_tokens("  game game (2).mov"), ["game", "2", "mov"])
+        self.assertEqual(search_tokens(None), [])
+
+    def test_prefix_match_and_ranking(self):
+        """Test every query word must start a name word, and exact words rank before newer names."""
+        start = datetime(2026, 3, 2, 12, 0)
+        self.save("practica tiros.mp4", start)
+        self.save("Práctica tiroslibres.mp4", start + timedelta(hours=1))
+        self.save("tiros practicando.mp4", start + timedelta(hours=2))
+        self.save("partido tiros.mp4", start + timedelta(hours=3))
+        self.save("mis practicas.mp4", start + timedelta(hours=4))
+
+        self.assertEqual(self.names(Database.search_analysis_results("PRACTICA tiros")), [
+            "practica tiros.mp4",
+            "tiros practicando.mp4",
+            "Práctica tiroslibres.mp4"
+        ])
+        self.assertEqual(self.names(Database.search_analysis_results("pract")), [
+            "mis practicas.mp4",
+            "tiros practicando.mp4",
+            "Práctica tiroslibres.mp4",
+            "practica tiros.mp4"
+        ])
+        self.assertEqual(self.names(Database.search_analysis_results("practica", limit=2)), [
+            "Práctica tiroslibres.mp4",
+            "practica tiros.mp4"
+        ])
+        # Words are matched at their start only
+        self.assertEqual(Database.search_analysis_results("iros"), [])
+        self.assertEqual(Database.search_analysis_results("--"), [])
+
+        result = Database.search_analysis_results("partido")[0]
+        self.assertNotIn('search_tokens', result)
+        self.assertEqual(Database.search_analysis_results("partido", full=True)[0]['search_tokens'], ["partido", "tiros", "mp4"])
+
+    def test_newest_prefix_candidates(self):
+        """Test the prefix candidates ranked are the newest matches, whatever their words sort as."""
+        start = datetime(2026, 3, 2, 12, 0)
+        for index, name in enumerate(["practice a.mp4", "practice b.mp4", "practical c.mp4", "practico d.mp4",
+                                      "practiced e.mp4", "practicum f.mp4"]):
+            self.save(name, start + timedelta(hours=index))
+
+        with mock.patch.object(database.Config, 'SEARCH_CANDIDATES', 3):
+            self.assertEqual(self.names(Database.search_analysis_results("practic", limit=3)), [
+                "practicum f.mp4",
+                "practiced e.mp4",
+                "practico d.mp4"
+            ])
+
+    def test_user_filter(self):
+        """Test a user's search only finds their own results."""
+        self.save("tiros.mp4", user_id="alice")
+        self.save("tiros.mp4", user_id="bob")
+        results = Database.search_analysis_results("tiros", user_id="bob")
+        self.assertEqual([result['user_id'] for result in results], ["bob"])
+
+    def test_backfill(self):
+        """Test backfill_search_tokens makes results stored without tokens searchable."""
+        for index in range(5):
+            self.save(f"Entrenamiento {index}.mp4")
+        self.db.analysis_results.update_many({}, {'$unset': {'search_tokens': ''}})
+        self.assertEqual(Database.search_analysis_results("entrenamiento"), [])
+
+        self.assertEqual(Database.backfill_search_tokens(batch_size=2), 5)
+        self.assertEqual(len(Database.search_analysis_results("entrenamiento 3")), 1)
+        self.assertEqual(Database.backfill_search_tokens(), 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,7 +2,10 @@ import unittest
 import os
 import sys
 import json
-from app import app
+from types import SimpleNamespace
+from unittest import mock
+import app as app_module
+from app import app, combine_progress
 
 class CourtIQTestCase(unittest.TestCase):
     def setUp(self):
@@ -31,6 +34,79 @@ class CourtIQTestCase(unittest.TestCase):
         data = json.loads(response.data.decode('utf-8'))
         self.assertEqual(response.status_code, 400)
         self.assertEqual(data['error'], 'Invalid file type. Allowed formats: mp4, mov, avi')
+    
+    def test_analyze_unknown_preset(self):
+        """Test API response when an unknown analysis preset is requested."""
+        data = {'video': (open('app.py', 'rb'), 'clip.mp4'), 'preset': 'turbo'}
+        response = self.app.post('/analyze', data=data, content_type='multipart/form-data')
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(data['error'], 'Unknown preset. Available presets: fast, balanced, accurate')
+    
+    def test_analyze_batch_missing_videos(self):
+        """Test API response when a batch has no videos."""
+        response = self.app.post('/analyze/batch')
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(data['error'], 'No videos provided')
+    
+    def test_analyze_batch_invalid_file_type(self):
+        """Test a batch is rejected as a whole when one of its files has an invalid type."""
+        data = {'videos': [(open('app.py', 'rb'), 'clip.mp4'), (open('app.py', 'rb'), 'app.py')]}
+        response = self.app.post('/analyze/batch', data=data, content_type='multipart/form-data')
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(data['error'], 'Invalid file type: app.py. Allowed formats: mp4, mov, avi')
+
+class TaskProgressTestCase(unittest.TestCase):
+    def setUp(self):
+        self.chunks = {
+            'chunk-1': SimpleNamespace(state='SUCCESS', result={"counts": {"frame_count": 400}}),
+            'chunk-2': SimpleNamespace(state='PROGRESS', info={"frames_done": 150, "fps": 30.0}),
+            'chunk-3': SimpleNamespace(state='PROGRESS', info={"frames_done": 50, "fps": 20.0}),
+            'chunk-4': SimpleNamespace(state='PENDING', info=None)
+        }
+        patcher = mock.patch.object(app_module.analyze_video_task, 'AsyncResult', side_effect=self.chunks.get)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_combine_chunk_progress(self):
+        """Test the progress of a chunked analysis sums its finished and running chunks."""
+        progress = combine_progress({"total_frames": 1600, "chunk_task_ids": list(self.chunks)})
+        self.assertEqual(progress, {
+            "frames_done": 600,
+            "total_frames": 1600,
+            "percent": 37.5,
+            "fps": 50.0,
+            "eta_seconds": 20.0
+        })
+
+        self.chunks['chunk-2'] = self.chunks['chunk-3'] = SimpleNamespace(state='PENDING', info=None)
+        progress = combine_progress({"total_frames": 1600, "chunk_task_ids": list(self.chunks)})
+        self.assertEqual((progress["frames_done"], progress["fps"], progress["eta_seconds"]), (400, 0, None))
+
+    def test_single_task_progress(self):
+        """Test the progress of an analysis that is not chunked is passed through."""
+        progress = {"frames_done": 10, "total_frames": 100, "percent": 10.0, "fps": 5.0, "eta_seconds": 18.0}
+        self.assertIs(combine_progress(progress), progress)
+
+    def test_status_stream(self):
+        """Test the status stream sends each change once and ends with the task."""
+        statuses = [
+            {"task_id": "task-1", "status": "PENDING"},
+            {"task_id": "task-1", "status": "PROGRESS", "progress": {"percent": 10.0}},
+            {"task_id": "task-1", "status": "PROGRESS", "progress": {"percent": 10.0}},
+            {"task_id": "task-1", "status": "SUCCESS", "result": {"total_frames": 100}}
+        ]
+        with mock.patch.object(app_module, 'task_status', side_effect=statuses), \
+                mock.patch.dict(app.config, PROGRESS_INTERVAL=0):
+            response = app.test_client().get('/status/task-1/stream')
+            body = response.get_data(as_text=True)
+
+        self.assertEqual(response.mimetype, 'text/event-stream')
+        self.assertEqual(
+            [json.loads(line[len('data: '):]) for line in body.split('\n\n') if line],
+            [statuses[0], statuses[1], statuses[3]])
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,148 @@
+import unittest
+import threading
+from types import SimpleNamespace
+import numpy as np
+from frame_pipeline import InferenceFrameConverter, PoseRoiTracker, StageQueue, combine_stage_stats, prefetch
+
+def pose_result(x, y, z=0.0, visibility=0.9):
+    """Pose result whose 33 landmarks take the given coordinates in turn"""
+    xs, ys = np.resize(x, 33), np.resize(y, 33)
+    return SimpleNamespace(pose_landmarks=SimpleNamespace(landmark=[
+        SimpleNamespace(x=float(lx), y=float(ly), z=z, visibility=visibility) for lx, ly in zip(xs, ys)
+    ]))
+
+class ScriptedPose:
+    """Stand-in for MediaPipe Pose returning scripted results and recording the image sizes it gets"""
+
+    def __init__(self, results):
+        self.results = list(results)
+        self.shapes = []
+
+    def process(self, image):
+        self.shapes.append(image.shape)
+        return self.results.pop(0)
+
+class PrefetchTestCase(unittest.TestCase):
+    def test_yields_items_in_order(self):
+        """Test items pass through the bounded queue unchanged and in order."""
+        stage_queue = StageQueue("decode", 2)
+        self.assertEqual(list(prefetch(range(100), stage_queue)), list(range(100)))
+
+        stats = stage_queue.stats()
+        self.assertEqual(stats["capacity"], 2)
+        self.assertLessEqual(stats["max_depth"], 2)
+
+    def test_producer_error_is_raised(self):
+        """Test an exception in the producer thread reaches the consumer."""
+        def failing():
+            yield 1
+            raise IOError("decode failed")
+
+        items = []
+        with self.assertRaises(IOError):
+            for item in prefetch(failing(), StageQueue("decode", 4)):
+                items.append(item)
+        self.assertEqual(items, [1])
+
+    def test_close_stops_producer(self):
+        """Test closing the consumer early stops a producer blocked on a full queue."""
+        frames = prefetch(iter(range(10 ** 6)), StageQueue("decode", 1))
+        self.assertEqual(next(frames), 0)
+        frames.close()
+        self.assertEqual(
+            [thread for thread in threading.enumerate() if thread.name == "decode-stage"], [])
+
+    def test_combine_stage_stats(self):
+        """Test stats from several runs are weighted by their sample counts."""
+        combined = combine_stage_stats([
+            {"capacity": 8, "samples": 10, "avg_depth": 2.0, "max_depth": 4,
+             "producer_wait_seconds": 1.0, "consumer_wait_seconds": 0.5},
+            {"capacity": 8, "samples": 30, "avg_depth": 6.0, "max_depth": 8,
+             "producer_wait_seconds": 2.0, "consumer_wait_seconds": 0.0}
+        ])
+        self.assertEqual(combined["samples"], 40)
+        self.assertEqual(combined["avg_depth"], 5.0)
+        self.assertEqual(combined["max_depth"], 8)
+        self.assertEqual(combined["producer_wait_seconds"], 3.0)
+
+class PoseRoiTrackerTestCase(unittest.TestCase):
+    # 256x128 frame: the first pose's padded box maps to whole pixels
+    frame = np.zeros((128, 256, 3), dtype=np.uint8)
+
+    def setUp(self):
+        self.tracker = PoseRoiTracker(padding=0.25, min_visibility=0.5)
+
+    def process(self, *results):
+        pose = ScriptedPose(results)
+        results = self.tracker.process(pose, self.frame, lambda image: image)
+        return results, pose.shapes
+
+    def test_crop_maps_to_frame_coordinates(self):
+        """Test the frame after a detection is cropped to the padded pose box and landmarks are mapped back."""
+        _, shapes = self.process(pose_result([0.375, 0.625], [0.25, 0.75]))
+        self.assertEqual(shapes, [(128, 256, 3)])
+        self.assertEqual(self.tracker.box, (0.3125, 0.125, 0.6875, 0.875))
+
+        results, shapes = self.process(pose_result(0.5, 0.25, z=0.5))
+        # Pixels 80 to 176 across and 16 to 112 down
+        self.assertEqual(shapes, [(96, 96, 3)])
+        self.assertTrue(self.tracker.used_crop)
+        landmark = results.pose_landmarks.landmark[0]
+        self.assertEqual((landmark.x, landmark.y, landmark.z), (0.5, 0.3125, 0.1875))
+
+    def test_lost_pose_falls_back_to_full_frame(self):
+        """Test a crop without a pose, or with low visibility, is re-run on the full frame."""
+        self.process(pose_result([0.375, 0.625], [0.25, 0.75]))
+
+        results, shapes = self.process(SimpleNamespace(pose_landmarks=None), pose_result([0.25, 0.5], [0.25, 0.5]))
+        self.assertEqual(shapes, [(96, 96, 3), (128, 256, 3)])
+        self.assertFalse(self.tracker.used_crop)
+        # Full-frame landmarks are left as they are and tracked from
+        self.assertEqual(results.pose_landmarks.landmark[1].x, 0.5)
+        self.assertEqual(self.tracker.box, (0.1875, 0.1875, 0.5625, 0.5625))
+
+        _, shapes = self.process(pose_result(0.5, 0.5, visibility=0.3), pose_result(0.5, 0.5, visibility=0.3))
+        self.assertEqual(len(shapes), 2)
+        self.assertIsNone(self.tracker.box)
+        _, shapes = self.process(pose_result(0.5, 0.5))
+        self.assertEqual(shapes, [(128, 256, 3)])
+
+    def test_large_pose_is_not_cropped(self):
+        """Test a pose filling most of the frame is not tracked, and reset drops the box."""
+        self.process(pose_result([0.05, 0.95], [0.05, 0.95]))
+        self.assertIsNone(self.tracker.box)
+
+        self.process(pose_result([0.375, 0.625], [0.25, 0.75]))
+        self.tracker.reset()
+        _, shapes = self.process(pose_result(0.5, 0.5))
+        self.assertEqual(shapes, [(128, 256, 3)])
+
+class InferenceFrameConverterTestCase(unittest.TestCase):
+    def test_resize_and_convert(self):
+        """Test frames are shrunk to max_dim on their longest side and converted to RGB."""
+        frame = np.empty((128, 256, 3), dtype=np.uint8)
+        frame[:] = (10, 20, 30)
+        image = InferenceFrameConverter(max_dim=100)(frame)
+        self.assertEqual(image.shape, (50, 100, 3))
+        self.assertTrue((image == (30, 20, 10)).all())
+
+        image = InferenceFrameConverter()(frame)
+        self.assertEqual(image.shape, (128, 256, 3))
+        np.testing.assert_array_equal(image, frame[..., ::-1])
+
+    def test_buffers_reused(self):
+        """Test frames of the same size are converted into the same buffers."""
+        convert = InferenceFrameConverter(max_dim=100)
+        first = convert(np.zeros((128, 256, 3), dtype=np.uint8))
+        resized = convert._resized
+        second = convert(np.full((128, 256, 3), 255, dtype=np.uint8))
+        self.assertIs(second, first)
+        self.assertIs(convert._resized, resized)
+        self.assertTrue((first == 255).all())
+
+        # A new size gets new buffers
+        self.assertEqual(convert(np.zeros((64, 400, 3), dtype=np.uint8)).shape, (16, 100, 3))
+        self.assertIsNot(convert._rgb, first)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+import unittest
+import io
+import struct
+import time
+from live_session import FRAME_HEADER, LiveSession, LiveSessionError, iter_frames
+
+def frame_stream(*frames):
+    return io.BytesIO(b"".join(FRAME_HEADER.pack(len(data), timestamp) + data for data, timestamp in frames))
+
+class FrameStreamTestCase(unittest.TestCase):
+    def test_frames(self):
+        """Test frames of a multi-frame body are read back with their capture times."""
+        frames = [(b"first", 0.0), (b"", 0.5), (b"x" * 1000, 1.25)]
+        self.assertEqual(list(iter_frames(frame_stream(*frames))), frames)
+
+    def test_truncated(self):
+        """Test a body ending inside a frame is rejected after the complete frames."""
+        stream = io.BytesIO(frame_stream((b"first", 0.0)).getvalue() + struct.pack(">Id", 100, 1.0) + b"abc")
+        frames = iter_frames(stream)
+        self.assertEqual(next(frames), (b"first", 0.0))
+        with self.assertRaises(LiveSessionError):
+            next(frames)
+
+    def test_frame_too_large(self):
+        """Test frames over the size limit are rejected before they are read."""
+        with self.assertRaises(LiveSessionError) as raised:
+            list(iter_frames(frame_stream((b"x" * 11, 0.0)), max_frame_size=10))
+        self.assertEqual(raised.exception.status, 413)
+
+class LiveSessionTestCase(unittest.TestCase):
+    def setUp(self):
+        self.session = LiveSession({"queue_size": 2})
+        self.addCleanup(self.session.close)
+
+    def test_action_events(self):
+        """Test events are emitted when an action starts and stops."""
+        flags = {"is_jumping": False, "is_shooting": False, "is_dribbling": False}
+        now = time.time()
+        self.session._record(dict(flags, is_jumping=True), 1.0, now)
+        self.session._record(dict(flags, is_jumping=True, is_shooting=True), 1.5, now)
+        self.session._record(flags, 2.0, now)
+
+        events, next_event = self.session.events_after(0)
+        self.assertEqual(next_event, 4)
+        self.assertEqual(
+            [(event["action"], event["type"], event["timestamp"]) for event in events],
+            [("jumping", "start", 1.0), ("shooting", "start", 1.5), ("jumping", "end", 2.0), ("shooting", "end", 2.0)]
+        )
+        self.assertEqual(events[2]["duration"], 1.0)
+        self.assertEqual(self.session.events_after(3)[0], events[3:])
+        self.assertEqual(self.session.stats()["latency_ms"]["samples"], 3)
+
+    def test_oldest_frames_are_dropped(self):
+        """Test frames arriving faster than they are analyzed replace the oldest waiting ones."""
+        # Holding the session's lock keeps the worker off the queue while frames arrive
+        with self.session._condition:
+            for i in range(5):
+                self.assertTrue(self.session.submit(b"not an image", i))
+            self.assertEqual([timestamp for _, timestamp, _ in self.session._frames], [3, 4])
+        self.assertEqual(self.session.dropped, 3)
+
+        self.session.close()
+        self.assertFalse(self.session.submit(b"not an image"))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+import unittest
+from types import SimpleNamespace
+import numpy as np
+from pose_analyzer import PoseAnalyzer, StreamingDribbleDetector
+
+def make_landmarks(frame):
+    """Build a MediaPipe-like landmark list from a (33, 4) array"""
+    return [SimpleNamespace(x=float(x), y=float(y), z=float(z), visibility=float(v))
+            for x, y, z, v in frame]
+
+class PoseAnalyzerBatchTestCase(unittest.TestCase):
+    def setUp(self):
+        """Generate random poses, biased so every classifier fires on some frames"""
+        rng = np.random.default_rng(42)
+        self.frames = rng.random((500, 33, 4), dtype=np.float32)
+        # Raise the wrists above the elbows above the shoulders on half of the frames
+        raised = self.frames[::2]
+        raised[:, 11:13, 1] = 0.6
+        raised[:, 13:15, 1] = 0.4
+        raised[:, 15:17, 1] = 0.2 + rng.random((250, 2), dtype=np.float32) * 0.05
+
+    def test_calculate_angle_matches_batch(self):
+        """Test scalar angles agree with the vectorized version."""
+        a, b, c = self.frames[:, 11, :2], self.frames[:, 13, :2], self.frames[:, 15, :2]
+        angles = PoseAnalyzer.calculate_angles(a, b, c)
+        self.assertEqual(angles.shape, (500,))
+        self.assertTrue(np.all((angles >= 0) & (angles <= 180)))
+        for i in range(0, 500, 25):
+            self.assertAlmostEqual(PoseAnalyzer.calculate_angle(a[i], b[i], c[i]), angles[i], places=4)
+
+    def test_calculate_angle_right_angle(self):
+        """Test a known right angle."""
+        self.assertAlmostEqual(PoseAnalyzer.calculate_angle((1, 0), (0, 0), (0, 1)), 90.0)
+
+    def test_per_frame_wrappers_match_batch(self):
+        """Test single-frame classifiers agree with the batch masks."""
+        jumping = PoseAnalyzer.is_jumping_batch(self.frames)
+        shooting = PoseAnalyzer.is_shooting_batch(self.frames)
+        self.assertEqual(jumping.dtype, np.bool_)
+        self.assertTrue(shooting.any())
+        for i, frame in enumerate(self.frames):
+            landmarks = make_landmarks(frame)
+            self.assertEqual(PoseAnalyzer.is_jumping(landmarks), jumping[i])
+            self.assertEqual(PoseAnalyzer.is_shooting(landmarks), shooting[i])
+
+    def test_thresholds(self):
+        """Test looser thresholds only ever add detections."""
+        self.assertTrue(np.all(PoseAnalyzer.is_jumping_batch(self.frames) <=
+                               PoseAnalyzer.is_jumping_batch(self.frames, knee_angle=179)))
+        loose = PoseAnalyzer.is_shooting_batch(self.frames, arm_angle=90)
+        self.assertTrue(np.all(PoseAnalyzer.is_shooting_batch(self.frames) <= loose))
+        self.assertGreater(loose.sum(), PoseAnalyzer.is_shooting_batch(self.frames).sum())
+
+    def test_empty_landmarks(self):
+        """Test classifiers return False when no pose is detected."""
+        self.assertFalse(PoseAnalyzer.is_jumping([]))
+        self.assertFalse(PoseAnalyzer.is_shooting(None))
+
+class StreamingDribbleDetectorTestCase(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(7)
+        self.frames = rng.random((300, 33, 4), dtype=np.float32)
+
+    def test_matches_history_scan(self):
+        """Test the streaming detector agrees with is_dribbling on the same history."""
+        detector = StreamingDribbleDetector()
+        history = []
+        for frame in self.frames:
+            landmarks = make_landmarks(frame)
+            history = (history + [landmarks])[-10:]
+            self.assertEqual(detector.push(landmarks), PoseAnalyzer.is_dribbling(history))
+
+    def test_wide_window_counts_changes(self):
+        """Test direction changes are counted across a wider window."""
+        detector = StreamingDribbleDetector(window=6, min_changes=3)
+        wrist_ys = [0.5, 0.6, 0.5, 0.6, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0]
+        flags = [detector.push_wrist_y(y) for y in wrist_ys]
+        # Full window from frame 6; changes drop below 3 once the zigzag leaves the window
+        self.assertEqual(flags, [False] * 5 + [True, True, False, False, False])
+
+    def test_batch_matches_streaming(self):
+        """Test the vectorized detector agrees with pushing frames one by one."""
+        for window, min_changes in ((3, 1), (6, 2), (10, 5)):
+            detector = StreamingDribbleDetector(window=window, min_changes=min_changes)
+            streamed = [detector.push(make_landmarks(frame)) for frame in self.frames]
+            np.testing.assert_array_equal(
+                PoseAnalyzer.is_dribbling_batch(self.frames, window=window, min_changes=min_changes), streamed)
+        self.assertFalse(PoseAnalyzer.is_dribbling_batch(self.frames[:2]).any())
+
+    def test_reset(self):
+        """Test reset clears the buffered window."""
+        detector = StreamingDribbleDetector()
+        for y in (0.5, 0.6, 0.5):
+            detector.push_wrist_y(y)
+        self.assertTrue(detector.is_dribbling)
+        detector.reset()
+        self.assertFalse(detector.push_wrist_y(0.6))
+
+    def test_invalid_window(self):
+        """Test windows too small to hold a direction change are rejected."""
+        with self.assertRaises(ValueError):
+            StreamingDribbleDetector(window=2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+import unittest
+import os
+import threading
+from unittest import mock
+import pose_pool
+from pose_pool import close_all, pose_config, pose_session
+
+class StubPose:
+    """Stand-in for MediaPipe Pose that records its lifecycle"""
+
+    def __init__(self, **config):
+        self.config = config
+        self.resets = 0
+        self.closed = False
+
+    def reset(self):
+        self.resets += 1
+
+    def close(self):
+        self.closed = True
+
+class PosePoolTestCase(unittest.TestCase):
+    def setUp(self):
+        for patcher in (
+            mock.patch.object(pose_pool.mp.solutions.pose, 'Pose', StubPose),
+            mock.patch.object(pose_pool, '_idle', {}),
+            mock.patch.object(pose_pool, '_inherited', []),
+            mock.patch.object(pose_pool, '_lock', threading.Lock())
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.config = pose_config({'model_complexity': 0})
+
+    def test_reused_per_config(self):
+        """Test a returned instance is reset and lent again for the same config only."""
+        with pose_session(self.config) as first:
+            self.assertEqual(first.config["model_complexity"], 0)
+            self.assertEqual(first.resets, 0)
+        with pose_session(dict(reversed(list(self.config.items())))) as second:
+            self.assertIs(second, first)
+            self.assertEqual(second.resets, 1)
+        with pose_session(pose_config({'model_complexity': 2})) as other:
+            self.assertIsNot(other, first)
+
+    def test_concurrent_borrowers(self):
+        """Test borrowers of the same config at the same time get separate instances."""
+        with pose_session(self.config) as first, pose_session(self.config) as second:
+            self.assertIsNot(first, second)
+        with pose_session(self.config) as third, pose_session(self.config) as fourth:
+            self.assertEqual({id(third), id(fourth)}, {id(first), id(second)})
+
+    def test_failed_video_discards_instance(self):
+        """Test an instance is closed instead of reused when its video fails."""
+        with self.assertRaises(ValueError):
+            with pose_session(self.config) as failed:
+                raise ValueError("corrupt frame")
+        self.assertTrue(failed.closed)
+        with pose_session(self.config) as pose:
+            self.assertIsNot(pose, failed)
+
+    def test_close_all(self):
+        """Test close_all closes the idle instances and later sessions build new ones."""
+        with pose_session(self.config) as first:
+            pass
+        close_all()
+        self.assertTrue(first.closed)
+        with pose_session(self.config) as pose:
+            self.assertIsNot(pose, first)
+            self.assertFalse(pose.closed)
+
+    def test_forget_after_fork(self):
+        """Test a forked child sets the parent's instances aside without closing or reusing them."""
+        with pose_session(self.config) as inherited:
+            pass
+        pose_pool._forget_after_fork()
+        self.assertEqual(pose_pool._idle, {})
+        self.assertFalse(inherited.closed)
+        with pose_session(self.config) as pose:
+            self.assertIsNot(pose, inherited)
+        close_all()
+        self.assertFalse(inherited.closed)
+
+    @unittest.skipUnless(hasattr(os, 'fork'), "os.fork is not available")
+    def test_fork(self):
+        """Test the pool of a forked child starts empty."""
+        with pose_session(self.config):
+            pass
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.write(write_fd, str(len(pose_pool._idle)).encode())
+            os._exit(0)
+        os.close(write_fd)
+        self.assertEqual(os.read(read_fd, 16), b"0")
+        os.close(read_fd)
+        os.waitpid(pid, 0)
+        self.assertEqual(len(pose_pool._idle), 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+import unittest
+from unittest import mock
+from flask import Flask
+import response_cache
+from response_cache import TTLCache, etag_for, json_response
+
+class TTLCacheTestCase(unittest.TestCase):
+    def test_lru_eviction(self):
+        """Test the least recently used entry is evicted once the cache is full."""
+        cache = TTLCache(2, 60)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        self.assertEqual(cache.get('a'), 1)
+        cache.set('c', 3)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual((cache.get('a'), cache.get('c')), (1, 3))
+
+        cache.pop('a')
+        self.assertIsNone(cache.get('a'))
+
+    def test_expiry(self):
+        """Test entries are not returned after their time to live."""
+        cache = TTLCache(10, 30)
+        with mock.patch.object(response_cache.time, 'monotonic', return_value=100):
+            cache.set('a', 1)
+        with mock.patch.object(response_cache.time, 'monotonic', return_value=129):
+            self.assertEqual(cache.get('a'), 1)
+        with mock.patch.object(response_cache.time, 'monotonic', return_value=130):
+            self.assertIsNone(cache.get('a'))
+        self.assertEqual(len(cache), 0)
+
+class ConditionalResponseTestCase(unittest.TestCase):
+    def test_if_none_match(self):
+        """Test a matching If-None-Match gets an empty 304 and any other tag the body."""
+        body = '{"status": "success"}'
+        etag = etag_for(body)
+        app = Flask(__name__)
+
+        with app.test_request_context(headers={'If-None-Match': f'"{etag}"'}):
+            response = json_response(body, etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.get_data(), b'')
+        self.assertEqual(response.get_etag(), (etag, False))
+
+        with app.test_request_context(headers={'If-None-Match': '"stale"'}):
+            response = json_response(body, etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_data(as_text=True), body)
+
+if __name__ == '__main__':
+    unittest.main()
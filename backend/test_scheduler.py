@@ -0,0 +1,58 @@
+import unittest
+import time
+from unittest import mock
+import scheduler
+from scheduler import acquire_user_slot, analysis_queue, release_user_slot
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+class AnalysisQueueTestCase(unittest.TestCase):
+    def test_routing_by_duration(self):
+        """Test videos up to the short limit go to the short queue and longer ones to the long queue."""
+        with mock.patch.object(scheduler.Config, 'SHORT_VIDEO_MAX_SECONDS', 60):
+            self.assertEqual(analysis_queue(0), scheduler.Config.ANALYSIS_SHORT_QUEUE)
+            self.assertEqual(analysis_queue(60), scheduler.Config.ANALYSIS_SHORT_QUEUE)
+            self.assertEqual(analysis_queue(60.5), scheduler.Config.ANALYSIS_LONG_QUEUE)
+
+@unittest.skipUnless(fakeredis, "fakeredis is not installed")
+class UserSlotTestCase(unittest.TestCase):
+    def setUp(self):
+        client = fakeredis.FakeRedis()
+        for patcher in (
+            mock.patch.object(scheduler, '_client', client),
+            mock.patch.object(scheduler, '_acquire', client.register_script(scheduler._ACQUIRE_SCRIPT)),
+            mock.patch.object(scheduler.Config, 'USER_MAX_CONCURRENT_ANALYSES', 2)
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_cap(self):
+        """Test a user gets at most the cap of slots, and a released slot can be taken again."""
+        self.assertTrue(acquire_user_slot("coach", "a"))
+        self.assertTrue(acquire_user_slot("coach", "b"))
+        self.assertFalse(acquire_user_slot("coach", "c"))
+        # Retries of a task that holds a slot keep it; other users are not affected
+        self.assertTrue(acquire_user_slot("coach", "a"))
+        self.assertTrue(acquire_user_slot("player", "d"))
+
+        release_user_slot("coach", "a")
+        self.assertTrue(acquire_user_slot("coach", "c"))
+
+    def test_lost_slots_expire(self):
+        """Test slots of tasks that never released them stop counting after the lease."""
+        acquire_user_slot("coach", "a")
+        acquire_user_slot("coach", "b")
+        with mock.patch.object(scheduler.time, 'time', return_value=time.time() + scheduler.Config.USER_SLOT_LEASE_SECONDS + 1):
+            self.assertTrue(acquire_user_slot("coach", "c"))
+
+    def test_anonymous(self):
+        """Test analyses without a user are never limited."""
+        with mock.patch.object(scheduler.Config, 'USER_MAX_CONCURRENT_ANALYSES', 0):
+            self.assertTrue(acquire_user_slot("coach", "a"))
+        self.assertTrue(all(acquire_user_slot(None, str(i)) for i in range(5)))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,274 @@
+import unittest
+import contextlib
+import os
+import shutil
+import tempfile
+from types import SimpleNamespace
+from unittest import mock
+import cv2
+import numpy as np
+import tasks
+from action_store import load_actions, load_landmarks
+
+def make_video(path, levels, fps=30):
+    """Write an MJPG video whose frames are filled with the given gray levels"""
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), fps, (64, 48))
+    for level in levels:
+        writer.write(np.full((48, 64, 3), level, dtype=np.uint8))
+    writer.release()
+
+class FakePose:
+    """
+    Stateless stand-in for MediaPipe Pose
+
+    A frame's brightness is the height of the wrists, so the video's gray
+    levels script the poses; frames darker than 25 have no pose. Wrists above
+    the elbows (levels below 128) make a shooting pose.
+    """
+
+    def process(self, frame):
+        level = float(frame.mean())
+        if level < 25:
+            return SimpleNamespace(pose_landmarks=None)
+
+        landmarks = np.full((33, 4), 0.5, dtype=np.float32)
+        landmarks[:, 3] = 1.0
+        landmarks[11:13, 1] = 0.5  # Shoulders
+        landmarks[13:15, 1] = 0.4  # Elbows
+        landmarks[15:17, 1] = level / 255 * 0.8  # Wrists
+        landmarks[23:25, 1] = 0.6  # Hips
+        landmarks[25:27, 1] = 0.75  # Knees
+        landmarks[27:29, 1] = 0.9  # Ankles
+        return SimpleNamespace(pose_landmarks=SimpleNamespace(landmark=[
+            SimpleNamespace(x=float(x), y=float(y), z=float(z), visibility=float(v)) for x, y, z, v in landmarks
+        ]))
+
+@contextlib.contextmanager
+def fake_pose_session(config):
+    yield FakePose()
+
+def scripted_levels():
+    """Dribbling, standing still, leaving the frame, shooting and dribbling again"""
+    levels = [160, 200, 230, 200] * 15
+    levels += [180] * 40
+    levels += [0] * 20
+    levels += [60, 60, 90, 90] * 15
+    levels += [150, 220] * 30
+    return levels
+
+class ProgressReporterTestCase(unittest.TestCase):
+    def test_publishes_once_per_interval(self):
+        """Test progress is published at most once per interval, with the recent rate and an ETA from the average."""
+        published = []
+        with mock.patch.object(tasks.time, 'time', return_value=100.0):
+            reporter = tasks.ProgressReporter(published.append, 300, interval=1.0)
+        for now, frames_done in ((100.5, 10), (101.0, 20), (101.5, 25), (102.0, 80), (104.0, 320)):
+            with mock.patch.object(tasks.time, 'time', return_value=now):
+                reporter.update(frames_done)
+
+        self.assertEqual(published, [
+            {"frames_done": 20, "total_frames": 300, "percent": 6.7, "fps": 20.0, "eta_seconds": 14.0},
+            {"frames_done": 80, "total_frames": 300, "percent": 26.7, "fps": 60.0, "eta_seconds": 5.5},
+            # Containers can under-report their frame count
+            {"frames_done": 320, "total_frames": 300, "percent": 100.0, "fps": 120.0, "eta_seconds": 0.0}
+        ])
+
+    def test_unknown_total(self):
+        """Test a video without a frame count reports no percentage and no ETA before any frame is done."""
+        published = []
+        with mock.patch.object(tasks.time, 'time', return_value=100.0):
+            reporter = tasks.ProgressReporter(published.append, 0, interval=0)
+        with mock.patch.object(tasks.time, 'time', return_value=101.0):
+            reporter.update(0)
+        self.assertEqual(published, [
+            {"frames_done": 0, "total_frames": 0, "percent": 0, "fps": 0.0, "eta_seconds": None}
+        ])
+
+class AnalysisPresetTestCase(unittest.TestCase):
+    def test_preset_expands(self):
+        """Test a preset brings its settings and explicit options override them."""
+        options = tasks.resolve_analysis_options({'preset': 'fast', 'target_fps': 5})
+        self.assertEqual(options['preset'], 'fast')
+        self.assertEqual(options['target_fps'], 5)
+        self.assertEqual(options['model_complexity'], tasks.Config.ANALYSIS_PRESETS['fast']['model_complexity'])
+        self.assertEqual(options['motion_threshold'], tasks.Config.ANALYSIS_PRESETS['fast']['motion_threshold'])
+
+    def test_default_preset(self):
+        """Test the configured default preset applies when none is given, and no preset leaves options alone."""
+        with mock.patch.object(tasks.Config, 'DEFAULT_ANALYSIS_PRESET', None):
+            self.assertEqual(tasks.resolve_analysis_options({'target_fps': 5}), {'target_fps': 5})
+            self.assertEqual(tasks.resolve_analysis_options(None), {})
+        with mock.patch.object(tasks.Config, 'DEFAULT_ANALYSIS_PRESET', 'balanced'):
+            self.assertEqual(tasks.resolve_analysis_options({})['preset'], 'balanced')
+
+    def test_accurate_analyzes_every_frame(self):
+        """Test the accurate preset's explicit None target rate overrides a configured one."""
+        options = tasks.resolve_analysis_options({'preset': 'accurate'})
+        with mock.patch.object(tasks.Config, 'ANALYSIS_TARGET_FPS', 10):
+            self.assertEqual(tasks._frame_stride(30, options), 1)
+
+    def test_unknown_preset(self):
+        """Test an unknown preset name is rejected."""
+        with self.assertRaises(ValueError):
+            tasks.resolve_analysis_options({'preset': 'turbo'})
+
+class AnalysisTaskTestCase(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.folder = tmp.name
+        self.video_path = os.path.join(tmp.name, "clip.avi")
+        make_video(self.video_path, scripted_levels())
+
+        for patcher in (
+            mock.patch.object(tasks, 'pose_session', fake_pose_session),
+            mock.patch.object(tasks.Config, 'PROCESSED_FOLDER', tmp.name),
+            mock.patch.object(tasks.Config, 'PIPELINE_QUEUE_SIZE', 0),
+            mock.patch.object(tasks.Config, 'MAX_SAMPLE_FRAMES', 0),
+            mock.patch.object(tasks.Config, 'MIN_CHUNK_FRAMES', 50)
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def analyze(self, analysis_id, options, chunks):
+        os.makedirs(os.path.join(self.folder, analysis_id))
+        fps, _ = tasks._probe_video(self.video_path)
+        warmup_frames = max(tasks.Config.CHUNK_OVERLAP_FRAMES, tasks.Config.DRIBBLE_WINDOW * tasks._frame_stride(fps, options))
+        partials = [
+            tasks._analyze_frame_range(self.video_path, analysis_id, options, start, end, warmup_frames)
+            for start, end in chunks
+        ]
+        merged = tasks._merge_partials(analysis_id, options, partials)
+        folder = os.path.join(self.folder, analysis_id)
+        return (merged, load_actions(os.path.join(folder, merged["actions_file"])),
+                load_landmarks(os.path.join(folder, merged["landmarks_file"])))
+
+    def run_task(self, options):
+        """Run analyze_video_task on a copy of the video; returns its summary and the stored result"""
+        video_path = os.path.join(self.folder, "upload.avi")
+        shutil.copy(self.video_path, video_path)
+        with mock.patch.object(tasks.Database, 'save_analysis_result', return_value="result") as save:
+            summary = tasks.analyze_video_task(video_path, "clip.avi", options)
+        return summary, save.call_args
+
+    def test_frame_stride(self):
+        """Test the stride is the frame rate over the target rate, and 1 without a usable target."""
+        self.assertEqual(tasks._frame_stride(30, {'target_fps': 15}), 2)
+        self.assertEqual(tasks._frame_stride(25, {'target_fps': 10}), 2)
+        self.assertEqual(tasks._frame_stride(30, {'target_fps': 60}), 1)
+        self.assertEqual(tasks._frame_stride(0, {'target_fps': 15}), 1)
+        with mock.patch.object(tasks.Config, 'ANALYSIS_TARGET_FPS', 10):
+            self.assertEqual(tasks._frame_stride(30, {}), 3)
+            self.assertEqual(tasks._frame_stride(30, {'target_fps': None}), 1)
+
+    def test_sampled_counts_are_scaled(self):
+        """Test counts of a sampled analysis are scaled back to the full frame rate."""
+        full, _ = self.run_task({'motion_threshold': 0})
+        sampled, stored = self.run_task({'motion_threshold': 0, 'target_fps': 15})
+
+        self.assertEqual((full["frame_stride"], full["analyzed_frames"]), (1, 240))
+        self.assertEqual((sampled["frame_stride"], sampled["analyzed_frames"]), (2, 120))
+        self.assertEqual(sampled["total_frames"], 240)
+        # The video has a pose in all but 20 frames, at either rate
+        self.assertEqual(full["frames_with_pose"], 220)
+        self.assertEqual(sampled["frames_with_pose"], 220)
+        self.assertEqual(stored.args[2], 220)
+        # Percentages come from the frames actually analyzed
+        self.assertAlmostEqual(sampled["pose_percentage"], 110 / 120 * 100, places=2)
+        self.assertAlmostEqual(sampled["shooting_percentage"], full["shooting_percentage"], delta=5)
+        self.assertEqual(sampled["shooting_frames"] % 2, 0)
+
+    def test_motion_gate(self):
+        """Test static frames skip inference, keep their pose and stop counting as dribbling."""
+        ungated, _, _ = self.analyze("ungated", {'motion_threshold': 0}, [(0, None)])
+        gated, actions, landmarks = self.analyze("gated", {'motion_threshold': 1.0}, [(0, None)])
+
+        # Repeats of the previous level: the standing and dark stretches, and every other shooting frame
+        self.assertEqual(ungated["counts"]["motion_skipped_frames"], 0)
+        self.assertEqual(gated["counts"]["motion_skipped_frames"], 39 + 19 + 30)
+        self.assertEqual(gated["counts"]["analyzed_frames"], 240)
+        for key in ("pose_frames", "shooting_frames"):
+            self.assertEqual(gated["counts"][key], ungated["counts"][key])
+
+        # Skipped frames repeat the last landmarks, and the wrist at rest ends the dribble
+        standing = (actions.timestamps > 63.5 / 30) & (actions.timestamps < 100.5 / 30)
+        self.assertEqual(standing.sum(), 37)
+        self.assertFalse(actions.mask("is_dribbling")[standing].any())
+        self.assertTrue(actions.mask("is_dribbling")[actions.timestamps < 60.5 / 30].any())
+        self.assertEqual(len(np.unique(np.asarray(landmarks[standing]), axis=0)), 1)
+        self.assertEqual(gated["counts"]["dribbling_frames"], ungated["counts"]["dribbling_frames"])
+
+    def test_plan_chunks(self):
+        """Test frame ranges cover the video, end open-ended and are never shorter than MIN_CHUNK_FRAMES."""
+        self.assertEqual(tasks._plan_chunks(240, 4), [(0, 60), (60, 120), (120, 180), (180, None)])
+        self.assertEqual(tasks._plan_chunks(240, 8), [(0, 60), (60, 120), (120, 180), (180, None)])
+        self.assertEqual(tasks._plan_chunks(100, 3), [(0, 50), (50, None)])
+        self.assertEqual(tasks._plan_chunks(49, 4), [(0, None)])
+        self.assertEqual(tasks._plan_chunks(0, 4), [(0, None)])
+
+    def test_chunked_matches_sequential(self):
+        """Test merged frame ranges reproduce a sequential run when the pose model keeps no state."""
+        for options in ({'motion_threshold': 0}, {'motion_threshold': 0, 'target_fps': 15}):
+            with self.subTest(options=options):
+                sequential, actions, landmarks = self.analyze(f"sequential-{len(options)}", options, [(0, None)])
+                self.assertEqual(sequential["chunks"], 1)
+                self.assertGreater(sequential["counts"]["dribbling_frames"], 0)
+                self.assertGreater(sequential["counts"]["shooting_frames"], 0)
+
+                for chunk_count in (2, 3, 4):
+                    chunks = tasks._plan_chunks(240, chunk_count)
+                    merged, chunked_actions, chunked_landmarks = self.analyze(
+                        f"chunked-{len(options)}-{chunk_count}", options, chunks)
+                    self.assertEqual(merged["chunks"], chunk_count)
+                    self.assertEqual(merged["counts"], sequential["counts"])
+                    self.assertEqual(merged["segments"], sequential["segments"])
+                    np.testing.assert_array_equal(chunked_actions.timestamps, actions.timestamps)
+                    np.testing.assert_array_equal(chunked_actions.flags, actions.flags)
+                    np.testing.assert_array_equal(chunked_landmarks, landmarks)
+
+    def test_merge_keeps_first_sample_frames(self):
+        """Test merged ranges keep the sample frames a sequential run saves and delete the others."""
+        save = staticmethod(lambda output_path, *args: open(output_path, 'wb').close())
+        with mock.patch.object(tasks.Config, 'MAX_SAMPLE_FRAMES', 4), \
+                mock.patch.object(tasks.SampleFrameWriter, '_save', save):
+            sequential, _, _ = self.analyze("sequential", {'motion_threshold': 0}, [(0, None)])
+            merged, _, _ = self.analyze("chunked", {'motion_threshold': 0}, tasks._plan_chunks(240, 3))
+
+        self.assertEqual(len(merged["sample_frames"]), 4)
+        self.assertEqual([os.path.basename(path) for path in merged["sample_frames"]],
+                         [os.path.basename(path) for path in sequential["sample_frames"]])
+        self.assertEqual(sorted(name for name in os.listdir(os.path.join(self.folder, "chunked")) if name.endswith(".jpg")),
+                         sorted(os.path.basename(path) for path in merged["sample_frames"]))
+
+    def test_reclassify(self):
+        """Test reclassifying without overrides reproduces the analysis and overrides apply to their action only."""
+        options = {'motion_threshold': 0, 'segment_max_gap': 0.5}
+        merged, actions, landmarks = self.analyze("analysis", options, [(0, None)])
+        result = {
+            'frames_with_pose': merged["counts"]["pose_frames"],
+            'dribbling_frames': merged["counts"]["dribbling_frames"],
+            'segments': merged["segments"],
+            'segment_max_gap': 0.5,
+            'actions_data_file': "/static/processed_images/analysis/actions.bin",
+            'landmarks_file': "/static/processed_images/analysis/landmarks.npy"
+        }
+        with mock.patch.object(tasks.Database, 'get_analysis_result', side_effect=lambda result_id: dict(result)), \
+                mock.patch.object(tasks.Database, 'update_analysis_result', side_effect=lambda result_id, fields: result.update(fields)):
+            tasks.reclassify_task("result", {})
+            self.assertEqual(result['dribbling_frames'], merged["counts"]["dribbling_frames"])
+            self.assertEqual(result['shooting_frames'], merged["counts"]["shooting_frames"])
+            self.assertEqual(result['segments'], merged["segments"])
+            np.testing.assert_array_equal(load_actions(tasks._artifact_path(result['actions_data_file'])).flags, actions.flags)
+
+            tasks.reclassify_task("result", {'dribble_window': 8, 'dribble_min_changes': 3})
+            expected = tasks.PoseAnalyzer.is_dribbling_batch(landmarks, window=8, min_changes=3).sum()
+            self.assertNotEqual(expected, merged["counts"]["dribbling_frames"])
+            self.assertEqual(result['dribbling_frames'], expected)
+            self.assertEqual(result['shooting_frames'], merged["counts"]["shooting_frames"])
+
+            # Overrides of an earlier re-classification do not carry over
+            tasks.reclassify_task("result", {})
+            self.assertEqual(result['dribbling_frames'], merged["counts"]["dribbling_frames"])
+
+if __name__ == '__main__':
+    unittest.main()
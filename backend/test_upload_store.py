@@ -0,0 +1,120 @@
+import unittest
+import hashlib
+import io
+import os
+import tempfile
+import threading
+import time
+from unittest import mock
+import upload_store
+from upload_store import UploadError, append_chunk, create_upload, finalize_upload, get_upload
+
+class ChunkedUploadTestCase(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        for patcher in (
+            mock.patch.object(upload_store, 'PARTIAL_FOLDER', os.path.join(tmp.name, 'partial')),
+            mock.patch.object(upload_store.Config, 'UPLOAD_FOLDER', tmp.name),
+            mock.patch.object(upload_store.Config, 'UPLOAD_CHUNK_SIZE', 1000),
+            mock.patch.dict(upload_store._digests, clear=True)
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        self.data = os.urandom(10000)
+        self.upload_id = create_upload("game.mp4", len(self.data), {"preset": "fast"})["upload_id"]
+
+    def test_resume_and_finalize(self):
+        """Test chunks appended across requests are reassembled and hashed."""
+        self.assertEqual(append_chunk(self.upload_id, 0, io.BytesIO(self.data[:4500])), 4500)
+
+        # A retry of the same chunk is rejected with the offset to resume from
+        with self.assertRaises(UploadError) as raised:
+            append_chunk(self.upload_id, 0, io.BytesIO(self.data[:4500]))
+        self.assertEqual(raised.exception.status, 409)
+        self.assertEqual(raised.exception.offset, 4500)
+
+        offset = get_upload(self.upload_id)["offset"]
+        self.assertEqual(append_chunk(self.upload_id, offset, io.BytesIO(self.data[offset:])), len(self.data))
+
+        video_path, filename, video_hash, options = finalize_upload(self.upload_id)
+        with open(video_path, 'rb') as f:
+            self.assertEqual(f.read(), self.data)
+        self.assertEqual(video_hash, hashlib.sha256(self.data).hexdigest())
+        self.assertEqual((filename, options), ("game.mp4", {"preset": "fast"}))
+
+        with self.assertRaises(UploadError):
+            get_upload(self.upload_id)
+
+    def test_overflow_is_rejected_whole(self):
+        """Test a chunk running past the declared size leaves the upload unchanged."""
+        append_chunk(self.upload_id, 0, io.BytesIO(self.data[:2000]))
+        with self.assertRaises(UploadError) as raised:
+            append_chunk(self.upload_id, 2000, io.BytesIO(self.data[2000:] + b"extra"))
+        self.assertEqual(raised.exception.status, 413)
+        self.assertEqual(get_upload(self.upload_id)["offset"], 2000)
+
+    def test_finalize_incomplete(self):
+        """Test an upload cannot be finalized before every byte arrived."""
+        append_chunk(self.upload_id, 0, io.BytesIO(self.data[:10]))
+        with self.assertRaises(UploadError) as raised:
+            finalize_upload(self.upload_id)
+        self.assertEqual(raised.exception.offset, 10)
+
+    def test_running_hash(self):
+        """Test the hash kept while appending catches up on bytes other processes appended."""
+        append_chunk(self.upload_id, 0, io.BytesIO(self.data[:3000]))
+        # Another process appends the next bytes
+        with open(os.path.join(upload_store.PARTIAL_FOLDER, f"{self.upload_id}.part"), 'ab') as f:
+            f.write(self.data[3000:6000])
+        append_chunk(self.upload_id, 6000, io.BytesIO(self.data[6000:]))
+        self.assertEqual(upload_store._digests[self.upload_id][0], len(self.data))
+
+        _, _, video_hash, _ = finalize_upload(self.upload_id)
+        self.assertEqual(video_hash, hashlib.sha256(self.data).hexdigest())
+        self.assertNotIn(self.upload_id, upload_store._digests)
+
+    def test_finalize_without_running_hash(self):
+        """Test a process that did not see the first chunk hashes the whole file."""
+        append_chunk(self.upload_id, 0, io.BytesIO(self.data[:5000]))
+        upload_store._digests.clear()
+        append_chunk(self.upload_id, 5000, io.BytesIO(self.data[5000:]))
+        self.assertNotIn(self.upload_id, upload_store._digests)
+
+        _, _, video_hash, _ = finalize_upload(self.upload_id)
+        self.assertEqual(video_hash, hashlib.sha256(self.data).hexdigest())
+
+    def test_concurrent_finalize(self):
+        """Test one of two concurrent finalize calls moves the upload and the other gets a 409."""
+        append_chunk(self.upload_id, 0, io.BytesIO(self.data))
+        running_digest = upload_store._running_digest
+
+        def slow_running_digest(*args):
+            time.sleep(0.2)
+            return running_digest(*args)
+
+        outcomes = []
+        def finalize():
+            try:
+                outcomes.append(finalize_upload(self.upload_id)[2])
+            except UploadError as e:
+                outcomes.append(e.status)
+
+        with mock.patch.object(upload_store, '_running_digest', slow_running_digest):
+            threads = [threading.Thread(target=finalize) for _ in range(2)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertCountEqual(outcomes, [hashlib.sha256(self.data).hexdigest(), 409])
+
+    def test_invalid_id(self):
+        """Test ids that are not upload ids never reach the filesystem."""
+        with self.assertRaises(UploadError) as raised:
+            get_upload("../../config")
+        self.assertEqual(raised.exception.status, 404)
+
+if __name__ == '__main__':
+    unittest.main()
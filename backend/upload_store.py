@@ -0,0 +1,224 @@
+"""
+Resumable, chunked uploads of large videos.
+
+Chunks are appended straight to a partial file in the upload folder, so a
+web worker holds one read buffer in memory no matter how large the video is.
+The partial file's size is the upload offset: a client whose connection
+dropped asks for it and resumes from there. Upload metadata lives in a JSON
+file beside the data, so any web worker sharing the folder can take any
+chunk.
+
+Each process keeps a running SHA-256 of the uploads it receives chunks of,
+catching up on bytes other processes appended, so finalizing an upload only
+reads the file back in a process that never saw its first chunk.
+"""
+
+import fcntl
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from config import Config
+
+PARTIAL_FOLDER = os.path.join(Config.UPLOAD_FOLDER, 'partial')
+
+_UPLOAD_ID = re.compile(r'[0-9a-f]{32}')
+
+# Running hashes of uploads in progress, by upload id: (bytes hashed, sha256 object)
+_digests = {}
+_digests_lock = threading.Lock()
+
+
+class UploadError(Exception):
+    """A chunked upload request that cannot be applied, with its HTTP status"""
+
+    def __init__(self, message, status=400, offset=None):
+        super().__init__(message)
+        self.status = status
+        self.offset = offset
+
+
+def _paths(upload_id):
+    if not _UPLOAD_ID.fullmatch(upload_id or ''):
+        raise UploadError("Upload not found", 404)
+    return (
+        os.path.join(PARTIAL_FOLDER, f"{upload_id}.json"),
+        os.path.join(PARTIAL_FOLDER, f"{upload_id}.part")
+    )
+
+
+def _running_digest(upload_id, f, offset):
+    """
+    A copy of this process' hash of the upload's first offset bytes
+
+    Bytes appended by other processes since this one last hashed are read
+    from f. Returns None if this process does not track the upload.
+    """
+    with _digests_lock:
+        entry = _digests.get(upload_id)
+    if entry is None:
+        return hashlib.sha256() if offset == 0 else None
+
+    hashed, digest = entry
+    if hashed > offset:
+        return None
+    digest = digest.copy()
+    f.seek(hashed)
+    while hashed < offset:
+        block = f.read(min(Config.UPLOAD_CHUNK_SIZE, offset - hashed))
+        if not block:
+            return None
+        digest.update(block)
+        hashed += len(block)
+    return digest
+
+
+def create_upload(filename, size, options):
+    """Start an upload of size bytes; returns its metadata"""
+    os.makedirs(PARTIAL_FOLDER, exist_ok=True)
+    upload = {
+        "upload_id": uuid.uuid4().hex,
+        "filename": filename,
+        "size": size,
+        "options": options,
+        "created_at": time.time()
+    }
+
+    meta_path, data_path = _paths(upload["upload_id"])
+    open(data_path, 'wb').close()
+    with open(meta_path, 'w') as f:
+        json.dump(upload, f)
+
+    return dict(upload, offset=0)
+
+
+def get_upload(upload_id):
+    """Metadata of an upload, with the number of bytes received so far as offset"""
+    meta_path, data_path = _paths(upload_id)
+    try:
+        with open(meta_path) as f:
+            upload = json.load(f)
+        upload["offset"] = os.path.getsize(data_path)
+    except FileNotFoundError:
+        raise UploadError("Upload not found", 404)
+    return upload
+
+
+def append_chunk(upload_id, offset, stream, length=None):
+    """
+    Append the bytes of stream at offset; returns the new offset
+
+    offset must equal the bytes received so far. Bytes that arrive before a
+    dropped connection are kept, so the client can resume from the returned
+    (or queried) offset. A chunk running past the declared size is rejected
+    as a whole.
+    """
+    upload = get_upload(upload_id)
+    _, data_path = _paths(upload_id)
+
+    try:
+        f = open(data_path, 'r+b')
+    except FileNotFoundError:
+        # Finalized or expired since the metadata was read
+        raise UploadError("Upload not found", 404)
+
+    with f:
+        # Serialize appends to the same upload across threads and processes
+        fcntl.flock(f, fcntl.LOCK_EX)
+        start = os.fstat(f.fileno()).st_size
+        if offset != start:
+            raise UploadError("Offset does not match the bytes received", 409, start)
+        if length is not None and start + length > upload["size"]:
+            raise UploadError("Chunk extends past the declared upload size", 413, start)
+
+        digest = _running_digest(upload_id, f, start)
+        f.seek(start)
+        current = start
+        while True:
+            chunk = stream.read(Config.UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            if current + len(chunk) > upload["size"]:
+                f.truncate(start)
+                raise UploadError("Chunk extends past the declared upload size", 413, start)
+            f.write(chunk)
+            if digest is not None:
+                digest.update(chunk)
+            current += len(chunk)
+
+        # A chunk cut short by a dropped connection is caught up on with the next one
+        if digest is not None:
+            with _digests_lock:
+                _digests[upload_id] = (current, digest)
+
+    return current
+
+
+def finalize_upload(upload_id):
+    """
+    Move a complete upload into the upload folder
+
+    Returns (video_path, filename, video_hash, options) for the analysis.
+    Of concurrent calls for the same upload, one moves it and the others
+    get a 409.
+    """
+    upload = get_upload(upload_id)
+    meta_path, data_path = _paths(upload_id)
+    if upload["offset"] != upload["size"]:
+        raise UploadError("Upload is incomplete", 409, upload["offset"])
+
+    try:
+        f = open(data_path, 'rb')
+    except FileNotFoundError:
+        raise UploadError("Upload was already finalized", 409)
+
+    with f:
+        # Hold off appends and other finalize calls until the file is moved
+        fcntl.flock(f, fcntl.LOCK_EX)
+        if not os.path.exists(meta_path):
+            raise UploadError("Upload was already finalized", 409)
+
+        digest = _running_digest(upload_id, f, upload["size"])
+        if digest is None:
+            # No chunk of this upload reached this process from the start: read it all back
+            digest = hashlib.sha256()
+            f.seek(0)
+            for block in iter(lambda: f.read(Config.UPLOAD_CHUNK_SIZE), b''):
+                digest.update(block)
+
+        video_path = os.path.join(Config.UPLOAD_FOLDER, f"{uuid.uuid4()}_{upload['filename']}")
+        os.replace(data_path, video_path)
+        os.remove(meta_path)
+
+    with _digests_lock:
+        _digests.pop(upload_id, None)
+
+    return video_path, upload["filename"], digest.hexdigest(), upload["options"]
+
+
+def expire_uploads(max_age=None):
+    """Delete unfinished uploads that received nothing for max_age seconds"""
+    max_age = Config.UPLOAD_EXPIRY_SECONDS if max_age is None else max_age
+    if not os.path.isdir(PARTIAL_FOLDER):
+        return
+
+    cutoff = time.time() - max_age
+    for upload_id in {os.path.splitext(name)[0] for name in os.listdir(PARTIAL_FOLDER)}:
+        try:
+            paths = _paths(upload_id)
+        except UploadError:
+            continue
+
+        # The data file's mtime moves with every chunk, so uploads in progress are kept
+        mtimes = [os.path.getmtime(path) for path in paths if os.path.exists(path)]
+        if mtimes and max(mtimes) < cutoff:
+            with _digests_lock:
+                _digests.pop(upload_id, None)
+            for path in paths:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass